@@ -0,0 +1,257 @@
+"""Batch Aggregation of Marker Sessions
+
+Command-line tool that pools the marker tables of many sessions (as saved by
+MarkerManager.save_marker_table) into one summary: per-value counts, duration distributions and error
+rates. Sessions are processed on a process pool, and every session result is merged into the aggregate
+as soon as it arrives, so memory use does not grow with the number of sessions.
+
+Usage:
+    python -m python_markers.batch_aggregate <files or directories> [options]
+
+    e.g.: python -m python_markers.batch_aggregate data/ --recursive --summary pooled.tsv --index sessions.tsv
+
+Outputs:
+    summary: one row per marker value with the number of sessions, the number of markers and duration
+        statistics (mean, std, min, max and percentiles)
+    index: one row per session with the device, the number of markers and errors, and the error rate
+
+Duration percentiles are estimated from log-spaced histograms (DURATION_BINS_PER_DECADE bins per decade),
+so their relative error is at most the bin width (about 6%).
+
+"""
+
+import argparse
+import concurrent.futures
+import glob
+import math
+import os
+import sys
+
+import numpy
+import pandas
+
+import python_markers.marker_io as marker_io
+
+# Log-spaced duration histogram (in ms) used for the pooled percentiles
+DURATION_BINS_PER_DECADE = 40
+DURATION_MIN_MS = 1e-2
+DURATION_MAX_MS = 1e8
+DURATION_BIN_EDGES = numpy.logspace(math.log10(DURATION_MIN_MS), math.log10(DURATION_MAX_MS),
+                                    int(math.log10(DURATION_MAX_MS / DURATION_MIN_MS)) * DURATION_BINS_PER_DECADE + 1)
+
+# Percentiles in the summary
+SUMMARY_PERCENTILES = (5, 25, 50, 75, 95)
+
+# File name suffix of Parquet sessions (see marker_io.parquet_file_names)
+PARQUET_MARKERS_SUFFIX = '_markers.parquet'
+
+
+def find_sessions(paths, pattern='*.tsv', recursive=False):
+    """Returns the sorted session files in paths (files are used as is, directories are searched with pattern).
+
+    Paths that do not exist are skipped.
+    """
+    session_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            search = os.path.join(path, '**', pattern) if recursive else os.path.join(path, pattern)
+            session_files.extend(glob.glob(search, recursive=recursive))
+        elif os.path.isfile(path):
+            session_files.append(path)
+    return sorted(set(session_files))
+
+
+def _read_session(file_name):
+    """Reads the marker and error tables and the header of a session (TSV or Parquet)."""
+    if file_name.endswith(PARQUET_MARKERS_SUFFIX):
+        # Only read the columns that are aggregated
+        marker_df, _, error_df, header = marker_io.read_marker_parquet(
+            file_name[:-len(PARQUET_MARKERS_SUFFIX)], tables=('markers', 'errors'),
+            columns={'markers': ['value', 'duration_ms', 'start_time_s'], 'errors': []})
+    else:
+        marker_df, _, error_df, header = marker_io.read_marker_tsv(file_name)
+    return marker_df, error_df, header
+
+
+def process_session(file_name):
+    """Computes the partial aggregate of one session (runs in a worker process).
+
+    Returns: dict with the session information for the index and, per marker value, the count, the mean and
+        sum of squared deviations of the durations, min, max and the duration histogram.
+    """
+
+    result = {'file': file_name, 'status': 'ok', 'values': {}}
+
+    try:
+        marker_df, error_df, header = _read_session(file_name)
+    except Exception as e:
+        result['status'] = f'failed: {e}'
+        return result
+
+    result['date'] = header.get('Date', '')
+    result['device'] = header.get('Device', '')
+    result['serialno'] = header.get('Device serialno', '')
+    result['n_markers'] = len(marker_df)
+    result['n_errors'] = len(error_df)
+
+    if len(marker_df) == 0:
+        return result
+
+    values = marker_df['value'].to_numpy(dtype=numpy.int64)
+    durations = marker_df['duration_ms'].to_numpy(dtype=numpy.float64)
+    start_times = marker_df['start_time_s'].to_numpy(dtype=numpy.float64)
+    result['first_marker_s'] = float(start_times.min())
+    result['last_marker_s'] = float(start_times.max())
+
+    for value in numpy.unique(values):
+        value_durations = durations[values == value]
+        # Markers that have not ended (infinite duration) are counted, but not used for the durations
+        ended = value_durations[numpy.isfinite(value_durations)]
+        result['values'][int(value)] = {
+            'count': len(value_durations),
+            'n_durations': len(ended),
+            'mean': float(ended.mean()) if len(ended) else 0.0,
+            'm2': float(((ended - ended.mean()) ** 2).sum()) if len(ended) else 0.0,
+            'min': float(ended.min()) if len(ended) else math.inf,
+            'max': float(ended.max()) if len(ended) else -math.inf,
+            'histogram': numpy.histogram(numpy.clip(ended, DURATION_MIN_MS, DURATION_MAX_MS),
+                                         DURATION_BIN_EDGES)[0]}
+
+    return result
+
+
+def histogram_percentile(histogram, percentile):
+    """Estimates a percentile from a duration histogram (geometric interpolation within the bin)."""
+    total = histogram.sum()
+    if total == 0:
+        return math.nan
+    cumulative = numpy.cumsum(histogram)
+    rank = percentile / 100 * total
+    bin_index = int(numpy.searchsorted(cumulative, rank, side='left'))
+    bin_index = min(bin_index, len(histogram) - 1)
+    previous = cumulative[bin_index - 1] if bin_index > 0 else 0
+    fraction = (rank - previous) / histogram[bin_index] if histogram[bin_index] else 0
+    low, high = DURATION_BIN_EDGES[bin_index], DURATION_BIN_EDGES[bin_index + 1]
+    return float(low * (high / low) ** fraction)
+
+
+class SessionAggregate:
+    """Streaming reduction of session results (see process_session).
+
+    Attributes:
+        value_stats:
+            dict with marker value as key and the pooled statistics as value
+        session_list:
+            list of the session information (one dict per session) for the index
+    """
+
+    def __init__(self):
+        self.value_stats = {}
+        self.session_list = []
+
+    def add(self, result):
+        """Merges the result of one session."""
+
+        self.session_list.append({key: value for key, value in result.items() if key != 'values'})
+
+        for value, stats in result['values'].items():
+            pooled = self.value_stats.get(value)
+            if pooled is None:
+                self.value_stats[value] = dict(stats, n_sessions=1, histogram=stats['histogram'].copy())
+                continue
+            pooled['n_sessions'] += 1
+            pooled['count'] += stats['count']
+
+            # Merge mean and sum of squared deviations (Chan et al.)
+            n_a, n_b = pooled['n_durations'], stats['n_durations']
+            if n_b:
+                n = n_a + n_b
+                delta = stats['mean'] - pooled['mean']
+                pooled['mean'] += delta * n_b / n
+                pooled['m2'] += stats['m2'] + delta ** 2 * n_a * n_b / n
+                pooled['n_durations'] = n
+            pooled['min'] = min(pooled['min'], stats['min'])
+            pooled['max'] = max(pooled['max'], stats['max'])
+            pooled['histogram'] += stats['histogram']
+
+    def summary_df(self):
+        """Returns the pooled per-value summary as a dataframe."""
+        rows = []
+        for value in sorted(self.value_stats):
+            stats = self.value_stats[value]
+            n = stats['n_durations']
+            row = {'value': value,
+                   'n_sessions': stats['n_sessions'],
+                   'count': stats['count'],
+                   'mean_duration_ms': stats['mean'] if n else math.nan,
+                   'std_duration_ms': math.sqrt(stats['m2'] / (n - 1)) if n > 1 else math.nan,
+                   'min_duration_ms': stats['min'] if n else math.nan,
+                   'max_duration_ms': stats['max'] if n else math.nan}
+            for percentile in SUMMARY_PERCENTILES:
+                row[f'p{percentile}_duration_ms'] = histogram_percentile(stats['histogram'], percentile)
+            rows.append(row)
+        return pandas.DataFrame(rows)
+
+    def index_df(self):
+        """Returns the per-session index as a dataframe."""
+        index_df = pandas.DataFrame(self.session_list)
+        if 'n_markers' in index_df.columns:
+            index_df['error_rate'] = index_df['n_errors'] / index_df['n_markers'].where(index_df['n_markers'] > 0)
+        return index_df
+
+
+def aggregate_sessions(session_files, workers=None, chunksize=4):
+    """Processes the sessions on a process pool and returns the SessionAggregate.
+
+    Args:
+        session_files: list of session files (TSV files or <name>_markers.parquet files)
+        workers: number of worker processes (None: number of cores, 1: no pool, process in this process)
+        chunksize: number of sessions sent to a worker at once
+    """
+
+    aggregate = SessionAggregate()
+
+    if workers == 1:
+        for session_file in session_files:
+            aggregate.add(process_session(session_file))
+        return aggregate
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(process_session, session_files, chunksize=chunksize):
+            aggregate.add(result)
+
+    return aggregate
+
+
+def main(argv=None):
+    """Command-line entry point (see module docstring)."""
+
+    parser = argparse.ArgumentParser(description="Pools the marker tables of many sessions into one summary.")
+    parser.add_argument('paths', nargs='+', help="session files and/or directories with session files")
+    parser.add_argument('--pattern', default='*.tsv',
+                        help="file pattern in directories (default: *.tsv, use *_markers.parquet for Parquet)")
+    parser.add_argument('--recursive', action='store_true', help="also search subdirectories")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes (default: all cores)")
+    parser.add_argument('--chunksize', type=int, default=4, help="sessions sent to a worker at once")
+    parser.add_argument('--summary', default='marker_summary.tsv', help="output file of the pooled summary")
+    parser.add_argument('--index', default='marker_sessions.tsv', help="output file of the per-session index")
+    args = parser.parse_args(argv)
+
+    session_files = find_sessions(args.paths, args.pattern, args.recursive)
+    if not session_files:
+        print("No session files found.", file=sys.stderr)
+        return 1
+
+    aggregate = aggregate_sessions(session_files, args.workers, args.chunksize)
+    aggregate.summary_df().to_csv(args.summary, sep='\t', index=False)
+    index_df = aggregate.index_df()
+    index_df.to_csv(args.index, sep='\t', index=False)
+
+    n_failed = int((index_df['status'] != 'ok').sum())
+    print(f"Aggregated {len(session_files) - n_failed} sessions ({n_failed} failed): "
+          f"summary saved in {args.summary}, index saved in {args.index}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""Independent Bit Channels
+
+This module contains a scheduler that uses the 8 output lines of a marker device as separate TTL
+channels (e.g. camera sync, stimulus onset, response). Each channel can be switched, toggled or pulsed
+on its own schedule. Bit changes that are due at the same time are merged into a single byte write,
+and every bit change is logged as an edge. Writes are kept at least the concurrent marker threshold of
+the MarkerManager apart: changes that become due earlier are written as soon as the threshold allows.
+
+Example:
+    scheduler = ChannelScheduler(marker_manager)
+    scheduler.add_channel('camera', 7)
+    scheduler.add_channel('stimulus', 6)
+    scheduler.pulse('camera', 20)
+    scheduler.pulse('stimulus', 100, delay_ms=20)
+    scheduler.run()
+
+"""
+
+import heapq
+import itertools
+
+import python_markers.marker_management as marker_management
+from python_markers.marker_management import MarkerError
+
+
+class ChannelScheduler:
+    """Schedules independent bit changes on a MarkerManager.
+
+    Bits are numbered as in MarkerManager.set_bit (0 is the MSB).
+
+    Attributes:
+        marker_manager:
+            the MarkerManager that is used to write the merged values
+        merge_window_ms:
+            bit changes that are due within this window after the first due change are written together
+            (an on and an off change of the same channel are never written together)
+        channels:
+            dict with channel name as key and bit as value
+        edge_list:
+            list of all bit changes, which includes the channel, bit, state, scheduled time and write time
+        realtime_report:
+            report of the real-time profile used by the last run (None if no profile was used)
+    """
+
+    def __init__(self, marker_manager, merge_window_ms=0):
+        """Initializes ChannelScheduler
+
+        Args:
+            marker_manager: see Attributes
+            merge_window_ms: see Attributes
+        """
+
+        self.marker_manager = marker_manager
+        self.merge_window_ms = merge_window_ms
+        self.channels = {}
+        self.edge_list = []
+        self.realtime_report = None
+
+        # Heap with scheduled changes: (time_ms, sequence number, channel name, state), state None toggles
+        self._events = []
+        self._counter = itertools.count()
+
+    def add_channel(self, name, bit):
+        """Adds a named channel on a bit (0 - 7, 0 is MSB)."""
+
+        # Check bit type and range
+        marker_management.bit_mask(bit)
+
+        if name in self.channels:
+            err_msg = f"channel {name} already exists"
+            Eid = "ChannelExists"
+            raise MarkerError(err_msg, True, Eid)
+
+        if bit in self.channels.values():
+            err_msg = f"bit {bit} is already used by another channel"
+            Eid = "ChannelBitInUse"
+            raise MarkerError(err_msg, True, Eid)
+
+        self.channels[name] = int(bit)
+
+    def set_state(self, name, state, delay_ms=0):
+        """Schedules a channel to go 'on' or 'off' after delay_ms."""
+        if state not in ('on', 'off'):
+            err_msg = "channel state can only be 'on' or 'off'"
+            Eid = "BitState"
+            raise MarkerError(err_msg, True, Eid)
+        self._schedule(name, state == 'on', delay_ms)
+
+    def toggle(self, name, delay_ms=0):
+        """Schedules a channel to flip its state after delay_ms."""
+        self._schedule(name, None, delay_ms)
+
+    def pulse(self, name, duration_ms, delay_ms=0):
+        """Schedules a pulse of duration_ms on a channel, starting after delay_ms."""
+        if duration_ms <= 0:
+            err_msg = "pulse duration_ms should be larger than 0"
+            Eid = "PulseDuration"
+            raise MarkerError(err_msg, True, Eid)
+        self._schedule(name, True, delay_ms)
+        self._schedule(name, False, delay_ms + duration_ms)
+
+    def _schedule(self, name, state, delay_ms):
+        """Adds a bit change to the schedule."""
+
+        if name not in self.channels:
+            err_msg = f"unknown channel {name}, add it with add_channel first"
+            Eid = "UnknownChannel"
+            raise MarkerError(err_msg, True, Eid)
+
+        if delay_ms < 0:
+            err_msg = "delay_ms should not be negative"
+            Eid = "NegativeDelay"
+            raise MarkerError(err_msg, True, Eid)
+
+        due_time = self.marker_manager._time_function_ms() + delay_ms
+        heapq.heappush(self._events, (due_time, next(self._counter), name, state))
+
+    @property
+    def pending(self):
+        """Returns the number of scheduled bit changes that were not written yet."""
+        return len(self._events)
+
+    def next_due_ms(self):
+        """Returns the time of the first scheduled bit change (None if nothing is scheduled)."""
+        return self._events[0][0] if self._events else None
+
+    def poll(self):
+        """Writes all bit changes that are due (non-blocking).
+
+        All changes due within merge_window_ms after the first due change are merged into one value,
+        which is written with a single MarkerManager.set_value call. A second change of a channel (e.g. the
+        end of a pulse when the poll is late) is left for a next write, so the pulse is still sent. Nothing
+        is written within marker_manager.concurrent_marker_threshold_ms after the last marker.
+
+        Returns:
+            number of byte writes (0 or 1)
+        """
+
+        if not self._events:
+            return 0
+
+        now = self.marker_manager._time_function_ms()
+        if self._events[0][0] > now:
+            return 0
+
+        # Changes that are due wait until the concurrent marker threshold allows a write
+        last_time = self.marker_manager._last_logged_time_ms
+        if last_time is not None and now - last_time < self.marker_manager.concurrent_marker_threshold_ms:
+            return 0
+
+        # Collect due changes, later changes of the same channel overrule earlier ones
+        merge_until = max(now, self._events[0][0] + self.merge_window_ms)
+        old_value = self.marker_manager._current_value
+        value = old_value
+        scheduled = {}
+        while self._events and self._events[0][0] <= merge_until and self._events[0][2] not in scheduled:
+            due_time, _, name, state = heapq.heappop(self._events)
+            mask = 1 << (7 - self.channels[name])
+            if state is None:
+                state = not value & mask
+            value = value | mask if state else value & ~mask
+            scheduled[name] = due_time
+
+        if value == old_value:
+            return 0
+
+        self.marker_manager.set_value(value)
+        write_time = self.marker_manager._last_logged_time_ms
+
+        # Log the edges of the channels that changed
+        for name, due_time in scheduled.items():
+            bit = self.channels[name]
+            mask = 1 << (7 - bit)
+            if (value ^ old_value) & mask:
+                self.edge_list.append({'channel': name, 'bit': bit,
+                                       'state': 'on' if value & mask else 'off',
+                                       'scheduled_time_ms': due_time, 'time_ms': write_time})
+        return 1
+
+    def run(self, realtime_profile=None):
+        """Writes all scheduled bit changes at their due times (blocking until nothing is scheduled).
+
+        Args:
+            realtime_profile: optional realtime.RealtimeProfile that is applied to the calling thread while
+                running (its report is saved in self.realtime_report)
+
+        Returns:
+            number of byte writes
+        """
+        if realtime_profile is not None:
+            with realtime_profile as report:
+                self.realtime_report = report
+                return self.run()
+
+        writes = 0
+        while self._events:
+            writes += self.poll()
+        return writes
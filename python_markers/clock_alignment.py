@@ -0,0 +1,164 @@
+"""Alignment of the Marker Clock with Wall-Clock Time
+
+Marker times come from a monotonic clock (GS_timing.millis) with an arbitrary epoch. This module
+samples pairs of monotonic and wall-clock (system) time during a session and fits the offset and drift
+between the two clocks, so that marker times can be converted to wall-clock or UTC time.
+
+Each sample brackets the wall-clock read between two monotonic reads, and the pair with the smallest
+bracket is kept, which makes the sampling error smaller than the monotonic read overhead.
+
+"""
+
+import datetime
+import time
+
+import numpy
+import pandas
+
+
+class ClockAlignment:
+    """Maps monotonic marker times (ms) to wall-clock times.
+
+    Attributes:
+        sample_list:
+            list of clock samples, which includes the monotonic time (ms), the wall-clock time (ns since the
+            Unix epoch) and the uncertainty of the sample (ms)
+        n_reads:
+            number of bracketed reads per sample, the read with the smallest bracket is kept
+        _time_function_ms:
+            the monotonic time function (the time function of the MarkerManager)
+        _wall_time_function_ns:
+            function that returns the wall-clock time in ns since the Unix epoch
+    """
+
+    def __init__(self, time_function_ms, wall_time_function_ns=time.time_ns, n_reads=5):
+        """Initializes ClockAlignment
+
+        Args:
+            time_function_ms: see Attributes
+            wall_time_function_ns: see Attributes
+            n_reads: see Attributes
+        """
+
+        self._time_function_ms = time_function_ms
+        self._wall_time_function_ns = wall_time_function_ns
+        self.n_reads = n_reads
+        self.sample_list = []
+        self._fit = None
+
+    def sample(self):
+        """Takes a clock sample and returns it."""
+
+        best = None
+        for _ in range(self.n_reads):
+            before_ms = self._time_function_ms()
+            wall_ns = self._wall_time_function_ns()
+            after_ms = self._time_function_ms()
+            if best is None or after_ms - before_ms < best['uncertainty_ms']:
+                best = {'time_ms': (before_ms + after_ms) / 2,
+                        'wall_time_ns': wall_ns,
+                        'uncertainty_ms': after_ms - before_ms}
+
+        self.sample_list.append(best)
+        self._fit = None
+        return best
+
+    def snapshot(self):
+        """Returns a copy with the current samples, which is not affected by later samples (e.g. to convert
+        times on another thread)."""
+        clock_alignment = ClockAlignment(self._time_function_ms, self._wall_time_function_ns, self.n_reads)
+        clock_alignment.sample_list = list(self.sample_list)
+        clock_alignment._fit = self._fit
+        return clock_alignment
+
+    @property
+    def last_sample_ms(self):
+        """Returns the monotonic time of the last sample (None if there are no samples)."""
+        return self.sample_list[-1]['time_ms'] if self.sample_list else None
+
+    def fit(self):
+        """Fits the offset and drift between the clocks (least squares).
+
+        Returns: dict with
+            ref_time_ms, ref_wall_time_ns: reference point of the fit (the first sample)
+            offset_ms: wall-clock time at ref_time_ms, relative to ref_wall_time_ns
+            slope: wall-clock ms per monotonic ms
+            drift_ppm: drift of the monotonic clock relative to the wall clock in parts per million
+            n_samples: number of samples used
+            rms_residual_ms, max_residual_ms: fit quality (NaN with fewer than three samples)
+        """
+
+        if self._fit is not None:
+            return self._fit
+
+        if not self.sample_list:
+            self.sample()
+
+        ref_time_ms = self.sample_list[0]['time_ms']
+        ref_wall_time_ns = self.sample_list[0]['wall_time_ns']
+
+        # Center on the first sample to keep the fit numerically exact
+        x = numpy.array([s['time_ms'] for s in self.sample_list], dtype=numpy.float64) - ref_time_ms
+        y = numpy.array([s['wall_time_ns'] - ref_wall_time_ns for s in self.sample_list],
+                        dtype=numpy.float64) / 1e6
+
+        if len(x) < 2 or numpy.ptp(x) == 0:
+            slope = 1.0
+            offset_ms = float(numpy.mean(y - x))
+        else:
+            slope, offset_ms = (float(c) for c in numpy.polyfit(x, y, 1))
+
+        if len(x) < 3:
+            rms_residual_ms = float('nan')
+            max_residual_ms = float('nan')
+        else:
+            residuals = y - (offset_ms + slope * x)
+            rms_residual_ms = float(numpy.sqrt(numpy.mean(residuals ** 2)))
+            max_residual_ms = float(numpy.max(numpy.abs(residuals)))
+
+        self._fit = {'ref_time_ms': ref_time_ms,
+                     'ref_wall_time_ns': ref_wall_time_ns,
+                     'offset_ms': offset_ms,
+                     'slope': slope,
+                     'drift_ppm': (slope - 1) * 1e6,
+                     'n_samples': len(x),
+                     'rms_residual_ms': rms_residual_ms,
+                     'max_residual_ms': max_residual_ms}
+        return self._fit
+
+    def to_wall_time_ns(self, time_ms):
+        """Converts monotonic times (ms) to wall-clock times (int64 ns since the Unix epoch).
+
+        Non-finite times (e.g. the infinite end time of a marker that has not ended yet) become the
+        int64 minimum, which pandas reads as NaT.
+        """
+
+        fit = self.fit()
+        time_ms = numpy.asarray(time_ms, dtype=numpy.float64)
+        finite = numpy.isfinite(time_ms)
+
+        wall_offset_ns = numpy.zeros(time_ms.shape, dtype=numpy.float64)
+        wall_offset_ns[finite] = (fit['offset_ms'] + fit['slope'] * (time_ms[finite] - fit['ref_time_ms'])) * 1e6
+
+        wall_ns = numpy.full(time_ms.shape, numpy.iinfo(numpy.int64).min, dtype=numpy.int64)
+        wall_ns[finite] = fit['ref_wall_time_ns'] + numpy.round(wall_offset_ns[finite]).astype(numpy.int64)
+        return wall_ns
+
+    def to_datetime(self, time_ms, utc=True):
+        """Converts monotonic times (ms) to timezone-aware pandas timestamps (UTC or local time)."""
+        wall_ns = numpy.atleast_1d(self.to_wall_time_ns(time_ms))
+        timestamps = pandas.to_datetime(wall_ns, unit='ns', utc=True)
+        if not utc:
+            timestamps = timestamps.tz_convert(datetime.datetime.now().astimezone().tzinfo)
+        return timestamps
+
+    def header_info(self):
+        """Returns the fit as a dict for the marker table header."""
+        fit = self.fit()
+        ref_utc = self.to_datetime(fit['ref_time_ms'])[0]
+        return {'Clock reference (monotonic ms)': f"{fit['ref_time_ms']:.6f}",
+                'Clock reference (UTC)': ref_utc.isoformat(),
+                'Clock drift (ppm)': f"{fit['drift_ppm']:.3f}",
+                'Clock fit samples': str(fit['n_samples']),
+                'Clock fit rms residual (ms)': f"{fit['rms_residual_ms']:.6f}",
+                'Clock fit max residual (ms)': f"{fit['max_residual_ms']:.6f}"}
@@ -0,0 +1,164 @@
+"""Epoching of Physiological Signals with Marker Tables
+
+Cuts a signal (e.g. EEG, ECG or pupil size, recorded with the markers) into epochs: windows of the same
+length around the markers of selected values. The epochs are taken from a sliding window view of the
+signal (numpy.lib.stride_tricks.sliding_window_view), which does not copy the signal, and selected with one
+indexing operation, so there are no Python loops over the markers; only the selected epochs are copied.
+
+The marker times (marker clock, see the marker table) are converted to samples with the sample rate and the
+marker time of the first sample (signal_start_s), e.g. the time of the first marker as seen in the
+recording minus its time in the marker table.
+
+Epochs that run past the start or the end of the signal are rejected (and reported), and the epochs can be
+baseline corrected (the mean of the baseline interval is subtracted from every epoch and channel).
+
+Example:
+    marker_df, summary_df, error_df = marker_manager.gen_marker_table()
+    epochs = epoch_signal(eeg, 512, marker_df, values=[1, 2], tmin_s=-0.2, tmax_s=0.8, signal_start_s=3.25,
+                          baseline=(None, 0))
+    erp = epochs.data[epochs.events['value'] == 1].mean(axis=0)
+
+"""
+
+import numpy
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class EpochError(Exception):
+    """Exception raised for errors in the epoching arguments.
+
+    Attributes:
+        message:
+            explanation of the error
+        id:
+            error ID
+    """
+
+    def __init__(self, message, Eid):
+        self.message = message
+        self.id = Eid
+        super().__init__(self.message)
+
+
+class Epochs:
+    """Epochs of a signal.
+
+    Attributes:
+        data:
+            numpy array with the epochs, shape (n_epochs, n_samples) for a one-channel signal and
+            (n_epochs, n_channels, n_samples) for a signal with channels
+        times_s:
+            numpy array with the time (s) of every sample of an epoch, relative to the marker
+        events:
+            the markers (rows of the marker table) of the epochs, in the order of data
+        onset_samples:
+            numpy array with the sample index of the marker of every epoch
+        rejected:
+            the markers (rows of the marker table) of which the epoch ran past the edge of the signal
+        sample_rate_hz:
+            sample rate of the signal
+    """
+
+    def __init__(self, data, times_s, events, onset_samples, rejected, sample_rate_hz):
+        self.data = data
+        self.times_s = times_s
+        self.events = events
+        self.onset_samples = onset_samples
+        self.rejected = rejected
+        self.sample_rate_hz = sample_rate_hz
+
+    def __len__(self):
+        return len(self.data)
+
+
+def marker_samples(marker_df, sample_rate_hz, signal_start_s=0.0):
+    """Returns the sample indices (numpy array) of the marker starts.
+
+    Args:
+        marker_df: the marker table
+        sample_rate_hz: sample rate of the signal
+        signal_start_s: time of the first sample of the signal, in marker table time (s)
+    """
+    start_times = marker_df['start_time_s'].to_numpy(dtype=numpy.float64)
+    return numpy.rint((start_times - signal_start_s) * sample_rate_hz).astype(numpy.int64)
+
+
+def epoch_signal(signal, sample_rate_hz, marker_df, values=None, tmin_s=-0.2, tmax_s=0.8, signal_start_s=0.0,
+                 baseline=None):
+    """Cuts a signal into epochs around markers.
+
+    Args:
+        signal: numpy array with the signal, shape (n_samples,) or (n_samples, n_channels)
+        sample_rate_hz: sample rate of the signal
+        marker_df: the marker table (see MarkerManager.gen_marker_table, marker_io.read_marker_tsv or
+            marker_io.read_marker_parquet)
+        values: marker values to cut epochs around (None: all markers)
+        tmin_s: start of the epochs relative to the marker (s), negative for samples before the marker
+        tmax_s: end of the epochs relative to the marker (s), included
+        signal_start_s: see marker_samples
+        baseline: (start, end) of the baseline interval relative to the marker (s), None for the start or end
+            of the epoch, or None for no baseline correction
+
+    Returns: Epochs
+
+    Raises:
+        EpochError:
+            - SignalShape: signal is not a one or two dimensional array
+            - SampleRate: sample_rate_hz is not positive
+            - EpochWindow: tmax_s is before tmin_s
+            - BaselineWindow: the baseline interval is not inside the epoch
+    """
+
+    signal = numpy.asarray(signal)
+    if signal.ndim not in (1, 2):
+        err_msg = f"signal should have shape (n_samples,) or (n_samples, n_channels), got {signal.shape}"
+        Eid = "SignalShape"
+        raise EpochError(err_msg, Eid)
+
+    if not sample_rate_hz > 0:
+        err_msg = f"sample_rate_hz should be positive, got {sample_rate_hz}"
+        Eid = "SampleRate"
+        raise EpochError(err_msg, Eid)
+
+    first_offset = int(numpy.rint(tmin_s * sample_rate_hz))
+    last_offset = int(numpy.rint(tmax_s * sample_rate_hz))
+    if last_offset < first_offset:
+        err_msg = f"tmax_s ({tmax_s}) should not be before tmin_s ({tmin_s})"
+        Eid = "EpochWindow"
+        raise EpochError(err_msg, Eid)
+    window = last_offset - first_offset + 1
+    times_s = numpy.arange(first_offset, last_offset + 1) / sample_rate_hz
+
+    # Baseline interval, as sample positions in the epoch:
+    if baseline is not None:
+        baseline_start = 0 if baseline[0] is None else int(numpy.rint(baseline[0] * sample_rate_hz)) - first_offset
+        baseline_end = window if baseline[1] is None else \
+            int(numpy.rint(baseline[1] * sample_rate_hz)) - first_offset + 1
+        if not 0 <= baseline_start < baseline_end <= window:
+            err_msg = f"baseline {baseline} should be inside the epoch ({tmin_s}, {tmax_s})"
+            Eid = "BaselineWindow"
+            raise EpochError(err_msg, Eid)
+
+    # Select the markers:
+    if values is not None:
+        marker_df = marker_df[marker_df['value'].isin(list(values))]
+    onsets = marker_samples(marker_df, sample_rate_hz, signal_start_s)
+
+    # Reject the epochs that run past the edges:
+    first_samples = onsets + first_offset
+    inside = (first_samples >= 0) & (first_samples + window <= signal.shape[0])
+    events = marker_df[inside].reset_index(drop=True)
+    rejected = marker_df[~inside].reset_index(drop=True)
+
+    # Windows view of shape (n_windows, [n_channels,] window), without copying the signal:
+    if signal.shape[0] >= window:
+        windows = sliding_window_view(signal, window, axis=0)
+        data = windows[first_samples[inside]]
+    else:
+        data = numpy.empty((0,) + signal.shape[1:] + (window,), dtype=signal.dtype)
+
+    if baseline is not None:
+        data = data.astype(numpy.result_type(data.dtype, numpy.float64), copy=False)
+        data -= data[..., baseline_start:baseline_end].mean(axis=-1, keepdims=True)
+
+    return Epochs(data, times_s, events, onsets[inside], rejected, sample_rate_hz)
@@ -0,0 +1,262 @@
+"""Hot-Plug Watcher with Automatic Device Reconnection
+
+When the USB connection of a marker device glitches, the serial port disappears and every marker fails
+with CouldNotSendMarker until the script is restarted. DeviceWatcher keeps a MarkerManager running
+through such an outage:
+    - the device interface of the MarkerManager is wrapped in a WatchedDevice, which detects a failed
+      write (and a background thread detects the removal of the port through port enumeration)
+    - during an outage, markers are buffered (with their original timestamps) instead of failing, and
+      the outage is logged as an error of the MarkerManager (error list, live feed and error tracepoint)
+    - the background thread looks for the device by its serial number (it may come back on a different
+      port), reopens it and swaps it in atomically (when the reopened device fails, the outage continues
+      and the next check tries again)
+    - on reconnection the buffer is flushed: the device is set to the current marker value, and the
+      buffered markers are stored in the outage record with their original and flush times
+
+The buffered markers are not written to the device one by one on reconnection, as that would put
+pulses in the recording at the wrong times; their original times are in the marker log.
+
+Example:
+    marker_manager = MarkerManager('UsbParMarker', 'COM3')
+    with DeviceWatcher(marker_manager):
+        ...
+
+"""
+
+import collections
+import threading
+
+import python_markers.marker_management as marker_management
+from python_markers.marker_management import DeviceInterface
+
+# Device interface classes, by device type
+DEVICE_CLASSES = {'UsbParMarker': marker_management.UsbParMarker, 'Eva': marker_management.Eva}
+
+
+def list_serial_ports():
+    """Returns the names of the available serial ports."""
+    return [port for port, desc, hwid in marker_management.comports()]
+
+
+def open_device_by_serial_no(device_type, serial_no):
+    """Finds a device by type and serial number (on any port) and returns a new device interface for it."""
+    info = marker_management.find_device(device_type=device_type, serial_no=serial_no)
+    return DEVICE_CLASSES[device_type](info['com_port'])
+
+
+class WatchedDevice(DeviceInterface):
+    """Device interface that forwards to the current device of a DeviceWatcher and buffers markers during outages.
+
+    Other attributes (e.g. send_command) are forwarded to the current device.
+    """
+
+    def __init__(self, device, watcher):
+        self._device = device
+        self._watcher = watcher
+
+    @property
+    def device_address(self):
+        """Returns the address of the current device."""
+        return self._device.device_address
+
+    @property
+    def device_properties(self):
+        """Returns the properties of the current device."""
+        return self._device.device_properties
+
+    def _set_value(self, value):
+        """Sets the value of the current device, or buffers it during an outage."""
+        outage_started = False
+        try:
+            with self._watcher.lock:
+                if not self._watcher.in_outage:
+                    try:
+                        self._device._set_value(value)
+                        return
+                    except Exception as e:
+                        outage_started = self._watcher._start_outage(f'write failed: {e}')
+                self._watcher._buffer_marker(value)
+        finally:
+            if outage_started:
+                self._watcher._log_outage_start()
+
+    def _close(self):
+        with self._watcher.lock:
+            self._device._close()
+
+    def __getattr__(self, name):
+        return getattr(self._device, name)
+
+
+class DeviceWatcher:
+    """Watches the device of a MarkerManager and reconnects it after an outage.
+
+    Attributes:
+        marker_manager:
+            the watched MarkerManager
+        poll_interval_s:
+            interval between two checks of the background thread
+        max_buffer:
+            maximum number of markers buffered during an outage, when the buffer is full set_value fails
+            with CouldNotSendMarker again
+        outage_list:
+            list of outages, with the start and end time (ms), the reason, the port before and after, and the
+            buffered markers (value, original time and flush time)
+        in_outage:
+            bool indicating whether the device is currently disconnected
+        lock:
+            lock that makes writes to the device and swapping the device atomic
+    """
+
+    def __init__(self, marker_manager, poll_interval_s=0.5, max_buffer=10000, list_ports=list_serial_ports,
+                 open_device=open_device_by_serial_no):
+        """Initializes DeviceWatcher
+
+        Args:
+            marker_manager: see Attributes
+            poll_interval_s: see Attributes
+            max_buffer: see Attributes
+            list_ports: function that returns the names of the available ports
+            open_device: function (device_type, serial_no) that returns a new device interface for the device
+        """
+
+        self.marker_manager = marker_manager
+        self.poll_interval_s = poll_interval_s
+        self.max_buffer = max_buffer
+        self.outage_list = []
+        self.in_outage = False
+        self.lock = threading.RLock()
+
+        self._list_ports = list_ports
+        self._open_device = open_device
+        self._serial_no = marker_manager.device_properties.get('Serialno')
+        self._buffer = collections.deque()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._watched_device = None
+
+    def start(self):
+        """Wraps the device interface of the MarkerManager and starts the background thread."""
+
+        if self._watched_device is None:
+            self._watched_device = WatchedDevice(self.marker_manager.device_interface, self)
+            self.marker_manager.device_interface = self._watched_device
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='marker-device-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the background thread and restores the device interface of the MarkerManager."""
+
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+        if self._watched_device is not None:
+            self.marker_manager.device_interface = self._watched_device._device
+            self._watched_device = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.poll_interval_s):
+            self.poll()
+
+    def poll(self):
+        """Checks the device once: starts an outage when its port is gone, and tries to reconnect during an outage.
+
+        Returns: bool indicating whether the device is connected
+        """
+
+        if not self.in_outage:
+            port = self.marker_manager.device_address
+            if port == marker_management.FAKE_ADDRESS or port in self._list_ports():
+                return True
+            with self.lock:
+                outage_started = self._start_outage('port removed')
+            if outage_started:
+                self._log_outage_start()
+
+        try:
+            device = self._open_device(self.marker_manager.device_type, self._serial_no)
+        except Exception:
+            # Not back yet
+            return False
+
+        return self._swap_device(device)
+
+    def _now_ms(self):
+        return self.marker_manager._time_function_ms()
+
+    def _start_outage(self, reason):
+        """Starts an outage (called with the lock held), returns False if an outage was already started.
+
+        The outage is logged with _log_outage_start, after the lock is released.
+        """
+        if self.in_outage:
+            return False
+        self.in_outage = True
+        self.outage_list.append({'start_time_ms': self._now_ms(), 'end_time_ms': None, 'reason': reason,
+                                 'port': self.marker_manager.device_address, 'new_port': None, 'buffered': []})
+        return True
+
+    def _log_outage_start(self):
+        """Logs the start of the last outage as an error of the MarkerManager."""
+        outage = self.outage_list[-1]
+        self.marker_manager._log_error(outage['start_time_ms'], "DeviceOutage",
+                                       f"Device outage ({outage['reason']}), markers are buffered.")
+
+    def _buffer_marker(self, value):
+        """Buffers a marker during an outage (called with the lock held)."""
+        if len(self._buffer) >= self.max_buffer:
+            raise marker_management.SerialError("Device outage and marker buffer full.", "OutageBufferFull")
+        self._buffer.append((value, self._now_ms()))
+
+    def _swap_device(self, device):
+        """Sets a reopened device to the current value, swaps it in and flushes the buffer.
+
+        Returns: bool indicating whether the device was swapped in (if the reopened device fails, it is closed
+            and the outage continues)
+        """
+
+        with self.lock:
+            # Restore the current output value
+            try:
+                device._set_value(self.marker_manager._current_value)
+            except Exception:
+                try:
+                    device._close()
+                except Exception:
+                    pass
+                return False
+
+            old_device = self._watched_device._device if self._watched_device is not None else None
+            try:
+                if old_device is not None:
+                    old_device._close()
+            except Exception:
+                pass
+
+            if self._watched_device is not None:
+                self._watched_device._device = device
+
+            flush_time_ms = self._now_ms()
+            outage = self.outage_list[-1]
+            outage['end_time_ms'] = flush_time_ms
+            outage['new_port'] = device.device_address
+            outage['buffered'] = [{'value': value, 'time_ms': time_ms, 'flush_time_ms': flush_time_ms}
+                                  for value, time_ms in self._buffer]
+            self._buffer.clear()
+            self.in_outage = False
+
+        self.marker_manager._log_error(flush_time_ms, "DeviceReconnected",
+                                       f"Device reconnected on {device.device_address}, "
+                                       f"{len(outage['buffered'])} markers were buffered during the outage.")
+        return True
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,130 @@
+"""Interval Index for Marker Time-Window Queries
+
+Analyses often ask which marker was active at a time, or which markers of a value fall in a time window.
+Boolean filtering of the marker table (see MarkerManager.gen_marker_table) scans all markers for every
+query. MarkerIntervalIndex sorts the markers once and answers these queries with binary searches
+(numpy.searchsorted), in logarithmic time, and answers arrays of query times in one vectorized call.
+
+The markers of one device never overlap (a marker ends when the next starts), so the start and end times
+sorted by start time are both sorted, which is what the queries rely on.
+
+Example:
+    marker_df, summary_df, error_df = marker_manager.gen_marker_table()
+    index = MarkerIntervalIndex(marker_df)
+    index.active_at(12.5)                # row of the marker that was active at 12.5 s (or None)
+    index.in_window(10, 20, value=3)     # rows of the markers with value 3 that overlap [10, 20] s
+    index.nth_occurrence(3, 2)           # row of the second marker with value 3
+
+"""
+
+import numpy
+
+
+class MarkerIntervalIndex:
+    """Index of the markers of a marker table for point, window and nth-occurrence queries.
+
+    Query results are rows of the marker table (pandas Series), or marker tables (DataFrames) for queries
+    that can return several markers. The position-based methods (positions_at, window_positions) return
+    positions in marker_df instead, for use in vectorized code.
+
+    Attributes:
+        marker_df:
+            the indexed marker table, sorted by start time (with the value, start_time_s, end_time_s and
+            occurrence columns)
+        start_times:
+            numpy array of the start times (s) of the markers
+        end_times:
+            numpy array of the end times (s) of the markers (inf for a marker that has not ended)
+        values:
+            numpy array of the values of the markers
+    """
+
+    def __init__(self, marker_df):
+        """Initializes MarkerIntervalIndex
+
+        Args:
+            marker_df: the marker table (see MarkerManager.gen_marker_table, marker_io.read_marker_tsv or
+                marker_io.read_marker_parquet)
+        """
+
+        self.marker_df = marker_df.sort_values('start_time_s', kind='stable').reset_index(drop=True)
+        self.start_times = self.marker_df['start_time_s'].to_numpy(dtype=numpy.float64)
+        self.end_times = self.marker_df['end_time_s'].to_numpy(dtype=numpy.float64)
+        self.values = self.marker_df['value'].to_numpy(dtype=numpy.int64)
+
+        # Positions of the markers of each value, in order of occurrence:
+        self._value_positions = {}
+        for value in numpy.unique(self.values):
+            self._value_positions[int(value)] = numpy.flatnonzero(self.values == value)
+
+    def __len__(self):
+        return len(self.marker_df)
+
+    def positions_at(self, times_s):
+        """Returns the positions of the markers that were active at an array of times (-1: no marker active).
+
+        A marker is active from its start time up to (not including) its end time.
+        """
+
+        times_s = numpy.asarray(times_s, dtype=numpy.float64)
+        positions = numpy.searchsorted(self.start_times, times_s, side='right') - 1
+        valid = positions >= 0
+        active = numpy.zeros(times_s.shape, dtype=bool)
+        active[valid] = times_s[valid] < self.end_times[positions[valid]]
+        return numpy.where(active, positions, -1)
+
+    def values_at(self, times_s):
+        """Returns the values of the markers that were active at an array of times (0: no marker active)."""
+        positions = self.positions_at(times_s)
+        return numpy.where(positions >= 0, self.values[positions], 0)
+
+    def active_at(self, time_s):
+        """Returns the row of the marker that was active at time_s (None: no marker active)."""
+        position = int(self.positions_at(time_s))
+        return self.marker_df.iloc[position] if position >= 0 else None
+
+    def window_positions(self, start_s, end_s, value=None):
+        """Returns the positions of the markers that overlap the window [start_s, end_s].
+
+        Args:
+            start_s: start of the window (s)
+            end_s: end of the window (s)
+            value: only return markers with this value (None: all values)
+        """
+
+        if value is None:
+            candidates = None
+            start_times, end_times = self.start_times, self.end_times
+        else:
+            candidates = self._value_positions.get(value)
+            if candidates is None:
+                return numpy.empty(0, dtype=numpy.intp)
+            start_times, end_times = self.start_times[candidates], self.end_times[candidates]
+
+        # Markers that end after the window starts and start before it ends:
+        first = numpy.searchsorted(end_times, start_s, side='right')
+        last = numpy.searchsorted(start_times, end_s, side='right')
+        positions = numpy.arange(first, max(first, last))
+        return positions if candidates is None else candidates[positions]
+
+    def in_window(self, start_s, end_s, value=None):
+        """Returns the markers (a marker table) that overlap the window [start_s, end_s] (see window_positions)."""
+        return self.marker_df.iloc[self.window_positions(start_s, end_s, value)]
+
+    def count_in_window(self, start_s, end_s, value=None):
+        """Returns the number of markers that overlap the window [start_s, end_s] (see window_positions)."""
+        return len(self.window_positions(start_s, end_s, value))
+
+    def nth_occurrence(self, value, n):
+        """Returns the row of the nth marker (counting from 1) with value, or None when there is no such marker."""
+        positions = self._value_positions.get(value)
+        if positions is None or not 1 <= n <= len(positions):
+            return None
+        return self.marker_df.iloc[positions[n - 1]]
+
+    def occurrence_times(self, value):
+        """Returns the start times (s) of all markers with value, in order of occurrence."""
+        positions = self._value_positions.get(value)
+        if positions is None:
+            return numpy.empty(0, dtype=numpy.float64)
+        return self.start_times[positions]
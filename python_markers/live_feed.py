@@ -0,0 +1,294 @@
+"""Shared-Memory Live Marker Feed
+
+Drawing a live display in the experiment process would hurt marker timing. Instead, a MarkerManager can
+publish every logged marker and error into a ring buffer in shared memory (see
+MarkerManager.start_live_feed), and a separate monitor process (console or GUI) reads it at its own pace.
+
+The ring buffer has one writer at a time and any number of readers: every slot carries the sequence
+number of the record in it, which the writer clears before and sets after writing the slot. Markers and
+errors are published from several threads (e.g. the deferral thread or a hotplug.DeviceWatcher), so the
+writers in the publishing process are serialized with a lock, which is only held while a record is written.
+Readers use no locks: a reader only accepts a record when the sequence number is the expected one before
+and after reading it, and counts the records that were overwritten before it could read them as missed.
+Readers never write to the buffer, so a slow or missing reader adds nothing to the cost of publishing.
+
+Layout (little endian):
+    header: magic (8 bytes), capacity (uint64), number of published records (uint64), current value (uint64)
+    records: sequence number (uint64), time_ms (float64), kind (uint8), value (uint8), Eid (32 bytes) and
+        error message (80 bytes, truncated)
+
+Usage (console monitor):
+    python -m python_markers.live_feed <feed name> [--interval 0.2]
+
+"""
+
+import argparse
+import struct
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+MAGIC = b'PMFEED01'
+
+HEADER = struct.Struct('<8sQQQ')
+# Offsets of the header fields that change
+COUNT_OFFSET = 16
+CURRENT_VALUE_OFFSET = 24
+
+SEQUENCE = struct.Struct('<Q')
+RECORD_BODY = struct.Struct('<dBB6x32s80s')
+RECORD_SIZE = SEQUENCE.size + RECORD_BODY.size
+
+# Record kinds
+KIND_MARKER = 0
+KIND_ERROR = 1
+KIND_NAMES = {KIND_MARKER: 'marker', KIND_ERROR: 'error'}
+
+
+class LiveFeedError(Exception):
+    """Error in the live marker feed"""
+
+    def __init__(self, message, Eid):
+        super().__init__(message)
+        self.message = message
+        self.id = Eid
+
+
+class LiveFeed:
+    """Publishing side of the live marker feed (can be used from several threads).
+
+    Attributes:
+        name:
+            name of the shared memory block, which readers use to attach
+        capacity:
+            number of records in the ring buffer
+        write_count:
+            number of published records
+    """
+
+    def __init__(self, name=None, capacity=4096):
+        """Initializes LiveFeed and creates the shared memory block.
+
+        Args:
+            name: see Attributes (None: a unique name is generated)
+            capacity: see Attributes
+        """
+
+        if not isinstance(capacity, int) or capacity < 1:
+            err_msg = f"capacity should be a positive int, got {capacity}"
+            Eid = "FeedCapacity"
+            raise LiveFeedError(err_msg, Eid)
+
+        self._shared_memory = SharedMemory(name=name, create=True, size=HEADER.size + capacity * RECORD_SIZE)
+        self._buffer = self._shared_memory.buf
+        self.name = self._shared_memory.name
+        self.capacity = capacity
+        self.write_count = 0
+        # Serializes the writers (the slot and the sequence number of a record are claimed and written together):
+        self._write_lock = threading.Lock()
+
+        HEADER.pack_into(self._buffer, 0, MAGIC, capacity, 0, 0)
+
+    def _publish(self, time_ms, kind, value, Eid, message, current_value=None):
+        with self._write_lock:
+            seq = self.write_count + 1
+            offset = HEADER.size + ((seq - 1) % self.capacity) * RECORD_SIZE
+            buffer = self._buffer
+
+            # Invalidate the slot, write the record, then mark it with its sequence number:
+            SEQUENCE.pack_into(buffer, offset, 0)
+            RECORD_BODY.pack_into(buffer, offset + SEQUENCE.size, time_ms, kind, value, Eid, message)
+            SEQUENCE.pack_into(buffer, offset, seq)
+
+            SEQUENCE.pack_into(buffer, COUNT_OFFSET, seq)
+            self.write_count = seq
+            if current_value is not None:
+                SEQUENCE.pack_into(buffer, CURRENT_VALUE_OFFSET, current_value)
+
+    def publish_marker(self, value, time_ms):
+        """Publishes a logged marker and updates the current value."""
+        value = int(value)
+        self._publish(time_ms, KIND_MARKER, value, b'', b'', value)
+
+    def publish_error(self, time_ms, Eid, value=0, message=''):
+        """Publishes a marker error (invalid values are published as 0)."""
+        if not isinstance(value, int) or not 0 <= value <= 255:
+            value = 0
+        self._publish(time_ms, KIND_ERROR, value, Eid.encode()[:32], message.encode()[:80])
+
+    def update_current_value(self, value):
+        """Updates the current value in the header (without publishing a record)."""
+        SEQUENCE.pack_into(self._buffer, CURRENT_VALUE_OFFSET, int(value))
+
+    def close(self):
+        """Closes and removes the shared memory block (attached readers keep their mapping)."""
+        if self._shared_memory is None:
+            return
+        self._buffer = None
+        self._shared_memory.close()
+        self._shared_memory.unlink()
+        self._shared_memory = None
+
+
+def _attach_shared_memory(name):
+    """Attaches to an existing shared memory block without registering it with the resource tracker.
+
+    The reader does not own the block, so it should not be removed when the reader exits (before Python 3.13,
+    attaching registers the block, see https://github.com/python/cpython/issues/82300).
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class LiveFeedReader:
+    """Reading side of the live marker feed.
+
+    Attributes:
+        name:
+            name of the shared memory block
+        capacity:
+            number of records in the ring buffer
+        missed_count:
+            number of records that were overwritten before they could be read
+    """
+
+    def __init__(self, name, from_start=False):
+        """Attaches to a live feed.
+
+        Args:
+            name: see Attributes
+            from_start: when True, the records still in the buffer are read first, else only new records
+        """
+
+        try:
+            self._shared_memory = _attach_shared_memory(name)
+        except FileNotFoundError:
+            err_msg = f"live feed {name} does not exist"
+            Eid = "FeedNotFound"
+            raise LiveFeedError(err_msg, Eid)
+
+        self._buffer = self._shared_memory.buf
+        magic, self.capacity, count, _ = HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC:
+            self._shared_memory.close()
+            err_msg = f"shared memory block {name} is not a live marker feed"
+            Eid = "FeedMagic"
+            raise LiveFeedError(err_msg, Eid)
+
+        self.name = name
+        self.missed_count = 0
+        self._next_seq = max(count - self.capacity, 0) + 1 if from_start else count + 1
+
+    @property
+    def write_count(self):
+        """Returns the number of records published so far."""
+        return SEQUENCE.unpack_from(self._buffer, COUNT_OFFSET)[0]
+
+    @property
+    def current_value(self):
+        """Returns the current marker value."""
+        return SEQUENCE.unpack_from(self._buffer, CURRENT_VALUE_OFFSET)[0]
+
+    def read(self, max_records=None):
+        """Returns the new records (dicts with seq, kind, time_ms, value, Eid and error) since the last read."""
+
+        count = self.write_count
+
+        # Records that were already overwritten:
+        oldest = max(count - self.capacity + 1, 1)
+        if self._next_seq < oldest:
+            self.missed_count += oldest - self._next_seq
+            self._next_seq = oldest
+
+        last = count if max_records is None else min(count, self._next_seq + max_records - 1)
+
+        records = []
+        for seq in range(self._next_seq, last + 1):
+            offset = HEADER.size + ((seq - 1) % self.capacity) * RECORD_SIZE
+            if SEQUENCE.unpack_from(self._buffer, offset)[0] != seq:
+                self.missed_count += 1
+                continue
+            time_ms, kind, value, Eid, message = RECORD_BODY.unpack_from(self._buffer, offset + SEQUENCE.size)
+            # The writer may have overwritten the slot while it was read:
+            if SEQUENCE.unpack_from(self._buffer, offset)[0] != seq:
+                self.missed_count += 1
+                continue
+            records.append({'seq': seq, 'kind': KIND_NAMES[kind], 'time_ms': time_ms, 'value': value,
+                            'Eid': Eid.rstrip(b'\0').decode(errors='replace'),
+                            'error': message.rstrip(b'\0').decode(errors='replace')})
+
+        self._next_seq = last + 1
+        return records
+
+    def close(self):
+        """Detaches from the feed."""
+        if self._shared_memory is None:
+            return
+        self._buffer = None
+        self._shared_memory.close()
+        self._shared_memory = None
+
+
+def format_record(record):
+    """Returns a line for the console monitor."""
+    if record['kind'] == 'marker':
+        return f"{record['time_ms'] / 1000:12.3f} s  marker {record['value']:3d}  bits {record['value']:08b}"
+    return f"{record['time_ms'] / 1000:12.3f} s  error  {record['Eid']}: {record['error']}"
+
+
+def monitor(name, interval_s=0.2, from_start=True, stop_after_s=None):
+    """Console monitor: prints the markers and errors of a live feed as they arrive.
+
+    Args:
+        name: name of the live feed
+        interval_s: polling interval
+        from_start: print the records that are still in the buffer first
+        stop_after_s: stop after this many seconds (None: run until interrupted)
+    """
+
+    reader = LiveFeedReader(name, from_start=from_start)
+    start = time.monotonic()
+    missed = 0
+    try:
+        while stop_after_s is None or time.monotonic() - start < stop_after_s:
+            for record in reader.read():
+                print(format_record(record))
+            if reader.missed_count != missed:
+                print(f"({reader.missed_count - missed} records missed)")
+                missed = reader.missed_count
+            time.sleep(interval_s)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Current value: {reader.current_value} (bits {reader.current_value:08b})")
+        reader.close()
+
+
+def main(argv=None):
+    """Command-line entry point (see module docstring)."""
+
+    parser = argparse.ArgumentParser(description="Prints the markers of a live marker feed.")
+    parser.add_argument('name', help="name of the live feed (see MarkerManager.start_live_feed)")
+    parser.add_argument('--interval', type=float, default=0.2, help="polling interval in seconds")
+    parser.add_argument('--new-only', action='store_true', help="skip the records that are already in the buffer")
+    args = parser.parse_args(argv)
+
+    try:
+        monitor(args.name, args.interval, from_start=not args.new_only)
+    except LiveFeedError as e:
+        print(e.message, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""Live Incremental Console View of the Marker Tables
+
+print_marker_table regenerates and prints the full tables, which gets slower as the session grows.
+LiveTableView keeps its own state (the position in the logs, and the running marker and per-value
+statistics in a marker_stats.MarkerStatistics) and, on every refresh, only processes and prints the markers and errors that were logged
+since the previous refresh, followed by the updated summary rows of the values that changed. The cost
+of a refresh is proportional to the number of new events, and refreshes are throttled to at most one
+per min_interval_s, so the view can be refreshed in the trial loop without competing with marker sending.
+
+Example:
+    view = LiveTableView(marker_manager)
+    for trial in trials:
+        marker_manager.set_value(trial.marker)
+        ...
+        view.refresh()
+
+"""
+
+import sys
+import time
+
+from python_markers.marker_stats import MarkerStatistics
+
+# Column widths of the printed rows
+MARKER_ROW_FORMAT = '{:>6} {:>10} {:>14} {:>14} {:>12}'
+SUMMARY_ROW_FORMAT = '{:>6} {:>10} {:>17} {:>16} {:>16}'
+
+
+class LiveTableView:
+    """Incremental console view of the markers, errors and summary of a MarkerManager.
+
+    Attributes:
+        marker_manager:
+            the MarkerManager that is viewed
+        min_interval_s:
+            minimum time between two refreshes, more frequent refresh calls return without doing anything
+        show_summary:
+            bool indicating whether the updated summary rows are printed on each refresh
+        statistics:
+            marker_stats.MarkerStatistics of the markers that were processed
+        file:
+            file to print to (None: sys.stdout)
+    """
+
+    def __init__(self, marker_manager, min_interval_s=0.5, show_summary=True, file=None):
+        """Initializes LiveTableView
+
+        Args:
+            marker_manager: see Attributes
+            min_interval_s: see Attributes
+            show_summary: see Attributes
+            file: see Attributes
+        """
+
+        self.marker_manager = marker_manager
+        self.min_interval_s = min_interval_s
+        self.show_summary = show_summary
+        self.file = file
+        self.statistics = MarkerStatistics()
+
+        self._log_index = 0
+        self._error_index = 0
+        self._last_refresh = None
+        self._header_printed = False
+
+    def refresh(self, force=False):
+        """Prints the markers and errors logged since the previous refresh.
+
+        Args:
+            force: refresh even when the previous refresh was less than min_interval_s ago
+
+        Returns: the number of new log entries and errors (None when the refresh was throttled)
+        """
+
+        now = time.monotonic()
+        if not force and self._last_refresh is not None and now - self._last_refresh < self.min_interval_s:
+            return None
+        self._last_refresh = now
+
+        # Only the new entries are read (for a SpillLog these are in the in-memory tail):
+        set_value_list = self.marker_manager.set_value_list
+        error_list = self.marker_manager.error_list
+        n_log, n_errors = len(set_value_list), len(error_list)
+        new_entries = set_value_list[self._log_index:n_log]
+        new_errors = error_list[self._error_index:n_errors]
+        self._log_index, self._error_index = n_log, n_errors
+
+        lines = []
+        changed_values = set()
+        for entry in new_entries:
+            line = self._process_entry(entry['value'], entry['time_ms'], changed_values)
+            if line is not None:
+                lines.append(line)
+
+        if lines and not self._header_printed:
+            lines.insert(0, MARKER_ROW_FORMAT.format('value', 'occurrence', 'start_time_s', 'end_time_s',
+                                                     'duration_ms'))
+            self._header_printed = True
+
+        for error in new_errors:
+            lines.append(f"Error at {error['time_ms'] / 1000:.3f} s: {error['error']}")
+
+        if self.show_summary and changed_values:
+            lines.append(SUMMARY_ROW_FORMAT.format('value', 'occurrence', 'mean_duration_ms', 'min_duration_ms',
+                                                   'max_duration_ms'))
+            lines.extend(self._summary_row(value) for value in sorted(changed_values))
+
+        if new_entries and self.statistics.running_marker is not None:
+            value, occurrence, start_time_ms = self.statistics.running_marker
+            lines.append(f"Running: value {value} (occurrence {occurrence}) since {start_time_ms / 1000:.3f} s")
+
+        if lines:
+            print('\n'.join(lines), file=self.file if self.file is not None else sys.stdout)
+
+        return len(new_entries) + len(new_errors)
+
+    def _process_entry(self, value, time_ms, changed_values):
+        """Updates the statistics with one set_value entry, returns the row of the marker that ended (or None)."""
+
+        running_marker = self.statistics.running_marker
+        ended_marker = self.statistics.update(value, time_ms)
+        if self.statistics.running_marker not in (None, running_marker):
+            # A marker started
+            changed_values.add(value)
+        if ended_marker is None:
+            return None
+
+        value, occurrence, start_time_ms, end_time_ms = ended_marker
+        changed_values.add(value)
+        return MARKER_ROW_FORMAT.format(value, occurrence, f'{start_time_ms / 1000:.3f}',
+                                        f'{end_time_ms / 1000:.3f}', f'{end_time_ms - start_time_ms:.3f}')
+
+    def _summary_row(self, value):
+        """Returns the summary row of a value (durations of the markers that ended)."""
+        statistics = self.statistics.value_statistics[value]
+        if statistics.n_ended == 0:
+            return SUMMARY_ROW_FORMAT.format(value, statistics.occurrence, '-', '-', '-')
+        return SUMMARY_ROW_FORMAT.format(value, statistics.occurrence, f"{statistics.mean:.3f}",
+                                         f"{statistics.min:.3f}", f"{statistics.max:.3f}")
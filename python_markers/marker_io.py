@@ -0,0 +1,310 @@
+"""Reading and Writing Marker Tables
+
+This module contains the columnar (Parquet) writer used by MarkerManager.save_marker_table and readers
+that load saved marker tables (TSV or Parquet) back into dataframes.
+
+A TSV file written by save_marker_table consists of a header block with 'key: value' rows, followed by
+sections that start with a '#Name#' row, a row with column names and the data rows. Sections are
+separated by empty rows. read_marker_tsv parses such a file in one streaming pass. Besides the marker,
+summary and error tables, the file has a statistics section with the running statistics of the marker
+durations (see MarkerManager.live_summary), which read_marker_tsv returns when statistics is True.
+
+Parquet files are written with pyarrow, which is an optional dependency (python -m pip install pyarrow).
+A Parquet export consists of three files, <name>_markers.parquet, <name>_summary.parquet and
+<name>_errors.parquet, that each carry the header (date, library version, device properties, clock
+alignment and more_info) as JSON in their metadata.
+
+"""
+
+import csv
+import json
+
+import numpy
+import pandas
+
+# Table names, in the order used by gen_marker_table
+TABLE_NAMES = ('markers', 'summary', 'errors')
+
+# Metadata key under which the header is stored in the Parquet files
+HEADER_METADATA_KEY = b'python_markers.header'
+
+# Section names in the TSV files, by table name
+TSV_SECTIONS = {'markers': 'Markers', 'summary': 'Summary', 'errors': 'Errors', 'statistics': 'Statistics'}
+
+# Types of the known TSV columns (other columns are converted to float when possible, else kept as str), the
+# marker and summary columns have the types of MarkerManager.gen_marker_table (the same as the Parquet files)
+TSV_COLUMN_TYPES = {'value': numpy.uint8,
+                    'occurrence': numpy.int32,
+                    'duration_ms': numpy.float64,
+                    'start_time_s': numpy.float64,
+                    'end_time_s': numpy.float64,
+                    'time_s': numpy.float64,
+                    'mean_duration_ms': numpy.float64,
+                    'min_duration_ms': numpy.float64,
+                    'max_duration_ms': numpy.float64,
+                    'total_duration_ms': numpy.float64,
+                    'n_ended': numpy.int64,
+                    'std_duration_ms': numpy.float64,
+                    'p50_duration_ms': numpy.float64,
+                    'p90_duration_ms': numpy.float64,
+                    'p99_duration_ms': numpy.float64,
+                    'error': str,
+                    'start_time': 'datetime',
+                    'end_time': 'datetime',
+                    'time': 'datetime'}
+
+
+class MarkerFileError(Exception):
+    """Error reading or writing marker table files"""
+
+    def __init__(self, message, Eid):
+        super().__init__(message)
+        self.message = message
+        self.id = Eid
+
+
+def _import_pyarrow():
+    """Imports pyarrow when necessary (optional dependency)."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        err_msg = "Parquet files need pyarrow, install it with: python -m pip install pyarrow"
+        Eid = "PyarrowMissing"
+        raise MarkerFileError(err_msg, Eid)
+    return pyarrow, pyarrow.parquet
+
+
+def parquet_file_names(path_prefix):
+    """Returns a dict with table name as key and Parquet file name as value."""
+    return {table_name: f'{path_prefix}_{table_name}.parquet' for table_name in TABLE_NAMES}
+
+
+def write_marker_parquet(path_prefix, marker_df, summary_df, error_df, header):
+    """Writes the marker, summary and error tables as Parquet files.
+
+    Args:
+        path_prefix: path without extension, the table name and .parquet are appended
+        marker_df, summary_df, error_df: the tables as generated by MarkerManager.gen_marker_table
+        header: dict with header information, stored (as JSON) in the metadata of each file
+
+    Returns:
+        dict with table name as key and file name as value
+    """
+
+    pyarrow, parquet = _import_pyarrow()
+
+    file_names = parquet_file_names(path_prefix)
+    header_json = json.dumps(header).encode()
+
+    for table_name, df in zip(TABLE_NAMES, (marker_df, summary_df, error_df)):
+        # Store object columns with their actual (numeric) types
+        table = pyarrow.Table.from_pandas(df.infer_objects())
+        metadata = dict(table.schema.metadata or {})
+        metadata[HEADER_METADATA_KEY] = header_json
+        parquet.write_table(table.replace_schema_metadata(metadata), file_names[table_name])
+
+    return file_names
+
+
+def read_marker_parquet(path_prefix, tables=TABLE_NAMES, columns=None):
+    """Reads marker tables that were saved as Parquet files.
+
+    Only the requested tables and columns are read from disk.
+
+    Args:
+        path_prefix: path without extension (as passed to write_marker_parquet)
+        tables: names of the tables to read ('markers', 'summary' and/or 'errors')
+        columns: None (all columns) or a dict with table name as key and a list of column names as value
+
+    Returns: marker_df, summary_df, error_df and the header dict. Tables that were not requested are None.
+    """
+
+    pyarrow, parquet = _import_pyarrow()
+
+    unknown_tables = set(tables) - set(TABLE_NAMES)
+    if unknown_tables:
+        err_msg = f"tables can only contain {TABLE_NAMES}, got {unknown_tables}"
+        Eid = "UnknownTable"
+        raise MarkerFileError(err_msg, Eid)
+
+    if columns is None:
+        columns = {}
+
+    file_names = parquet_file_names(path_prefix)
+    dfs = {}
+    header = None
+
+    for table_name in tables:
+        table = parquet.read_table(file_names[table_name], columns=columns.get(table_name),
+                                   use_pandas_metadata=True)
+        dfs[table_name] = table.to_pandas()
+        if header is None:
+            header = read_parquet_header(file_names[table_name])
+
+    return dfs.get('markers'), dfs.get('summary'), dfs.get('errors'), header
+
+
+def read_parquet_header(file_name):
+    """Reads the header dict from the metadata of a Parquet file (without reading the data)."""
+    pyarrow, parquet = _import_pyarrow()
+    metadata = parquet.read_schema(file_name).metadata or {}
+    if HEADER_METADATA_KEY not in metadata:
+        return {}
+    return json.loads(metadata[HEADER_METADATA_KEY])
+
+
+def _convert_column(name, values):
+    """Converts a column of strings to a typed numpy array (see TSV_COLUMN_TYPES)."""
+
+    column_type = TSV_COLUMN_TYPES.get(name)
+
+    if column_type is str:
+        return numpy.array(values, dtype=object)
+
+    if column_type == 'datetime':
+        # Timestamps are returned as datetime64 in UTC
+        timestamps = pandas.to_datetime([value if value != '' else None for value in values], format='ISO8601',
+                                        utc=True)
+        return timestamps.tz_convert(None).to_numpy()
+
+    # Empty fields are missing values
+    if '' in values:
+        values = [value if value != '' else 'nan' for value in values]
+
+    if column_type in (numpy.uint8, numpy.int32, numpy.int64):
+        try:
+            integers = numpy.array(values, dtype=numpy.int64)
+        except ValueError:
+            floats = numpy.array(values, dtype=numpy.float64)
+            if not (numpy.all(numpy.isfinite(floats)) and numpy.all(floats == numpy.round(floats))):
+                return floats
+            integers = floats.astype(numpy.int64)
+        # Values that do not fit the type (e.g. in an edited file) are kept as int64
+        type_info = numpy.iinfo(column_type)
+        if len(integers) == 0 or (integers.min() >= type_info.min and integers.max() <= type_info.max):
+            return integers.astype(column_type)
+        return integers
+
+    try:
+        return numpy.array(values, dtype=numpy.float64)
+    except ValueError:
+        if column_type is numpy.float64:
+            raise
+        return numpy.array(values, dtype=object)
+
+
+def _tsv_rows(file_in):
+    """Yields the rows of a TSV file as lists of str.
+
+    Rows without quotes (all marker and summary rows) are split directly, quoted rows (e.g. error
+    messages with tabs or newlines) are parsed with the csv module.
+    """
+    pending = ''
+    for line in file_in:
+        if pending or '"' in line:
+            pending += line
+            # A quoted field can contain newlines, continue until the quotes are balanced
+            if pending.count('"') % 2:
+                continue
+            yield next(csv.reader([pending], delimiter='\t'), [])
+            pending = ''
+        else:
+            line = line.rstrip('\r\n')
+            yield line.split('\t') if line else []
+    if pending:
+        yield next(csv.reader([pending], delimiter='\t'), [])
+
+
+def _section_columns(column_names, flat_values):
+    """Converts the values of a section (row by row, in one flat list) to a dict with typed numpy columns."""
+    n_columns = len(column_names)
+    return {name: _convert_column(name, flat_values[i::n_columns]) for i, name in enumerate(column_names)}
+
+
+def read_marker_tsv_sections(file_name):
+    """Reads a marker table TSV file (as written by MarkerManager.save_marker_table) in one streaming pass.
+
+    Args:
+        file_name: path of the TSV file
+
+    Returns: the header dict and a dict with section name (e.g. 'Markers') as key and a dict with typed numpy
+        columns as value.
+    """
+
+    header = {}
+    sections = {}
+
+    section_name = None
+    column_names = None
+    flat_values = []
+
+    with open(file_name, newline='') as file_in:
+        for row in _tsv_rows(file_in):
+
+            is_section_start = len(row) == 1 and len(row[0]) > 2 and row[0][0] == '#' and row[0][-1] == '#'
+
+            # Header block (until the first section)
+            if section_name is None:
+                if is_section_start:
+                    section_name = row[0][1:-1]
+                elif row:
+                    key, _, value = row[0].partition(': ')
+                    header[key] = value
+
+            # Section start
+            elif is_section_start:
+                sections[section_name] = _section_columns(column_names or [], flat_values)
+                section_name = row[0][1:-1]
+                column_names = None
+                flat_values = []
+
+            # Column names (an empty row when the table has no columns)
+            elif column_names is None:
+                column_names = row
+
+            # Data row (empty rows separate sections)
+            elif row:
+                if len(row) != len(column_names):
+                    row = (row + [''] * len(column_names))[:len(column_names)]
+                flat_values.extend(row)
+
+    if section_name is not None:
+        sections[section_name] = _section_columns(column_names or [], flat_values)
+
+    return header, sections
+
+
+def read_marker_tsv(file_name, as_arrays=False, statistics=False):
+    """Reads a marker table TSV file (as written by MarkerManager.save_marker_table).
+
+    The file is parsed in one streaming pass, and the columns get their types (uint8 value, int32 occurrence,
+    float times and durations, str errors, UTC timestamps), the same as in gen_marker_table and the Parquet files.
+
+    Args:
+        file_name: path of the TSV file
+        as_arrays: when True, return the tables as dicts with column name as key and numpy array as value
+            instead of dataframes
+        statistics: when True, also return the statistics table (the running statistics of the marker durations
+            at the time of the save, see MarkerManager.live_summary)
+
+    Returns: marker_df, summary_df, error_df, (with statistics: statistics_df) and the header dict (tables missing
+        from the file are empty).
+    """
+
+    header, sections = read_marker_tsv_sections(file_name)
+
+    table_names = TABLE_NAMES + ('statistics',) if statistics else TABLE_NAMES
+    tables = []
+    for table_name in table_names:
+        columns = sections.get(TSV_SECTIONS[table_name], {})
+        if as_arrays:
+            tables.append(columns)
+        else:
+            df = pandas.DataFrame(columns)
+            for name in df.columns:
+                if df[name].dtype.kind == 'M':
+                    df[name] = df[name].dt.tz_localize('UTC')
+            tables.append(df)
+
+    return (*tables, header)
@@ -0,0 +1,285 @@
+"""Bounded-memory logs for the MarkerManager
+
+This module contains a list-like log that keeps only the most recent entries in memory and spills
+older entries to an on-disk segment store. It is used by the MarkerManager for set_value_list and
+error_list when max_log_length is set, so that memory use stays flat for sessions of any length.
+
+Segments are JSON Lines files with exactly `capacity` entries each, named <name>_<number>.jsonl. Every
+log stores its segments in a directory of its own, so logs (and sessions) can share a location. A full
+buffer is swapped for an empty one on append, and the segment is written by a background thread (one for
+all logs), so appending never waits for the disk. Until it is written, a segment is read from memory.
+
+It also contains a preallocated log, used by MarkerManager.critical_section, that stores markers and
+non-fatal errors in fixed-size arrays, so logging allocates no objects.
+
+"""
+
+from array import array
+import concurrent.futures
+import json
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+
+# Thread that writes the spilled segments of all logs (created on the first spill, see _segment_writer):
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _segment_writer():
+    """Returns the single-thread executor that writes the segments (segments are written in spill order)."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='marker-log-writer')
+        return _writer
+
+
+def _write_segment(segment_fn, segment, unwritten, segment_index):
+    """Writes a segment to disk (on the writer thread), then drops it from the unwritten segments of its log."""
+    with open(segment_fn, 'w') as file_out:
+        file_out.writelines(json.dumps(entry, separators=(',', ':')) + '\n' for entry in segment)
+    del unwritten[segment_index]
+
+
+def _remove_location(location):
+    """Removes the temporary directory of a log, after the pending segment writes."""
+    try:
+        _segment_writer().submit(shutil.rmtree, location, True)
+    except RuntimeError:
+        # Interpreter shutdown, the writer thread has already finished the pending writes
+        shutil.rmtree(location, True)
+
+
+class SpillLog:
+    """List-like log with a bounded in-memory ring buffer and on-disk spill segments.
+
+    Supports append, len, iteration (in chronological order) and indexing (including negative
+    indexes and slices). Only the in-memory tail is touched on append and on reading the last
+    entries, so the cost of these operations does not depend on the session length. Spilled segments
+    are written by a background thread (see flush).
+
+    Attributes:
+        capacity:
+            maximum number of entries kept in memory before the oldest entries are spilled
+        location:
+            directory where the segment files are stored (a new directory, see __init__)
+        name:
+            prefix of the segment file names
+        segment_files:
+            list of paths of the spilled segments, in chronological order
+    """
+
+    def __init__(self, capacity, location=None, name='log'):
+        """Initializes SpillLog
+
+        Args:
+            capacity: see Attributes
+            location: directory in which a new directory for the segments is created (named <name>_<random>),
+                when None a temporary directory is created which is removed when the log is garbage collected
+            name: see Attributes
+        """
+
+        if not isinstance(capacity, int) or capacity < 1:
+            raise ValueError(f"capacity should be a positive int, got {capacity}")
+
+        self.capacity = capacity
+        self.name = name
+        self.segment_files = []
+        self._tail = []
+        self._spilled_count = 0
+        self._cached_segment = (None, None)
+        # Spilled segments that are not yet written to disk, by segment index:
+        self._unwritten = {}
+        self._last_write = None
+
+        if location is None:
+            self.location = tempfile.mkdtemp(prefix='marker_log_')
+            self._finalizer = weakref.finalize(self, _remove_location, self.location)
+        else:
+            os.makedirs(location, exist_ok=True)
+            self.location = tempfile.mkdtemp(prefix=f'{name}_', dir=location)
+            self._finalizer = None
+
+    def append(self, entry):
+        """Appends an entry, spilling the oldest entries to disk when the buffer is full."""
+        self._tail.append(entry)
+        if len(self._tail) > self.capacity:
+            self._spill()
+
+    def _spill(self):
+        """Swaps the full buffer for a new one, the oldest `capacity` entries are written by the writer thread."""
+        segment = self._tail
+        self._tail = segment[self.capacity:]
+        del segment[self.capacity:]
+
+        segment_index = len(self.segment_files)
+        segment_fn = os.path.join(self.location, f'{self.name}_{segment_index:06d}.jsonl')
+        self._unwritten[segment_index] = segment
+        self.segment_files.append(segment_fn)
+        self._spilled_count += len(segment)
+        self._last_write = _segment_writer().submit(_write_segment, segment_fn, segment, self._unwritten,
+                                                    segment_index)
+
+    def flush(self):
+        """Blocks until all spilled segments are written to disk (raises the error of a failed write)."""
+        if self._last_write is not None:
+            self._last_write.result()
+
+    def _read_segment(self, segment_index):
+        """Reads a segment from disk (the most recently read segment is cached) or from memory when unwritten."""
+        segment = self._unwritten.get(segment_index)
+        if segment is not None:
+            return segment
+        if self._cached_segment[0] != segment_index:
+            with open(self.segment_files[segment_index]) as file_in:
+                entries = [json.loads(line) for line in file_in]
+            self._cached_segment = (segment_index, entries)
+        return self._cached_segment[1]
+
+    def __len__(self):
+        return self._spilled_count + len(self._tail)
+
+    def __iter__(self):
+        # Copy the segments and the tail, so appends during iteration do not affect it
+        segment_files, unwritten, tail = list(self.segment_files), dict(self._unwritten), list(self._tail)
+        yield from _iter_segments(segment_files, unwritten)
+        yield from tail
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        length = len(self)
+        if index < 0:
+            index += length
+        if index < 0 or index >= length:
+            raise IndexError("SpillLog index out of range")
+
+        if index >= self._spilled_count:
+            return self._tail[index - self._spilled_count]
+
+        segment = self._read_segment(index // self.capacity)
+        return segment[index % self.capacity]
+
+    def __repr__(self):
+        return f"SpillLog(len={len(self)}, in_memory={len(self._tail)}, segments={len(self.segment_files)})"
+
+    def snapshot(self):
+        """Returns a frozen view of the log, which can be iterated (e.g. on another thread) while the log grows.
+
+        Only the references to the in-memory entries are copied, the segments are not read (they do not change).
+        """
+        return SpillLogSnapshot(list(self.segment_files), dict(self._unwritten), list(self._tail),
+                                self._spilled_count)
+
+
+def _iter_segments(segment_files, unwritten):
+    """Yields the entries of the segments, unwritten segments (by segment index) are read from memory."""
+    for segment_index, segment_fn in enumerate(segment_files):
+        segment = unwritten.get(segment_index)
+        if segment is not None:
+            yield from segment
+            continue
+        with open(segment_fn) as file_in:
+            for line in file_in:
+                yield json.loads(line)
+
+
+class SpillLogSnapshot:
+    """Frozen view of a SpillLog (see SpillLog.snapshot), supports len and iteration."""
+
+    def __init__(self, segment_files, unwritten, tail, spilled_count):
+        self.segment_files = segment_files
+        self._unwritten = unwritten
+        self._tail = tail
+        self._spilled_count = spilled_count
+
+    def __len__(self):
+        return self._spilled_count + len(self._tail)
+
+    def __iter__(self):
+        yield from _iter_segments(self.segment_files, self._unwritten)
+        yield from self._tail
+
+
+class PreallocatedLog:
+    """Fixed-capacity marker and error log in preallocated arrays.
+
+    Values and error codes are stored in bytearrays and times in float arrays, so adding an entry does not
+    allocate (no dict per entry, no error message). The entries are converted to the usual set_value_list and
+    error_list entries when the log is drained.
+
+    Attributes:
+        capacity:
+            maximum number of markers (and, separately, errors) that can be stored
+        n_markers:
+            number of markers stored
+        n_errors:
+            number of errors stored
+    """
+
+    # Non-fatal errors that can be stored, the index in this tuple is the stored error code
+    ERROR_IDS = ('MarkerSentTwice', 'ConcurrentMarkerThreshold')
+
+    def __init__(self, capacity):
+        """Initializes PreallocatedLog
+
+        Args:
+            capacity: see Attributes
+        """
+
+        if not isinstance(capacity, int) or capacity < 1:
+            raise ValueError(f"capacity should be a positive int, got {capacity}")
+
+        self.capacity = capacity
+        self.n_markers = 0
+        self.n_errors = 0
+
+        self._values = bytearray(capacity)
+        self._times = array('d', bytes(8 * capacity))
+        self._error_codes = bytearray(capacity)
+        self._error_values = bytearray(capacity)
+        self._error_last_values = bytearray(capacity)
+        self._error_times = array('d', bytes(8 * capacity))
+
+    def add_marker(self, value, time_ms):
+        """Stores a marker, returns False (and stores nothing) when the log is full."""
+        n = self.n_markers
+        if n == self.capacity:
+            return False
+        self._values[n] = int(value)
+        self._times[n] = time_ms
+        self.n_markers = n + 1
+        return True
+
+    def add_error(self, Eid, value, last_value, time_ms):
+        """Stores a non-fatal error (see ERROR_IDS), returns False (and stores nothing) when the log is full."""
+        n = self.n_errors
+        if n == self.capacity:
+            return False
+        self._error_codes[n] = self.ERROR_IDS.index(Eid)
+        self._error_values[n] = int(value)
+        self._error_last_values[n] = int(last_value)
+        self._error_times[n] = time_ms
+        self.n_errors = n + 1
+        return True
+
+    def markers(self):
+        """Returns the stored markers as set_value_list entries."""
+        return [{'value': self._values[i], 'time_ms': self._times[i]} for i in range(self.n_markers)]
+
+    def errors(self):
+        """Returns the stored errors as (time_ms, Eid, value, last_value) tuples."""
+        return [(self._error_times[i], self.ERROR_IDS[self._error_codes[i]], self._error_values[i],
+                 self._error_last_values[i]) for i in range(self.n_errors)]
+
+    def clear(self):
+        """Empties the log (the arrays are kept and reused)."""
+        self.n_markers = 0
+        self.n_errors = 0
+
+    def __len__(self):
+        return self.n_markers
@@ -22,9 +22,18 @@ Notes:
 
 from abc import ABC, abstractmethod
 import python_markers.GS_timing as timing
+import collections
+import concurrent.futures
+import contextlib
+import gc
+import shutil
+import tempfile
+import threading
+import time
 import serial
 import datetime
 import json
+import numpy
 import pandas
 import re
 import sys
@@ -34,6 +43,12 @@ from serial.tools.list_ports import comports
 import warnings
 
 import python_markers.version_info as version_info
+from python_markers.marker_log import SpillLog, PreallocatedLog
+from python_markers.clock_alignment import ClockAlignment
+import python_markers.marker_io as marker_io
+from python_markers.live_feed import LiveFeed
+from python_markers.marker_stats import MarkerStatistics
+from python_markers.tracepoints import TracepointRegistry
 
 # Current library version
 LIB_VERSION = version_info.version
@@ -53,6 +68,18 @@ FAKE_DEVICE = 'FAKE DEVICE'
 #       This mode uses the FAKE_DEVICE
 available_devices = {'UsbParMarker', 'Eva', FAKE_DEVICE}
 
+# Column types of the summary table (the marker table has the same types for value and occurrence, and float64
+# times and durations):
+SUMMARY_DTYPES = (('value', numpy.uint8),
+                  ('occurrence', numpy.int32),
+                  ('mean_duration_ms', numpy.float64),
+                  ('min_duration_ms', numpy.float64),
+                  ('max_duration_ms', numpy.float64),
+                  ('total_duration_ms', numpy.float64))
+
+# Pre-encoded bytes of all marker values (avoids a conversion per marker):
+VALUE_BYTES = tuple(bytes((value,)) for value in range(256))
+
 
 class MarkerManager:
     """Sends markers to a given device.
@@ -69,9 +96,21 @@ class MarkerManager:
         _start_time:
             time of the current MarkerManager instance creation
         set_value_list:
-            list of all set_value calls which includes the value and time
+            list of all set_value calls which includes the value and time (a SpillLog when max_log_length is set)
         error_list:
-            list of errors that occurred when sending a marker
+            list of errors that occurred when sending a marker (a SpillLog when max_log_length is set)
+        max_log_length:
+            maximum number of set_value_list and error_list entries kept in memory, older entries are spilled to
+            disk (None: unbounded, everything is kept in memory). The spilled entries are written by a background
+            thread (see marker_log.SpillLog), so set_value does no file I/O, but the writer thread shares the
+            interpreter lock with the thread that sends markers (see save_marker_table_async)
+        log_location:
+            directory in which every spilled log gets a directory for its segments (None: temporary directory)
+        clock_alignment:
+            ClockAlignment that maps marker times to wall-clock time, sampled at init and every
+            clock_sample_interval_s (after a marker is sent, so sampling never delays a marker)
+        clock_sample_interval_s:
+            interval in seconds between clock alignment samples
         crash_on_marker_errors:
             bool indicating whether the script should crash when a marker error occurs
         concurrent_marker_threshold_ms:
@@ -84,6 +123,38 @@ class MarkerManager:
             dataframe with all marker errors (filled when calling gen_marker_table)
         _current_value:
             the current marker/output value, including zero (not set if device_interface is used directly)
+        _last_logged_value, _last_logged_time_ms:
+            value and time of the last logged marker (None before the first marker)
+        _critical_log:
+            preallocated log used in a critical section (None outside critical sections)
+        _live_feed:
+            shared-memory feed to which all logged markers and errors are published (None: no feed)
+        write_overhead_us:
+            median duration of a device write in us, compensated in send_precision_pulse (None before
+            calibrate_write_overhead)
+        pulse_list:
+            list of the precision pulses with the value, the requested and achieved width (us) and the onset time
+        _tracepoints:
+            registry of the tracepoint callbacks (tracepoints.TracepointRegistry), None when no callback is
+            registered
+        marker_statistics:
+            running per-value statistics of the marker durations (marker_stats.MarkerStatistics), updated as
+            markers end, see live_summary
+        _save_executor:
+            single-thread executor that runs save_marker_table_async (None before the first asynchronous save)
+        defer_concurrent_markers:
+            bool indicating whether markers within concurrent_marker_threshold_ms after the previous marker are
+            deferred (queued and sent as soon as the threshold allows) instead of raising or logging an error
+        max_deferred_markers:
+            maximum number of queued markers in deferral mode, set_value blocks when the queue is full
+        deferral_collapsed_count:
+            number of queued zero resets that were dropped because they followed a queued zero
+        thread_safe:
+            bool indicating whether set_value can be called from several threads. The time, the checks, the
+            device write and the log entry are serialized with _send_lock, so set_value_list is in send order (as
+            is the read-modify-write of set_bit)
+        _send_lock:
+            lock that serializes sending and logging in deferral mode and thread-safe mode
         gui:
             gui for future purposes (for now: gui = None)
     """
@@ -91,8 +162,13 @@ class MarkerManager:
     # Log class instances:
     marker_manager_instances = []
 
+    # Extra fields of the set_value_list entries that are added as marker table columns (see _send_marker):
+    _marker_entry_fields = ()
+
     def __init__(self, device_type, device_address=FAKE_ADDRESS, crash_on_marker_errors=True,
-                 time_function_ms=lambda: timing.millis(), **kwargs):
+                 time_function_ms=lambda: timing.millis(), max_log_length=None, log_location=None,
+                 clock_sample_interval_s=60, defer_concurrent_markers=False, max_deferred_markers=64,
+                 thread_safe=False, fast_start=False, **kwargs):
         """Initializes MarkerManager
 
         Builds the marker class, and the device interface class used to talk to the device.
@@ -102,6 +178,15 @@ class MarkerManager:
             device_address: see Attributes
             crash_on_marker_errors: see Attributes
             time_function_ms: see Attributes
+            max_log_length: see Attributes
+            log_location: see Attributes
+            clock_sample_interval_s: see Attributes
+            defer_concurrent_markers: see Attributes
+            max_deferred_markers: see Attributes
+            thread_safe: see Attributes
+            fast_start: when True, the MarkerManager is ready to send markers as soon as the port is opened: the
+                device properties are fetched when they are first read (see SerialDevice), and there is no delay
+                after the initial zero
 
         Raises:
             MarkerManagerError: error when something goes wrong in the MarkerManager
@@ -129,15 +214,51 @@ class MarkerManager:
                 Eid = "TimeFunctionMsCallable"
                 raise MarkerManagerError(err_msg, Eid)
 
+            if max_log_length is not None and (not isinstance(max_log_length, int) or max_log_length < 1):
+                err_msg = f"max_log_length should be None or a positive int, got {max_log_length}"
+                Eid = "MaxLogLength"
+                raise MarkerManagerError(err_msg, Eid)
+
+            if log_location is not None and not isinstance(log_location, str):
+                err_msg = f"log_location should be None or str, got {type(log_location)}"
+                Eid = "LogLocationString"
+                raise MarkerManagerError(err_msg, Eid)
+
+            if not isinstance(clock_sample_interval_s, (int, float)) or clock_sample_interval_s <= 0:
+                err_msg = f"clock_sample_interval_s should be a positive number, got {clock_sample_interval_s}"
+                Eid = "ClockSampleInterval"
+                raise MarkerManagerError(err_msg, Eid)
+
+            if not isinstance(defer_concurrent_markers, bool):
+                err_msg = f"defer_concurrent_markers should be bool, got {type(defer_concurrent_markers)}"
+                Eid = "DeferConcurrentMarkersBoolean"
+                raise MarkerManagerError(err_msg, Eid)
+
+            if not isinstance(fast_start, bool):
+                err_msg = f"fast_start should be bool, got {type(fast_start)}"
+                Eid = "FastStartBoolean"
+                raise MarkerManagerError(err_msg, Eid)
+
+            if not isinstance(thread_safe, bool):
+                err_msg = f"thread_safe should be bool, got {type(thread_safe)}"
+                Eid = "ThreadSafeBoolean"
+                raise MarkerManagerError(err_msg, Eid)
+
+            if not isinstance(max_deferred_markers, int) or max_deferred_markers < 1:
+                err_msg = f"max_deferred_markers should be a positive int, got {max_deferred_markers}"
+                Eid = "MaxDeferredMarkers"
+                raise MarkerManagerError(err_msg, Eid)
+
             # Check if class with same type and address (except fake) already exists
             if len(MarkerManager.marker_manager_instances) > 0 and device_address != FAKE_ADDRESS:
 
                 for instance in MarkerManager.marker_manager_instances:
 
-                    instance_properties = instance.device_interface.device_properties
+                    # The device type of the instance is used (reading its device properties could start a
+                    # property fetch of a fast-start device)
                     instance_address = instance.device_interface.device_address
 
-                    if instance_address == device_address and instance_properties['Device'] == device_type:
+                    if instance_address == device_address and instance.device_type == device_type:
                         err_msg = "class of same type and with same address already exists"
                         Eid = "DuplicateDevice"
                         raise MarkerManagerError(err_msg, Eid)
@@ -153,9 +274,9 @@ class MarkerManager:
         # Instantiate the correct DeviceInterface subclass or create general serial device when device is fake
         self.device_type = device_type
         if self.device_type == 'UsbParMarker':
-            self.device_interface = UsbParMarker(device_address)
+            self.device_interface = UsbParMarker(device_address, fast_start)
         elif self.device_type == 'Eva':
-            self.device_interface = Eva(device_address)
+            self.device_interface = Eva(device_address, fast_start)
         elif self.device_type == FAKE_DEVICE:
             self.device_interface = SerialDevice(FAKE_ADDRESS)
 
@@ -163,16 +284,69 @@ class MarkerManager:
         self._time_function_ms = time_function_ms
         self._start_time = time_function_ms()
 
-        self.set_value_list = list()
-        self.error_list = list()
+        # Clock alignment (monotonic marker time to wall-clock time):
+        self.clock_alignment = ClockAlignment(time_function_ms)
+        self.clock_sample_interval_s = clock_sample_interval_s
+        self.clock_alignment.sample()
+
+        self.max_log_length = max_log_length
+        self.log_location = log_location
+        if max_log_length is None:
+            self.set_value_list = list()
+            self.error_list = list()
+        else:
+            # Bounded memory: keep the most recent entries in memory and spill older entries to disk
+            self.set_value_list = SpillLog(max_log_length, log_location, name='set_value')
+            self.error_list = SpillLog(max_log_length, log_location, name='error')
         self.crash_on_marker_errors = crash_on_marker_errors
         self.concurrent_marker_threshold_ms = 10
 
+        # Last logged marker, used for the marker sequence checks:
+        self._last_logged_value = None
+        self._last_logged_time_ms = None
+
+        # Preallocated log, only set in a critical section (see critical_section):
+        self._critical_log = None
+
+        # Shared-memory live feed (see start_live_feed):
+        self._live_feed = None
+
+        # Tracepoint callbacks, None when no callback is registered (see add_tracepoint):
+        self._tracepoints = None
+
+        # Precision pulses (see send_precision_pulse):
+        self.write_overhead_us = None
+        self.pulse_list = []
+
+        # Running per-value duration statistics (see live_summary):
+        self.marker_statistics = MarkerStatistics()
+
+        # Worker thread of save_marker_table_async (created on the first asynchronous save):
+        self._save_executor = None
+
+        # Deferral mode (see _set_value_deferred):
+        self.defer_concurrent_markers = defer_concurrent_markers
+        self.max_deferred_markers = max_deferred_markers
+        self.deferral_collapsed_count = 0
+        self._send_lock = threading.RLock()
+        self._deferral_condition = threading.Condition(self._send_lock)
+
+        self.thread_safe = thread_safe
+        self._deferral_stop = False
+        self._deferred_markers = None
+        self._deferral_thread = None
+        if defer_concurrent_markers:
+            self._deferred_markers = collections.deque()
+            self._deferral_thread = threading.Thread(target=self._deferral_worker, name='marker-deferral',
+                                                     daemon=True)
+            self._deferral_thread.start()
+
         # Reset marker on init (when creating the marker_df in gen_marker_table it is assumed
         # that the device has no active markers after init):
         self._current_value = 0
         self.set_value(0)
-        timing.delay(100)
+        if not fast_start:
+            timing.delay(100)
 
         # In the future, add an optional Tkinter always-on-top GUI that shows the current marker value, the bit states,
         # the device props, etc, a table with the markers, etc.
@@ -192,9 +366,51 @@ class MarkerManager:
         return self.device_interface.device_properties
 
     def close(self):
-        """Closes the connection to the device."""
+        """Closes the connection to the device (and the live feed), after the deferred markers are sent, and the
+        running saves and the spilled log segments are written."""
+        if self._deferral_thread is not None:
+            with self._deferral_condition:
+                self._deferral_stop = True
+                self._deferral_condition.notify_all()
+            self._deferral_thread.join()
+            self._deferral_thread = None
+        self.stop_live_feed()
+        if self._save_executor is not None:
+            self._save_executor.shutdown(wait=True)
+            self._save_executor = None
+        for log in (self.set_value_list, self.error_list):
+            if isinstance(log, SpillLog):
+                log.flush()
         self.device_interface._close()
 
+    def start_live_feed(self, name=None, capacity=4096):
+        """Starts publishing all logged markers and errors to a shared-memory live feed.
+
+        A monitor in another process can read the feed with live_feed.LiveFeedReader, or on the console with
+        python -m python_markers.live_feed <name>.
+
+        Args:
+            name: name of the shared memory block (None: a unique name is generated)
+            capacity: number of records in the ring buffer
+
+        Returns: the LiveFeed, its name attribute identifies the feed for readers
+        """
+
+        if self._live_feed is not None:
+            err_msg = f"live feed already started: {self._live_feed.name}"
+            Eid = "LiveFeedStarted"
+            raise MarkerManagerError(err_msg, Eid)
+
+        self._live_feed = LiveFeed(name, capacity)
+        self._live_feed.update_current_value(self._current_value)
+        return self._live_feed
+
+    def stop_live_feed(self):
+        """Stops publishing to the live feed and removes it."""
+        if self._live_feed is not None:
+            self._live_feed.close()
+            self._live_feed = None
+
     def set_value(self, value):
         """Sets the marker value.
 
@@ -203,6 +419,8 @@ class MarkerManager:
         Arg:
             value: the marker value
 
+        Returns: the time of the marker in set_value_list (None when the marker was queued in deferral mode)
+
         Raises:
             MarkerError:
                 Always raised:
@@ -214,13 +432,37 @@ class MarkerManager:
                      If the value is not zero (zeros are not markers) and the value is equal to the current value,
                      the same value is sent twice in a row with no effect.
                   - Concurrent markers:
-                     If a marker was sent less than concurrent_marker_threshold_ms after the previous.
+                     If a marker was sent less than concurrent_marker_threshold_ms after the previous (unless
+                     defer_concurrent_markers is set, then the marker is deferred, see _set_value_deferred).
                   - Marker error:
                      If the marker could not be sent to the marker device for whatever reason.
         """
 
-        # Get current time:
-        cur_time = self._time_function_ms()
+        if self._deferred_markers is not None:
+            return self._set_value_deferred(value)
+
+        if self.thread_safe:
+            # The time is taken with the lock held, so the log order, the checks and the device agree:
+            with self._send_lock:
+                return self._send_marker(value, self._time_function_ms())
+
+        return self._send_marker(value, self._time_function_ms())
+
+    def _send_marker(self, value, cur_time, deferral_ms=None, fields=None):
+        """Checks, sends and logs a marker (see set_value).
+
+        Args:
+            value: the marker value
+            cur_time: the time of the marker
+            deferral_ms: time the marker was deferred (only logged in deferral mode)
+            fields: dict with extra fields of the log entries of the marker and its errors (e.g. the client, see
+                marker_server.AttributedMarkerManager)
+
+        Returns: cur_time, the time with which the marker was logged
+        """
+
+        if self._tracepoints is not None:
+            self._tracepoints.fire('pre_validate', value, cur_time)
 
         # Check and send marker:
         try:
@@ -240,6 +482,8 @@ class MarkerManager:
                 raise MarkerError(err_msg, is_fatal, Eid)
 
             # Send marker:
+            if self._tracepoints is not None:
+                self._tracepoints.fire('pre_write', value, cur_time)
             try:
                 self.device_interface._set_value(value)
             except Exception as e:
@@ -247,31 +491,21 @@ class MarkerManager:
                 is_fatal = False
                 Eid = "CouldNotSendMarker"
                 raise MarkerError(err_msg, is_fatal, Eid)
-
-            # The same value should not be sent twice (except 0, that doesn't matter):
-            if not len(self.set_value_list) == 0 and not value == 0:
-                last_value = self.set_value_list[-1]['value']
-                if value == last_value:
-                    err_msg = f"Marker with value {value} is sent twice in a row."
+            if self._tracepoints is not None:
+                self._tracepoints.fire('post_write', value, cur_time)
+
+            # Check the marker sequence (duplicate and concurrent markers):
+            Eid = self._check_marker_sequence(value, cur_time)
+            if Eid is not None:
+                last_value = self._last_logged_value
+                # In a critical section, non-fatal errors are stored without creating a message or exception:
+                if self.crash_on_marker_errors or not self._log_critical_error(Eid, value, last_value, cur_time):
+                    err_msg = marker_error_message(Eid, value, last_value, self.concurrent_marker_threshold_ms)
                     is_fatal = False
-                    Eid = "MarkerSentTwice"
                     raise MarkerError(err_msg, is_fatal, Eid)
 
-            # Two values should be separated by at least the concurrent marker threshold:
-            if not len(self.set_value_list) == 0:
-                last_start_time = self.set_value_list[-1]['time_ms']
-                last_value = self.set_value_list[-1]['value']
-                if not (value == 0 and last_value == 0):
-                    if (cur_time - last_start_time) < self.concurrent_marker_threshold_ms:
-                        err_msg = f"Marker with value {value} was sent within {self.concurrent_marker_threshold_ms} " \
-                                  f"ms after previous marker with value {last_value}"
-                        is_fatal = False
-                        Eid = "ConcurrentMarkerThreshold"
-                        raise MarkerError(err_msg, is_fatal, Eid)
-
         except MarkerError as e:
-            # Save error
-            self.error_list.append({'time_ms': cur_time, 'error': e.message})
+            self._log_error(cur_time, e.id, e.message, value, fields)
             if e.is_fatal or self.crash_on_marker_errors:
                 raise e
 
@@ -280,11 +514,436 @@ class MarkerManager:
             Eid = "BaseException"
             raise MarkerError(f'Unknown error: {e}', True, Eid)
 
+        self._log_marker(value, cur_time, deferral_ms, fields)
+        return cur_time
+
+    def _log_marker(self, value, cur_time, deferral_ms=None, fields=None):
+        """Logs a marker that was written to the device (see _send_marker)."""
+
         # Save marker value
         self._current_value = value
 
         # Log the marker:
-        self.set_value_list.append({'value': value, 'time_ms': cur_time})
+        if self._critical_log is None:
+            entry = {'value': value, 'time_ms': cur_time}
+            if deferral_ms is not None:
+                entry['deferral_ms'] = deferral_ms
+            if fields is not None:
+                entry.update(fields)
+            self.set_value_list.append(entry)
+        elif not self._critical_log.add_marker(value, cur_time):
+            # The preallocated log is full, move it to set_value_list and continue
+            self._flush_critical_log()
+            self._critical_log.add_marker(value, cur_time)
+        self._last_logged_value = value
+        self._last_logged_time_ms = cur_time
+        if self._critical_log is None:
+            self.marker_statistics.update(value, cur_time)
+
+        # Publish the marker to the live feed:
+        if self._live_feed is not None:
+            self._live_feed.publish_marker(value, cur_time)
+
+        # Sample the clock alignment periodically (after sending, so it does not delay the marker), this is
+        # postponed to the end of a critical section:
+        if self._critical_log is None and \
+                cur_time - self.clock_alignment.last_sample_ms >= self.clock_sample_interval_s * 1000:
+            self.clock_alignment.sample()
+
+    def calibrate_write_overhead(self, repetitions=200):
+        """Measures the duration of a device write, used to compensate the pulse width in send_precision_pulse.
+
+        The current value is written again to the port (see SerialDevice._write_port), which does not change
+        the output of the device and is not passed to a virtual recorder. Devices that are not a SerialDevice
+        (e.g. a hotplug.WatchedDevice, which would buffer the writes during an outage) cannot be calibrated, set
+        write_overhead_us for these instead.
+
+        Args:
+            repetitions: number of measured writes
+
+        Returns: the median write duration in us (also stored in write_overhead_us)
+
+        Raises:
+            MarkerManagerError:
+                - CalibrationDevice: the device interface is not a SerialDevice
+        """
+
+        device_interface = self.device_interface
+        if not isinstance(device_interface, SerialDevice):
+            err_msg = (f"Only a SerialDevice can be calibrated, got {type(device_interface).__name__} "
+                       f"(set write_overhead_us instead)")
+            Eid = "CalibrationDevice"
+            raise MarkerManagerError(err_msg, Eid)
+
+        durations_us = []
+        # Other threads cannot change the value while it is written again:
+        with self._send_lock:
+            for _ in range(repetitions):
+                start_us = timing.micros()
+                device_interface._write_port(self._current_value)
+                durations_us.append(timing.micros() - start_us)
+        durations_us.sort()
+        self.write_overhead_us = durations_us[len(durations_us) // 2]
+        return self.write_overhead_us
+
+    def send_precision_pulse(self, value, duration_us=500):
+        """Sends a marker pulse with a sub-millisecond duration (blocking), and resets to 0 afterwards.
+
+        The onset is a normal marker (checked and logged by set_value). The pulse is timed with
+        GS_timing.delayMicroseconds from the end of the onset write, and the release write is started
+        write_overhead_us early (see calibrate_write_overhead, which runs on the first pulse), so that the
+        time between the two writes is duration_us. The release is not subject to the concurrent marker threshold,
+        fires the pre_write and post_write tracepoints, and is logged at the onset time plus the achieved width.
+        Every pulse is stored in pulse_list (see pulse_width_report).
+
+        Args:
+            value: the marker value (not 0)
+            duration_us: the pulse width in us
+
+        Returns: the achieved pulse width in us (None when the onset or the release could not be sent and the error
+            was logged, the pulse is then not stored in pulse_list)
+
+        Raises:
+            MarkerManagerError:
+                - PulseValue: value is 0
+                - PulseDuration: duration_us is not a positive number
+                - PulseDeferral: pulses cannot be sent in deferral mode (the onset could be queued)
+            MarkerError: see set_value (also raised when the release could not be sent)
+        """
+
+        if value == 0:
+            err_msg = "A pulse cannot have value 0."
+            Eid = "PulseValue"
+            raise MarkerManagerError(err_msg, Eid)
+
+        if isinstance(duration_us, bool) or not isinstance(duration_us, (int, float)) or not duration_us > 0:
+            err_msg = f"duration_us should be a positive number, got {duration_us}"
+            Eid = "PulseDuration"
+            raise MarkerManagerError(err_msg, Eid)
+
+        if self._deferred_markers is not None:
+            err_msg = "Precision pulses cannot be sent in deferral mode (defer_concurrent_markers)."
+            Eid = "PulseDeferral"
+            raise MarkerManagerError(err_msg, Eid)
+
+        if self.write_overhead_us is None:
+            self.calibrate_write_overhead()
+
+        # The end of the onset write (and the onset time) is taken with the post_write tracepoint:
+        onset_write = []
+
+        def mark_onset(name, timestamp_ns, marker_value, time_ms, info):
+            onset_write.append((timing.micros(), time_ms))
+
+        with self._send_lock:
+            self.add_tracepoint('post_write', mark_onset)
+            try:
+                self.set_value(value)
+            finally:
+                self.remove_tracepoint('post_write', mark_onset)
+            if not onset_write:
+                return None
+            onset_us, onset_time_ms = onset_write[0]
+
+            # Start the release write early by the write overhead:
+            remaining_us = onset_us + duration_us - self.write_overhead_us - timing.micros()
+            if remaining_us > 0:
+                timing.delayMicroseconds(remaining_us)
+            if self._tracepoints is not None:
+                self._tracepoints.fire('pre_write', 0, onset_time_ms + (timing.micros() - onset_us) / 1000)
+            try:
+                self.device_interface._set_value(0)
+            except Exception as e:
+                # As in _send_marker: the error is logged, and raised or the release is logged as if it was sent
+                release_time_ms = onset_time_ms + (timing.micros() - onset_us) / 1000
+                err_msg = f"Could not send marker, check connection: {e}."
+                Eid = "CouldNotSendMarker"
+                self._log_error(release_time_ms, Eid, err_msg, 0)
+                if self.crash_on_marker_errors:
+                    raise MarkerError(err_msg, False, Eid)
+                self._log_marker(0, release_time_ms)
+                return None
+            width_us = timing.micros() - onset_us
+            release_time_ms = onset_time_ms + width_us / 1000
+            if self._tracepoints is not None:
+                self._tracepoints.fire('post_write', 0, release_time_ms)
+
+            self._log_marker(0, release_time_ms)
+
+        self.pulse_list.append({'value': value, 'requested_us': duration_us, 'achieved_us': width_us,
+                                'time_ms': onset_time_ms})
+        return width_us
+
+    def pulse_width_report(self, recorded_df=None):
+        """Returns the distribution of the achieved widths of the precision pulses, per requested width.
+
+        The achieved width is measured between the device writes. The width at the other end (the acquisition
+        system, or a VirtualRecorder for a fake device) is added with recorded_df: the marker table of the
+        recording (see virtual_recorder.detect_markers), with the pulses as its last markers.
+
+        Args:
+            recorded_df: marker table of the recording (None: only the achieved widths)
+
+        Returns: DataFrame with per requested width (us) the number of pulses, and the mean, standard deviation,
+            min, max and 99th percentile of the achieved width and the mean error (achieved - requested), in us.
+            With recorded_df also the mean, min and max of the recorded width.
+
+        Raises:
+            MarkerManagerError:
+                - PulseRecording: recorded_df has fewer markers than there are pulses, or other values
+        """
+
+        pulse_df = pandas.DataFrame(self.pulse_list, columns=['value', 'requested_us', 'achieved_us', 'time_ms'])
+        pulse_df['error_us'] = pulse_df['achieved_us'] - pulse_df['requested_us']
+        if recorded_df is not None:
+            recorded_df = recorded_df.tail(len(pulse_df))
+            if len(recorded_df) < len(pulse_df) or \
+                    recorded_df['value'].tolist() != pulse_df['value'].tolist():
+                err_msg = "The last markers of the recording do not match the pulses."
+                Eid = "PulseRecording"
+                raise MarkerManagerError(err_msg, Eid)
+            pulse_df['recorded_us'] = recorded_df['duration_ms'].to_numpy() * 1000
+
+        grouped = pulse_df.groupby('requested_us')
+        report_df = grouped['achieved_us'].agg(['count', 'mean', 'std', 'min', 'max'])
+        report_df['p99'] = grouped['achieved_us'].quantile(0.99)
+        report_df['mean_error'] = grouped['error_us'].mean()
+        if recorded_df is not None:
+            report_df = report_df.join(grouped['recorded_us'].agg(['mean', 'min', 'max']).add_prefix('recorded_'))
+        return report_df.add_suffix('_us').rename(columns={'count_us': 'count'}).reset_index()
+
+    def _set_value_deferred(self, value, fields=None):
+        """Sets the marker value in deferral mode (defer_concurrent_markers).
+
+        A marker that would be sent within concurrent_marker_threshold_ms after the previous marker, or while
+        other markers are waiting, is queued, and sent by the deferral thread as soon as the threshold allows.
+        The time a marker waited is logged as deferral_ms in set_value_list (0 for markers that were sent
+        immediately).
+
+        Runs of queued markers are collapsed: a zero that follows a queued zero is dropped (it would not change
+        the output). When the queue holds max_deferred_markers markers, the call blocks until there is room.
+
+        Returns: the time of the marker in set_value_list when it was sent immediately, None when it was queued
+            (or dropped)
+        """
+
+        with self._deferral_condition:
+            cur_time = self._time_function_ms()
+
+            # Invalid values are not queued, their (fatal) errors are raised now:
+            if not whole_number(value) or value > 255 or value < 0:
+                self._send_marker(value, cur_time, 0.0, fields)
+
+            queue = self._deferred_markers
+            if not queue and self._send_allowed(value, cur_time):
+                return self._send_marker(value, cur_time, 0.0, fields)
+
+            # Collapse back-to-back zero resets:
+            if queue and value == 0 and queue[-1][0] == 0:
+                self.deferral_collapsed_count += 1
+                return None
+
+            # Backpressure:
+            while len(queue) >= self.max_deferred_markers:
+                self._deferral_condition.wait()
+
+            queue.append((value, cur_time, fields))
+            self._deferral_condition.notify_all()
+            return None
+
+    def _send_allowed(self, value, cur_time):
+        """Returns whether a marker can be sent now without violating the concurrent marker threshold."""
+        last_value = self._last_logged_value
+        if last_value is None or (value == 0 and last_value == 0):
+            return True
+        return cur_time - self._last_logged_time_ms >= self.concurrent_marker_threshold_ms
+
+    def _deferral_worker(self):
+        """Sends the deferred markers as soon as the concurrent marker threshold allows (runs on its own thread)."""
+
+        while True:
+            with self._deferral_condition:
+                while not self._deferred_markers and not self._deferral_stop:
+                    self._deferral_condition.wait()
+                if not self._deferred_markers:
+                    return
+                value, request_time, fields = self._deferred_markers[0]
+                due_time = self._last_logged_time_ms + self.concurrent_marker_threshold_ms \
+                    if self._last_logged_value is not None else request_time
+
+            # Wait until the marker is allowed, without holding the lock:
+            remaining_ms = due_time - self._time_function_ms()
+            if remaining_ms > 1:
+                time.sleep((remaining_ms - 1) / 1000)
+
+            with self._deferral_condition:
+                while not self._send_allowed(value, self._time_function_ms()):
+                    pass
+                self._deferred_markers.popleft()
+                cur_time = self._time_function_ms()
+                try:
+                    self._send_marker(value, cur_time, cur_time - request_time, fields)
+                except MarkerError:
+                    # Already logged in error_list, the caller of set_value is not waiting
+                    pass
+                self._deferral_condition.notify_all()
+
+    def flush_deferred_markers(self):
+        """Blocks until all deferred markers have been sent."""
+        if self._deferred_markers is None:
+            return
+        with self._deferral_condition:
+            while self._deferred_markers:
+                self._deferral_condition.wait()
+
+    def add_tracepoint(self, name, callback):
+        """Registers a callback for a tracepoint in the marker path (see tracepoints).
+
+        Args:
+            name: tracepoint name (see tracepoints.TRACEPOINTS)
+            callback: function called as callback(name, timestamp_ns, value, time_ms, info)
+        """
+        tracepoints = self._tracepoints if self._tracepoints is not None else TracepointRegistry()
+        tracepoints.register(name, callback)
+        self._tracepoints = tracepoints
+        if isinstance(self.device_interface, SerialDevice):
+            self.device_interface.tracepoints = tracepoints
+
+    def remove_tracepoint(self, name, callback):
+        """Removes a tracepoint callback, without callbacks the tracepoints cost a single attribute check again."""
+        if self._tracepoints is None:
+            return
+        self._tracepoints.unregister(name, callback)
+        if self._tracepoints.is_empty():
+            self._tracepoints = None
+            if isinstance(self.device_interface, SerialDevice):
+                self.device_interface.tracepoints = None
+
+    def _check_marker_sequence(self, value, cur_time):
+        """Returns the Eid of the non-fatal sequence error of value (None if there is no error)."""
+
+        # Nothing logged yet:
+        last_value = self._last_logged_value
+        if last_value is None:
+            return None
+
+        # The same value should not be sent twice (except 0, that doesn't matter):
+        if value == last_value and value != 0:
+            return "MarkerSentTwice"
+
+        # Two values should be separated by at least the concurrent marker threshold:
+        if not (value == 0 and last_value == 0):
+            if (cur_time - self._last_logged_time_ms) < self.concurrent_marker_threshold_ms:
+                return "ConcurrentMarkerThreshold"
+
+        return None
+
+    @contextlib.contextmanager
+    def critical_section(self, capacity=10000, freeze_gc=True):
+        """Context manager for timing-critical code in which set_value allocates no objects.
+
+        Inside the critical section:
+            - markers are logged in a preallocated log (see marker_log.PreallocatedLog) instead of set_value_list,
+              and non-fatal errors are stored as codes (their messages are created on exit)
+            - the cyclic garbage collector is disabled, and all existing objects are frozen (gc.freeze), so no
+              collection pauses can delay a marker
+            - clock alignment samples are postponed
+
+        On exit, the logged markers and errors are appended to set_value_list and error_list (in order), a clock
+        alignment sample is taken when it is due, and the garbage collector is restored.
+
+        Note that set_value_list and error_list are only updated on exit (or when the preallocated log is full),
+        use gen_marker_table after the critical section.
+
+        Example:
+            with marker_manager.critical_section():
+                for trial in trials:
+                    marker_manager.set_value(trial.marker)
+                    ...
+
+        Args:
+            capacity: number of markers (and errors) that can be logged before the log is flushed to set_value_list
+                (flushing allocates, so choose a capacity larger than the number of markers in the section)
+            freeze_gc: bool indicating whether the garbage collector should be disabled in the section
+
+        Raises:
+            MarkerManagerError: when critical sections are nested
+        """
+
+        if self._critical_log is not None:
+            err_msg = "critical sections cannot be nested"
+            Eid = "NestedCriticalSection"
+            raise MarkerManagerError(err_msg, Eid)
+
+        if self._deferred_markers is not None:
+            err_msg = "critical sections cannot be used in deferral mode (defer_concurrent_markers)"
+            Eid = "CriticalSectionDeferral"
+            raise MarkerManagerError(err_msg, Eid)
+
+        self._critical_log = PreallocatedLog(capacity)
+
+        gc_was_enabled = gc.isenabled()
+        if freeze_gc:
+            # Collect now, so the section starts without garbage, then move everything to the permanent generation
+            gc.collect()
+            gc.freeze()
+            gc.disable()
+
+        try:
+            yield self
+        finally:
+            self._flush_critical_log()
+            self._critical_log = None
+
+            if freeze_gc:
+                gc.unfreeze()
+                if gc_was_enabled:
+                    gc.enable()
+
+            if self._time_function_ms() - self.clock_alignment.last_sample_ms >= self.clock_sample_interval_s * 1000:
+                self.clock_alignment.sample()
+
+    def _log_error(self, time_ms, Eid, message, value=None, fields=None):
+        """Logs an error in error_list, the live feed and the error tracepoint (also used from other threads)."""
+        with self._send_lock:
+            # After the errors stored in a critical section, to keep the order
+            self._flush_critical_log()
+            entry = {'time_ms': time_ms, 'error': message}
+            if fields is not None:
+                entry.update(fields)
+            self.error_list.append(entry)
+            if self._live_feed is not None:
+                self._live_feed.publish_error(time_ms, Eid, value, message)
+            if self._tracepoints is not None:
+                self._tracepoints.fire('error', value, time_ms, (Eid, message))
+
+    def _log_critical_error(self, Eid, value, last_value, cur_time):
+        """Stores a non-fatal error in the critical section log, returns False if it could not be stored."""
+        if self._critical_log is None or not self._critical_log.add_error(Eid, value, last_value, cur_time):
+            return False
+        # The message is created on exit, the live feed and tracepoints only get the error id:
+        if self._live_feed is not None:
+            self._live_feed.publish_error(cur_time, Eid, value)
+        if self._tracepoints is not None:
+            self._tracepoints.fire('error', value, cur_time, (Eid, None))
+        return True
+
+    def _flush_critical_log(self):
+        """Moves the markers and errors of the critical section log to set_value_list and error_list."""
+
+        critical_log = self._critical_log
+        if critical_log is None:
+            return
+
+        for entry in critical_log.markers():
+            self.set_value_list.append(entry)
+            self.marker_statistics.update(entry['value'], entry['time_ms'])
+
+        for time_ms, Eid, value, last_value in critical_log.errors():
+            err_msg = marker_error_message(Eid, value, last_value, self.concurrent_marker_threshold_ms)
+            self.error_list.append({'time_ms': time_ms, 'error': err_msg})
+
+        critical_log.clear()
 
     def send_marker_pulse(self, value, duration_ms=100):
         """Sends a short marker pulse (blocking), and resets to 0 afterwards"""
@@ -307,8 +966,7 @@ class MarkerManager:
             raise MarkerError(err_msg, True, Eid)
 
         # Check that the 8 chars consist of zeros and/or ones:
-        find_all_bits = re.findall('[0-1]', bits)
-        if not len(find_all_bits) == 8:
+        if not set(bits) <= {'0', '1'}:
             err_msg = "bits can only consist of zeros and ones, e.g. '00000001'"
             Eid = "BitElements"
             raise MarkerError(err_msg, True, Eid)
@@ -321,35 +979,38 @@ class MarkerManager:
         """Toggles a single bit, while leaving other bits intact.
 
         Args:
-            bit: the bit that should be toggled (0 - 7) -> 0 is LSB
+            bit: the bit that should be toggled (0 - 7) -> 0 is the MSB, i.e. the same order as the
+                characters of set_bits (set_bit(7, 'on') on a zero value gives value 1)
             state: 'on' or 'off'
         """
 
-        if not whole_number(bit) or bit < 0 or bit > 7:
-            err_msg = "bit should be whole number between 0 and 7"
-            Eid = "BitTypeRange"
-            raise MarkerError(err_msg, True, Eid)
-
-        # Convert current value to 8 bit string
-        cur_bits = format(self._current_value, '#010b')[2:]
+        mask = bit_mask(bit)
 
-        # Set concerning bit dependent on state:
-        if state == 'on':
-            new_bits = cur_bits[:bit] + '1' + cur_bits[bit + 1:]
-        elif state == 'off':
-            new_bits = cur_bits[:bit] + '0' + cur_bits[bit + 1:]
-        else:
+        if state not in ('on', 'off'):
             err_msg = "set_bit state can only be 'on' or 'off'"
             Eid = "BitState"
             raise MarkerError(err_msg, True, Eid)
 
-        # Convert 8 bit string to int and set_value:
-        value = int(new_bits, 2)
-        self.set_value(value)
+        # In thread-safe mode the current value is read and set under the send lock, so that set_bit calls of
+        # several threads do not undo each other's bits:
+        with self._send_lock if self.thread_safe else contextlib.nullcontext():
+
+            # Set concerning bit dependent on state:
+            if state == 'on':
+                value = self._current_value | mask
+            else:
+                value = self._current_value & ~mask
+
+            self.set_value(value)
 
-    def gen_marker_table(self):
+    def gen_marker_table(self, time_reference=None):
         """Generates marker tables.
 
+        Args:
+            time_reference: None, 'utc' or 'wall'. When 'utc' or 'wall', the marker dataframe gets start_time and
+                end_time columns, and the error dataframe gets a time column, with timestamps in UTC or local
+                wall-clock time (see clock_alignment).
+
         Returns: Three dataframes:
                   - marker dataframe
                         This dataframe has, in chronological order, the marker value, its start and end time, duration
@@ -360,100 +1021,165 @@ class MarkerManager:
                         occurrences).
                   - error dataframe
                         The error dataframe has a list of all non-fatal errors and their times.
+                The columns have fixed types: uint8 value, int32 occurrence and float64 times and durations (see
+                gen_marker_arrays for the tables as numpy structured arrays).
         """
 
-        set_value_df = pandas.DataFrame(self.set_value_list)
+        if time_reference not in (None, 'utc', 'wall'):
+            err_msg = f"time_reference can only be None, 'utc' or 'wall', got {time_reference}"
+            Eid = "TimeReference"
+            raise MarkerManagerError(err_msg, Eid)
 
-        # Assumes that the first value is always set to 0 at init.
-        assert set_value_df['value'].iloc[0] == 0
+        # Include the markers of a running critical section:
+        self._flush_critical_log()
 
-        # init
-        last_value = None
-        marker_counter = 0
-        df_cols = ['value', 'start_time_ms', 'end_time_ms', 'duration_ms', 'occurrence']
-        marker_df = pandas.DataFrame(columns=df_cols)
+        if time_reference is not None:
+            self.clock_alignment.sample()
 
-        # Get marker start and end time
-        # - The marker start is defined as marker value change from zero to non-zero or from non-zero to non-zero
-        # - The marker end is defined as a marker value change from non-zero to zero or from non-zero to non-zero
-        for index in set_value_df.index:
-            cur_value = set_value_df.at[index, 'value']
-            cur_time = set_value_df.at[index, 'time_ms']
-            # Value changes
-            if cur_value != last_value:
-                # Value changed to 0 and it is not the first value
-                if cur_value == 0 and last_value is not None:
-                    # end marker
-                    marker_df.at[marker_counter, 'end_time_ms'] = cur_time
-                    marker_counter += 1
-
-                # Value changed from 0 to non-zero
-                elif cur_value != 0 and last_value == 0:
-                    # start marker:
-                    marker_df.at[marker_counter, 'value'] = cur_value
-                    marker_df.at[marker_counter, 'start_time_ms'] = cur_time
-
-                # Value changed from non-zero to non-zero
-                elif cur_value != 0 and last_value != 0:
-                    # end marker:
-                    marker_df.at[marker_counter, 'end_time_ms'] = cur_time
-                    marker_counter += 1
-
-                    # start marker:
-                    marker_df.at[marker_counter, 'value'] = cur_value
-                    marker_df.at[marker_counter, 'start_time_ms'] = cur_time
-
-            last_value = cur_value
+        return self._gen_marker_table(self._log_snapshot(), time_reference)
 
-        # When the last marker was a non-zero value, set end time to infinite
-        if not marker_df.empty and pandas.isna(marker_df["end_time_ms"].values[-1]):
-            marker_df["end_time_ms"].values[-1] = float('inf')
-
-        # Convert start and end time to seconds:
-        marker_df["start_time_s"] = marker_df["start_time_ms"] / 1000
-        marker_df["end_time_s"] = marker_df["end_time_ms"] / 1000
-
-        # Save duration
-        marker_df["duration_ms"] = marker_df["end_time_ms"] - marker_df["start_time_ms"]
-        # Remove ms columns
-        marker_df.drop(['end_time_ms', 'start_time_ms'], axis=1, inplace=True)
-
-        # Save marker occurrences:
-        marker_occur_dict = {}
-        for index in marker_df.index:
-            cur_value = marker_df.at[index, 'value']
-            if marker_occur_dict.get(cur_value) is None:
-                occurrence = 1
-            else:
-                occurrence = marker_occur_dict.get(cur_value) + 1
-            marker_occur_dict[cur_value] = occurrence
-            marker_df.loc[index, "occurrence"] = occurrence
-
-        # Create summary table
-        summary_df = marker_df.loc[:, ('value', 'occurrence')]
-        summary_df["mean_duration_ms"] = None
-        summary_df["min_duration_ms"] = None
-        summary_df["max_duration_ms"] = None
-        summary_df["total_duration_ms"] = None
-        for index, val in enumerate(summary_df.value):
-            all_durations = marker_df[summary_df["value"] == val].duration_ms.tolist()
-            summary_df.loc[index, 'mean_duration_ms'] = (sum(all_durations)) / len(all_durations)
-            summary_df.loc[index, 'min_duration_ms'] = min(all_durations)
-            summary_df.loc[index, 'max_duration_ms'] = max(all_durations)
-            summary_df.loc[index, 'total_duration_ms'] = sum(all_durations)
-
-        summary_df = summary_df.drop_duplicates(subset=['value'], keep='last')
+    def _log_snapshot(self):
+        """Returns a snapshot of the logs from which the marker tables can be generated (also on another thread).
+
+        The in-memory entries are copied by reference, spilled segments are not read (they do not change).
+        """
+        return {'set_value_list': snapshot_log(self.set_value_list),
+                'error_list': snapshot_log(self.error_list),
+                'clock_alignment': self.clock_alignment.snapshot()}
+
+    def _gen_marker_table(self, snapshot, time_reference=None):
+        """Generates the marker tables from a log snapshot (see gen_marker_table and _log_snapshot)."""
+
+        marker_columns, summary_columns, summary_index = self._marker_table_columns(snapshot)
+        marker_df = pandas.DataFrame(marker_columns)
+        summary_df = pandas.DataFrame(summary_columns, index=summary_index)
 
         # Create error table
-        error_df = pandas.DataFrame(self.error_list)
-        if len(self.error_list) > 0:
+        error_df = pandas.DataFrame(list(snapshot['error_list']))
+        if len(error_df) > 0:
             error_df["time_s"] = error_df["time_ms"] / 1000
             error_df.drop("time_ms", axis=1, inplace=True)
 
+        # Add wall-clock times:
+        if time_reference is not None:
+            clock_alignment = snapshot['clock_alignment']
+            utc = time_reference == 'utc'
+            marker_df["start_time"] = clock_alignment.to_datetime(
+                marker_df["start_time_s"].to_numpy(dtype=float) * 1000, utc=utc)
+            marker_df["end_time"] = clock_alignment.to_datetime(
+                marker_df["end_time_s"].to_numpy(dtype=float) * 1000, utc=utc)
+            if len(error_df) > 0:
+                error_df["time"] = clock_alignment.to_datetime(
+                    error_df["time_s"].to_numpy(dtype=float) * 1000, utc=utc)
+
         return marker_df, summary_df, error_df
 
+    def live_summary(self):
+        """Returns the running per-value statistics of the marker durations, without regenerating the tables.
+
+        Returns: DataFrame with per marker value the occurrence, the number of ended markers, the mean, standard
+            deviation, min, max and total duration (ms) of the ended markers, and the approximate 50th, 90th and
+            99th percentile of the durations (see marker_stats)
+        """
+        self._flush_critical_log()
+        return self.marker_statistics.summary()
+
+    def _marker_table_columns(self, snapshot):
+        """Returns the typed columns of the marker and summary tables of a log snapshot.
+
+        Returns: dict with the marker table columns, dict with the summary table columns and the index of the
+            summary table (the position in the marker table of the last marker of each value), as numpy arrays
+        """
+
+        # Stitch spilled log segments (if any) and the in-memory entries together:
+        entries = list(snapshot['set_value_list'])
+        values = numpy.fromiter((entry['value'] for entry in entries), dtype=numpy.int64, count=len(entries))
+        times_ms = numpy.fromiter((entry['time_ms'] for entry in entries), dtype=numpy.float64, count=len(entries))
+
+        # Assumes that the first value is always set to 0 at init.
+        assert values[0] == 0
+
+        # Get marker start and end time
+        # - The marker start is defined as marker value change from zero to non-zero or from non-zero to non-zero
+        # - The marker end is defined as a marker value change from non-zero to zero or from non-zero to non-zero
+        # A marker therefore ends at the first value change after its start.
+        changes = numpy.flatnonzero(values[1:] != values[:-1]) + 1
+        change_values = values[changes]
+        change_times_ms = times_ms[changes]
+        starts = numpy.flatnonzero(change_values != 0)
+        start_times_ms = change_times_ms[starts]
+        # When the last marker was a non-zero value, set end time to infinite
+        end_times_ms = numpy.append(change_times_ms, numpy.inf)[starts + 1]
+        marker_values = change_values[starts]
+
+        durations_ms = end_times_ms - start_times_ms
+
+        # Save marker occurrences, and the summary of each value (at the position of its last marker). A marker
+        # that did not end has an infinite duration, so the mean, max and total of its value are infinite:
+        statistics = MarkerStatistics.from_marker_table(marker_values, durations_ms)
+        occurrences = numpy.empty(len(marker_values), dtype=numpy.int32)
+        summary_rows = []
+        for value in numpy.unique(marker_values).tolist():
+            positions = numpy.flatnonzero(marker_values == value)
+            occurrences[positions] = numpy.arange(1, len(positions) + 1)
+            value_statistics = statistics.value_statistics[value]
+            if value_statistics.n_ended < value_statistics.occurrence:
+                summary_rows.append((positions[-1], value, value_statistics.occurrence, numpy.inf,
+                                     value_statistics.min, numpy.inf, numpy.inf))
+            else:
+                summary_rows.append((positions[-1], value, value_statistics.occurrence, value_statistics.mean,
+                                     value_statistics.min, value_statistics.max, value_statistics.total))
+        summary_rows.sort()
+
+        marker_columns = {'value': marker_values.astype(numpy.uint8),
+                          'duration_ms': durations_ms,
+                          'occurrence': occurrences,
+                          'start_time_s': start_times_ms / 1000,
+                          'end_time_s': end_times_ms / 1000}
+
+        # Add the deferral delay of the markers (deferral mode, see _set_value_deferred):
+        if entries and 'deferral_ms' in entries[0]:
+            deferrals_ms = numpy.fromiter((entry.get('deferral_ms', numpy.nan) for entry in entries),
+                                          dtype=numpy.float64, count=len(entries))
+            marker_columns['deferral_ms'] = deferrals_ms[changes][starts]
+
+        # Add the extra fields of the log entries of the markers (see _send_marker):
+        for name in self._marker_entry_fields:
+            marker_columns[name] = numpy.array([entries[i].get(name) for i in changes[starts].tolist()],
+                                               dtype=object)
+
+        summary_index = numpy.array([row[0] for row in summary_rows], dtype=numpy.int64)
+        summary_columns = {}
+        for i, (name, dtype) in enumerate(SUMMARY_DTYPES, start=1):
+            summary_columns[name] = numpy.array([row[i] for row in summary_rows], dtype=dtype)
+
+        return marker_columns, summary_columns, summary_index
+
+    def gen_marker_arrays(self):
+        """Generates the marker tables as numpy structured arrays, for code that does not use pandas.
+
+        The arrays have the same typed columns as the dataframes of gen_marker_table (without wall-clock times):
+        uint8 value, int32 occurrence and float64 times and durations, and str errors.
+
+        Returns: marker array, summary array and error array
+        """
+
+        self._flush_critical_log()
+        snapshot = self._log_snapshot()
+        marker_columns, summary_columns, _ = self._marker_table_columns(snapshot)
+
+        errors = list(snapshot['error_list'])
+        error_columns = {'error': numpy.array([error['error'] for error in errors], dtype=str),
+                         'time_s': numpy.array([error['time_ms'] for error in errors], dtype=numpy.float64) / 1000}
+
+        return tuple(structured_array(columns) for columns in (marker_columns, summary_columns, error_columns))
+
     def print_marker_table(self):
-        """Prints marker table, summary table and error table, generated with gen_marker_table."""
+        """Prints marker table, summary table and error table, generated with gen_marker_table.
+
+        This regenerates the full tables, to monitor a running session use live_view.LiveTableView, which only
+        prints what is new.
+        """
 
         # Import pretty table when necessary:
         from prettytable import PrettyTable
@@ -485,33 +1211,107 @@ class MarkerManager:
         print(summary_table)
         print(marker_table)
 
-    def save_marker_table(self, filename="", location=os.getcwd(), more_info=""):
-        """Saves the marker table, summary table and error table in one TSV file.
+    def save_marker_table(self, filename="", location=None, more_info="", time_reference=None,
+                          file_format='tsv'):
+        """Saves the marker table, summary table and error table in one TSV file, or as three Parquet files.
+
+        The TSV file also gets the running statistics of the marker durations (see live_summary), taken together
+        with the logs, in its statistics section (see marker_io.read_marker_tsv).
+
+        The header includes the clock alignment fit (reference point, drift and fit quality), which
+        can be used to convert the marker times to wall-clock time.
+
+        With file_format='parquet', the tables are saved as typed columnar files <name>_markers.parquet,
+        <name>_summary.parquet and <name>_errors.parquet, with the header in their metadata (this requires
+        pyarrow, see marker_io). They can be read with marker_io.read_marker_parquet.
+
+        The files are written to a temporary file first and then renamed, so a file is never partially written.
+        See save_marker_table_async to save without blocking.
 
         Args:
             filename: The filename the .tsv should have
-            location: The location where the marker table should be saved
+            location: The location where the marker table should be saved (None: the current working directory)
             more_info: More information can be added to the header. Should be a dict with key-value pairs.
+            time_reference: None, 'utc' or 'wall', adds wall-clock timestamps to the tables (see gen_marker_table)
+            file_format: 'tsv' or 'parquet'
+
+        Returns: the file name of the TSV file, or a dict with table name as key and Parquet file name as value
+
+        Raises:
+            MarkerManagerError: When input is not correct or the location has no writing permission.
+            MarkerFileError: When file_format is 'parquet' and pyarrow is not installed.
+        """
+        return self._write_marker_tables(*self._prepare_save(filename, location, more_info, time_reference,
+                                                             file_format))
+
+    def save_marker_table_async(self, filename="", location=None, more_info="", time_reference=None,
+                                file_format='tsv'):
+        """Saves the marker tables (see save_marker_table) on a background thread.
+
+        The logs are snapshotted on the calling thread (which copies references to the in-memory entries
+        only), the tables are generated and written on a worker thread. Saves are done one at a time, in
+        the order in which they were requested.
+
+        The worker thread shares the interpreter lock with the thread that sends markers, so markers that are sent
+        while a save is running can be delayed by up to the thread switch interval (sys.getswitchinterval(),
+        5 ms by default). Start the save at a point without critical markers, e.g. at the end of a block.
+
+        Args:
+            see save_marker_table
+
+        Returns: concurrent.futures.Future, which results in the file name(s) (see save_marker_table) or raises the
+            error of the save
+
         Raises:
             MarkerManagerError: When input is not correct or the location has no writing permission.
         """
 
+        save_args = self._prepare_save(filename, location, more_info, time_reference, file_format)
+        if self._save_executor is None:
+            self._save_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1,
+                                                                        thread_name_prefix='marker-save')
+        return self._save_executor.submit(self._write_marker_tables, *save_args)
+
+    def _prepare_save(self, filename, location, more_info, time_reference, file_format):
+        """Checks the save arguments, snapshots the logs and returns the arguments of _write_marker_tables."""
+
+        if location is None:
+            location = os.getcwd()
+
         # Check input
         if not isinstance(filename, str):
             err_msg = f'filename should be string, got type {type(filename)}'
-            raise MarkerManagerError(err_msg)
+            Eid = "FilenameString"
+            raise MarkerManagerError(err_msg, Eid)
 
         if more_info != "" and not isinstance(more_info, dict):
             err_msg = f"more_info should be dict, got {type(more_info)}"
-            raise MarkerManagerError(err_msg)
+            Eid = "MoreInfoDict"
+            raise MarkerManagerError(err_msg, Eid)
+
+        if file_format not in ('tsv', 'parquet'):
+            err_msg = f"file_format can only be 'tsv' or 'parquet', got {file_format}"
+            Eid = "FileFormat"
+            raise MarkerManagerError(err_msg, Eid)
+
+        if time_reference not in (None, 'utc', 'wall'):
+            err_msg = f"time_reference can only be None, 'utc' or 'wall', got {time_reference}"
+            Eid = "TimeReference"
+            raise MarkerManagerError(err_msg, Eid)
 
         # Check if location has writing permission
         if not os.access(location, os.W_OK):
             err_msg = f'No writing permissions in {location}. Marker table cannot be saved.'
-            raise MarkerManagerError(err_msg)
+            Eid = "LocationWritePermission"
+            raise MarkerManagerError(err_msg, Eid)
 
-        # Generate most up-to-date marker table
-        marker_df, summary_df, error_df = self.gen_marker_table()
+        # Add a clock alignment sample at the end of the session and snapshot the logs, together with the running
+        # statistics (so the saved statistics are those of the saved markers, without regenerating them):
+        self._flush_critical_log()
+        self.clock_alignment.sample()
+        with self._send_lock:
+            snapshot = self._log_snapshot()
+            snapshot['statistics_df'] = self.marker_statistics.summary()
 
         # Get cur date and time
         cur_date_time = datetime.datetime.now()
@@ -523,39 +1323,84 @@ class MarkerManager:
         else:
             fn = filename + '.tsv'
 
-        full_fn = location + '\\' + fn
-
         # Get date
         date_str = cur_date_time.strftime("%Y-%m-%d %H:%M:%S")
 
+        header = self._marker_table_header(date_str, more_info, snapshot['clock_alignment'])
+
+        return snapshot, location, fn, header, time_reference, file_format
+
+    def _write_marker_tables(self, snapshot, location, fn, header, time_reference, file_format):
+        """Generates the marker tables from a snapshot and writes them (atomically), returns the file name(s)."""
+
+        marker_df, summary_df, error_df = self._gen_marker_table(snapshot, time_reference)
+
+        if file_format == 'parquet':
+            # Write the three files in a temporary directory next to the destination, then move them
+            temp_location = tempfile.mkdtemp(prefix='.marker_table_', dir=location)
+            try:
+                temp_file_names = marker_io.write_marker_parquet(
+                    os.path.join(temp_location, os.path.splitext(fn)[0]), marker_df, summary_df, error_df, header)
+                file_names = marker_io.parquet_file_names(os.path.join(location, os.path.splitext(fn)[0]))
+                for table_name, temp_file_name in temp_file_names.items():
+                    os.replace(temp_file_name, file_names[table_name])
+            finally:
+                shutil.rmtree(temp_location, ignore_errors=True)
+            return file_names
+
+        full_fn = os.path.join(location, fn)
+        statistics_df = snapshot['statistics_df']
+
         # Convert data to series
         summary_df.squeeze()
         marker_df.squeeze()
         error_df.squeeze()
 
-        # Write data to tsv file
-        with open(full_fn, 'w', newline='') as file_out:
-            writer = csv.writer(file_out, delimiter='\t')
-            writer.writerow(['Date: ' + date_str])
-            writer.writerow(['Library version: ' + LIB_VERSION])
-            writer.writerow(['Device: ' + self.device_properties.get('Device')])
-            writer.writerow(['Device serialno: ' + self.device_properties.get('Serialno')])
-            writer.writerow(['Device version: ' + self.device_properties.get('Version')])
-            if isinstance(more_info, dict):
-                for key, value in more_info.items():
-                    writer.writerow([key + ': ' + str(value)])
-            writer.writerow('')
-            writer.writerow(['#Summary#'])
-            writer.writerow(summary_df.head())
-            writer.writerows(summary_df.values)
-            writer.writerow('')
-            writer.writerow(['#Markers#'])
-            writer.writerow(marker_df.head())
-            writer.writerows(marker_df.values)
-            writer.writerow('')
-            writer.writerow(['#Errors#'])
-            writer.writerow(error_df.head())
-            writer.writerows(error_df.values)
+        # Write data to a temporary tsv file, and rename it when it is complete
+        file_descriptor, temp_fn = tempfile.mkstemp(prefix='.' + fn, suffix='.tmp', dir=location)
+        try:
+            with open(file_descriptor, 'w', newline='') as file_out:
+                writer = csv.writer(file_out, delimiter='\t')
+                for key, value in header.items():
+                    writer.writerow([key + ': ' + value])
+                writer.writerow('')
+                writer.writerow(['#Summary#'])
+                writer.writerow(summary_df.head())
+                writer.writerows(summary_df.itertuples(index=False, name=None))
+                writer.writerow('')
+                writer.writerow(['#Markers#'])
+                writer.writerow(marker_df.head())
+                writer.writerows(marker_df.itertuples(index=False, name=None))
+                writer.writerow('')
+                writer.writerow(['#Errors#'])
+                writer.writerow(error_df.head())
+                writer.writerows(error_df.values)
+                writer.writerow('')
+                writer.writerow(['#Statistics#'])
+                writer.writerow(statistics_df.head())
+                writer.writerows(statistics_df.itertuples(index=False, name=None))
+            os.replace(temp_fn, full_fn)
+        except BaseException:
+            if os.path.exists(temp_fn):
+                os.remove(temp_fn)
+            raise
+
+        return full_fn
+
+    def _marker_table_header(self, date_str, more_info, clock_alignment=None):
+        """Returns the header of the saved marker tables as a dict (key and value are strings)."""
+        if clock_alignment is None:
+            clock_alignment = self.clock_alignment
+        header = {'Date': date_str,
+                  'Library version': LIB_VERSION,
+                  'Device': self.device_properties.get('Device'),
+                  'Device serialno': self.device_properties.get('Serialno'),
+                  'Device version': self.device_properties.get('Version')}
+        header.update(clock_alignment.header_info())
+        if isinstance(more_info, dict):
+            for key, value in more_info.items():
+                header[key] = str(value)
+        return header
 
 
 class MarkerError(Exception):
@@ -646,18 +1491,52 @@ class SerialDevice(DeviceInterface):
         _device_properties: the device properties (e.g.
             {"Version":"HW1:SW1.1","Serialno":"S01234","Device":"UsbParMarker"})
         serial_device = the serial device
+        recorder: virtual recorder that receives the values of a fake device (see virtual_recorder.VirtualRecorder)
+        tracepoints: tracepoint registry of the command_start and command_end tracepoints (see tracepoints)
+        fast_start: when True, the device is ready to send markers as soon as the port is opened, and the device
+            properties are fetched (in command mode) when they are first read, e.g. when the marker table is saved
+        _device_lock: lock held during a command exchange and during a marker write, so that markers that are
+            sent from other threads (e.g. in deferral or thread-safe mode) wait until the port is back in data mode
 
     """
-    def __init__(self, device_address):
+
+    recorder = None
+    tracepoints = None
+
+    def __init__(self, device_address, fast_start=False):
 
         # Save attribs:
         self._device_address = device_address
+        self.fast_start = fast_start
+        self._properties_lock = threading.Lock()
+        self._device_lock = threading.RLock()
+        self._device_properties = None
 
         if not device_address == FAKE_ADDRESS:
 
             # Open device:
             self.open_serial_device()
-            timing.delay(100)
+
+            if not fast_start:
+                timing.delay(100)
+                self.fetch_device_properties()
+
+        # return fake device
+        else:
+            self._device_properties = {"Version": "0000000",
+                                       "Serialno": "0000000",
+                                       "Device": FAKE_DEVICE}
+
+    def fetch_device_properties(self):
+        """Gets the device properties from the device (command mode), if they were not fetched yet.
+
+        Raises:
+            SerialError: when the device does not respond, or the reply has no serial number
+        """
+
+        with self._properties_lock:
+            if self._device_properties is not None:
+                return
 
             # Example: {"Version":"HW1:SW1.2","Serialno":"S01234","Device":"UsbParMar"}
             properties = self.get_info()
@@ -672,13 +1551,7 @@ class SerialDevice(DeviceInterface):
                 Eid = "NoSerialNo"
                 raise SerialError(err_msg, Eid)
 
-        # return fake device
-        else:
-            properties = {"Version": "0000000",
-                          "Serialno": "0000000",
-                          "Device": FAKE_DEVICE}
-
-        self._device_properties = properties    
+            self._device_properties = properties
 
     @property
     def device_address(self):
@@ -687,14 +1560,24 @@ class SerialDevice(DeviceInterface):
 
     @property
     def device_properties(self):
-        """Returns device properties."""
+        """Returns device properties (with fast_start, they are fetched from the device on the first read)."""
+        if self._device_properties is None:
+            self.fetch_device_properties()
         return self._device_properties
 
     def _set_value(self, value):
-        """Sets the value of the serial device."""
+        """Sets the value of the serial device (a fake device passes it to its recorder, if any)."""
+        if not self.is_fake:
+            self._write_port(value)
+        elif self.recorder is not None:
+            self.recorder.record(value)
+
+    def _write_port(self, value):
+        """Writes a value to the port only (not to a recorder, a fake device does nothing), see
+        MarkerManager.calibrate_write_overhead."""
         if not self.is_fake:
-            value_byte = value.to_bytes(1, 'big')
-            self.serial_device.write(value_byte)
+            with self._device_lock:
+                self.serial_device.write(VALUE_BYTES[value])
 
     def _close(self):
         """Closes the serial connection."""
@@ -734,7 +1617,19 @@ class SerialDevice(DeviceInterface):
         self.open_serial_device(params=command_params)
 
     def send_command(self, command):
-        """Sends command to serial device."""
+        """Sends command to serial device (markers are not written until the device is back in data mode)."""
+
+        with self._device_lock:
+            if self.tracepoints is None:
+                return self._send_command(command)
+
+            self.tracepoints.fire('command_start', info=command)
+            reply = self._send_command(command)
+            self.tracepoints.fire('command_end', info=reply)
+            return reply
+
+    def _send_command(self, command):
+        """Sends command to serial device (see send_command)."""
 
         if self.is_fake:
             err_msg = "Fake device is not allowed to send commands."
@@ -836,11 +1731,11 @@ class UsbParMarker(SerialDevice):
 
     """    
 
-    def __init__(self, device_address):
+    def __init__(self, device_address, fast_start=False):
         # Set device address
 
         self._device_address = device_address
-        super().__init__(self._device_address)    
+        super().__init__(self._device_address, fast_start)
 
     def leds_on(self):
         """Turns led lights on"""
@@ -869,17 +1764,18 @@ class Eva(SerialDevice):
 
     """   
 
-    def __init__(self, device_address):
-        # SEt device address and check if Eva is in active mode
+    def __init__(self, device_address, fast_start=False):
+        # SEt device address and check if Eva is in active mode (also with fast_start, a passive Eva sends no markers)
 
         self._device_address = device_address
+        self._device_lock = threading.RLock()
 
         if self.get_mode().strip() != "Mode:Active":
             err_msg = "Cannot use Eva. Eva is in passive mode, make sure Eva is in active mode. See https://github.com/solo-fsw/Eva/tree/main for more info."
             Eid = "EvaMode"
             raise SerialError(err_msg, Eid)         
 
-        super().__init__(self._device_address)
+        super().__init__(self._device_address, fast_start)
 
     def set_active_mode(self):
         """Set into active mode"""
@@ -898,6 +1794,31 @@ class Eva(SerialDevice):
 
 
 # Helper functions:
+def structured_array(columns):
+    """Returns a numpy structured array with the columns of a dict (column name: numpy array of equal length)."""
+    dtype = [(name, column.dtype) for name, column in columns.items()]
+    length = len(next(iter(columns.values()))) if columns else 0
+    array = numpy.empty(length, dtype=dtype)
+    for name, column in columns.items():
+        array[name] = column
+    return array
+
+
+def snapshot_log(log):
+    """Returns a snapshot of a log (list or SpillLog) that can be iterated while the log grows."""
+    if isinstance(log, SpillLog):
+        return log.snapshot()
+    return list(log)
+
+
+def marker_error_message(Eid, value, last_value, concurrent_marker_threshold_ms):
+    """Returns the error message of a non-fatal marker sequence error."""
+    if Eid == "MarkerSentTwice":
+        return f"Marker with value {value} is sent twice in a row."
+    return f"Marker with value {value} was sent within {concurrent_marker_threshold_ms} " \
+           f"ms after previous marker with value {last_value}"
+
+
 def whole_number(value):
     """Evaluate whether value is whole number."""
     try:
@@ -907,6 +1828,15 @@ def whole_number(value):
         raise (MarkerManagerError('error whole number'))
 
 
+def bit_mask(bit):
+    """Returns the value mask of a bit, where bit 0 is the MSB (see MarkerManager.set_bit)."""
+    if not whole_number(bit) or bit < 0 or bit > 7:
+        err_msg = "bit should be whole number between 0 and 7"
+        Eid = "BitTypeRange"
+        raise MarkerError(err_msg, True, Eid)
+    return 1 << (7 - int(bit))
+
+
 def gen_com_filters(device_regex='^.*$',
                     port_regex='^.*$',
                     sn_regex='^.*$',
@@ -0,0 +1,308 @@
+"""Multi-Process Marker Server
+
+Only one process can open the serial port of a marker device. The marker server owns the MarkerManager
+(and with that the device), and accepts marker requests from client processes (e.g. the eye-tracker,
+audio and stimulus processes) over local IPC: Unix domain sockets on Linux and named pipes on Windows
+(multiprocessing.connection).
+
+Requests are timestamped by the client, with the same monotonic clock as the marker log (GS_timing.millis
+is system-wide), and every client has its own server thread, so a request is sent as soon as it arrives.
+Markers of all clients end up in one log, and the marker and error tables get the client that sent each
+marker, its client time and the delivery latency (log time minus client time).
+
+Example:
+    # In the process that owns the device:
+    server = MarkerServer('UsbParMarker', 'COM3', address=r'\\\\.\\pipe\\markers').start()
+
+    # In a client process:
+    with MarkerClient(r'\\\\.\\pipe\\markers', name='eyetracker') as client:
+        client.set_value(12)
+
+Usage (stand-alone server, saves the marker table on Ctrl+C):
+    python -m python_markers.marker_server --device-type UsbParMarker --device-address COM3 --address <address>
+
+"""
+
+import argparse
+import os
+import sys
+import threading
+from multiprocessing.connection import Listener, Client
+
+import python_markers.GS_timing as timing
+from python_markers.marker_management import MarkerManager, MarkerError, FAKE_ADDRESS, FAKE_DEVICE
+
+# Client name of markers sent by the server process itself
+LOCAL_CLIENT = 'server'
+
+
+class AttributedMarkerManager(MarkerManager):
+    """MarkerManager that can be shared by several threads and attributes every marker to a client.
+
+    set_value is serialized (with _send_lock, or by the deferral thread in deferral mode), the client and client
+    time are stored in the set_value_list and error_list entries, and the marker and error tables (see
+    gen_marker_table) have the extra columns client, client_time_s and latency_ms (markers) and client (errors).
+    """
+
+    _marker_entry_fields = ('client', 'client_time_ms')
+
+    def set_value(self, value, client=LOCAL_CLIENT, client_time_ms=None):
+        """Sets the marker value (see MarkerManager.set_value) on behalf of a client.
+
+        Args:
+            value: the marker value
+            client: name of the client that sent the marker
+            client_time_ms: time at which the client sent the marker (None: not known)
+
+        Returns: the time of the marker in set_value_list (None when the marker was queued in deferral mode)
+        """
+
+        fields = {'client': client, 'client_time_ms': client_time_ms}
+        if self._deferred_markers is not None:
+            return self._set_value_deferred(value, fields)
+
+        with self._send_lock:
+            return self._send_marker(value, self._time_function_ms(), fields=fields)
+
+    def _gen_marker_table(self, snapshot, time_reference=None):
+        """Generates the marker tables (see MarkerManager.gen_marker_table) with client attribution columns."""
+
+        marker_df, summary_df, error_df = super()._gen_marker_table(snapshot, time_reference)
+
+        clients = marker_df.pop('client')
+        client_times_ms = marker_df.pop('client_time_ms').astype(float)
+        marker_df['client'] = clients.fillna('')
+        marker_df['client_time_s'] = client_times_ms / 1000
+        marker_df['latency_ms'] = (marker_df['start_time_s'] - marker_df['client_time_s']) * 1000
+
+        if len(error_df) > 0:
+            # Errors that were not logged by set_value (e.g. device outages) have no client
+            error_clients = error_df.pop('client') if 'client' in error_df else ''
+            error_df.drop(columns=['client_time_ms'], errors='ignore', inplace=True)
+            error_df['client'] = error_clients
+            error_df['client'] = error_df['client'].fillna('')
+
+        return marker_df, summary_df, error_df
+
+
+class MarkerServer:
+    """Marker server that owns an AttributedMarkerManager and serves marker requests of client processes.
+
+    Attributes:
+        marker_manager:
+            the AttributedMarkerManager that sends the markers
+        address:
+            address of the server (path of the Unix socket or name of the pipe), used by the clients
+        client_names:
+            names of the clients that connected, in order of connection
+        device_properties:
+            properties of the marker device, sent to the clients when they connect. They are read in start, before
+            clients can send markers, so a fast_start device is not put in command mode in the middle of a session
+            (None before start)
+    """
+
+    def __init__(self, device_type, device_address=FAKE_ADDRESS, address=None, authkey=None, **kwargs):
+        """Initializes MarkerServer, creates the MarkerManager and starts listening.
+
+        Args:
+            device_type, device_address: see MarkerManager
+            address: address to listen on (None: a free address is chosen, see the address attribute)
+            authkey: optional bytes key that clients need to connect
+            kwargs: other MarkerManager arguments (e.g. crash_on_marker_errors, max_log_length)
+        """
+
+        self.marker_manager = AttributedMarkerManager(device_type, device_address, **kwargs)
+        self._authkey = authkey
+        self._listener = Listener(address, authkey=authkey)
+        self.address = self._listener.address
+        self.client_names = []
+        self.device_properties = None
+        self._connections = []
+        self._closed = False
+        self._accept_thread = threading.Thread(target=self._accept_loop, name='marker-server-accept', daemon=True)
+
+    def start(self):
+        """Reads the device properties, starts accepting clients (in a background thread) and returns the server."""
+        self.device_properties = dict(self.marker_manager.device_properties)
+        self._accept_thread.start()
+        return self
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                connection = self._listener.accept()
+            except (OSError, EOFError):
+                # Listener closed, or a client that failed the authentication
+                continue
+            if self._closed:
+                connection.close()
+                break
+            self._connections.append(connection)
+            threading.Thread(target=self._serve_client, args=(connection,), name='marker-server-client',
+                             daemon=True).start()
+
+    def _serve_client(self, connection):
+        """Handles the requests of one client until it disconnects."""
+
+        client = f'client{len(self.client_names) + 1}'
+        try:
+            while True:
+                request = connection.recv()
+                command = request[0]
+
+                if command == 'set_value':
+                    _, value, client_time_ms, wait = request
+                    try:
+                        # The log time of this marker (read under the send lock, not that of another client):
+                        reply = ('ok', self.marker_manager.set_value(value, client, client_time_ms))
+                    except MarkerError as e:
+                        reply = ('error', e.message, e.is_fatal, e.id)
+                    if wait:
+                        connection.send(reply)
+
+                elif command == 'hello':
+                    client = request[1] or client
+                    self.client_names.append(client)
+                    connection.send(('ok', self.device_properties))
+
+                elif command == 'bye':
+                    break
+
+        except (EOFError, OSError):
+            # Client disconnected (or the server is closing)
+            pass
+        finally:
+            connection.close()
+
+    def set_value(self, value):
+        """Sets the marker value from the server process itself."""
+        self.marker_manager.set_value(value, LOCAL_CLIENT, self.marker_manager._time_function_ms())
+
+    def close(self):
+        """Stops accepting clients, disconnects the clients and closes the MarkerManager."""
+
+        if self._closed:
+            return
+        self._closed = True
+
+        # Wake up the accept thread:
+        if self._accept_thread.is_alive():
+            try:
+                Client(self.address, authkey=self._authkey).close()
+            except (OSError, EOFError):
+                pass
+            self._accept_thread.join(timeout=5)
+        self._listener.close()
+
+        for connection in self._connections:
+            connection.close()
+
+        self.marker_manager.close()
+        MarkerManager.marker_manager_instances.remove(self.marker_manager)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class MarkerClient:
+    """Sends markers to a MarkerServer from another process.
+
+    Attributes:
+        name:
+            name of the client, used in the attribution columns of the marker tables
+        device_properties:
+            properties of the marker device of the server
+    """
+
+    def __init__(self, address, name=None, authkey=None, time_function_ms=lambda: timing.millis()):
+        """Connects to a MarkerServer.
+
+        Args:
+            address: address of the server (see MarkerServer.address)
+            name: see Attributes (None: client<pid>)
+            authkey: key of the server (when it has one)
+            time_function_ms: function to get the current time in ms, should be the clock of the server's MarkerManager
+        """
+
+        self.name = name if name is not None else f'client{os.getpid()}'
+        self._time_function_ms = time_function_ms
+        self._connection = Client(address, authkey=authkey)
+        self._connection.send(('hello', self.name))
+        _, self.device_properties = self._connection.recv()
+
+    def set_value(self, value, wait=True):
+        """Sets the marker value (see MarkerManager.set_value).
+
+        Args:
+            value: the marker value
+            wait: when True, wait until the server has sent the marker and raise its errors (MarkerError), else
+                return immediately after the request is sent
+
+        Returns: the log time of the marker on the server (None when wait is False, or when the server queued the
+            marker in deferral mode)
+        """
+
+        self._connection.send(('set_value', value, self._time_function_ms(), wait))
+        if not wait:
+            return None
+
+        reply = self._connection.recv()
+        if reply[0] == 'error':
+            _, err_msg, is_fatal, Eid = reply
+            raise MarkerError(err_msg, is_fatal, Eid)
+        return reply[1]
+
+    def send_marker_pulse(self, value, duration_ms=100):
+        """Sends a short marker pulse (blocking), and resets to 0 afterwards"""
+        self.set_value(value)
+        timing.delay(duration_ms)
+        self.set_value(0)
+
+    def close(self):
+        """Disconnects from the server."""
+        if self._connection is None:
+            return
+        try:
+            self._connection.send(('bye',))
+        except OSError:
+            pass
+        self._connection.close()
+        self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def main(argv=None):
+    """Command-line entry point (see module docstring)."""
+
+    parser = argparse.ArgumentParser(description="Marker server that sends the markers of client processes.")
+    parser.add_argument('--device-type', default=FAKE_DEVICE, help="marker device (default: fake device)")
+    parser.add_argument('--device-address', default=FAKE_ADDRESS, help="address of the marker device (e.g. COM3)")
+    parser.add_argument('--address', default=None, help="address to listen on (socket path or pipe name)")
+    parser.add_argument('--save', default='', help="file name of the marker table, saved on exit")
+    args = parser.parse_args(argv)
+
+    server = MarkerServer(args.device_type, args.device_address, args.address, crash_on_marker_errors=False)
+    server.start()
+    print(f"Marker server listening on {server.address} (Ctrl+C to stop)")
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.save:
+            server.marker_manager.save_marker_table(args.save, more_info={'Clients': ', '.join(server.client_names)})
+        server.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
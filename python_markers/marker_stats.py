@@ -0,0 +1,259 @@
+"""Streaming Per-Value Marker Statistics
+
+MarkerStatistics is updated by MarkerManager.set_value as markers end, so the statistics of a running
+session are always available (see MarkerManager.live_summary) at a cost that does not grow with the
+session. The same statistics are built from the markers of a marker table (see from_marker_table) for the
+summary table of gen_marker_table, and are updated per logged value by live_view.LiveTableView and
+replay (see update, which returns the marker that ended).
+
+Per marker value it keeps the count, mean and variance of the durations (Welford's online algorithm), the
+minimum, maximum and total, and a DurationSketch for approximate percentiles.
+
+DurationSketch is a logarithmic histogram in the style of DDSketch: a duration x is counted in bucket
+ceil(log(x) / log(gamma)), with gamma = (1 + a) / (1 - a) for relative accuracy a. A quantile is returned
+as the midpoint of its bucket (clamped to the minimum and maximum duration), which is within a relative
+error a of the exact quantile, and the number of buckets only grows with the logarithm of the range of the
+durations.
+
+"""
+
+import math
+
+import numpy
+import pandas
+
+# Default relative accuracy of the percentiles
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# Percentiles in the statistics table
+PERCENTILES = (50, 90, 99)
+
+# Columns of the statistics table
+STATISTICS_COLUMNS = ['value', 'occurrence', 'n_ended', 'mean_duration_ms', 'std_duration_ms', 'min_duration_ms',
+                      'max_duration_ms', 'total_duration_ms'] + [f'p{percentile}_duration_ms'
+                                                                   for percentile in PERCENTILES]
+
+
+class DurationSketch:
+    """Approximate quantiles of non-negative durations with a bounded relative error.
+
+    Attributes:
+        relative_accuracy:
+            maximum relative error of the quantiles
+        count:
+            number of added durations
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        """Initializes DurationSketch
+
+        Args:
+            relative_accuracy: see Attributes
+        """
+
+        self.relative_accuracy = relative_accuracy
+        self.count = 0
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._buckets = {}
+        self._zero_count = 0
+        self._min = math.inf
+        self._max = -math.inf
+
+    def add(self, duration):
+        """Adds a duration."""
+        self.count += 1
+        self._min = min(self._min, duration)
+        self._max = max(self._max, duration)
+        if duration <= 0:
+            self._zero_count += 1
+            return
+        key = math.ceil(math.log(duration) / self._log_gamma)
+        self._buckets[key] = self._buckets.get(key, 0) + 1
+
+    def add_array(self, durations):
+        """Adds the durations of a numpy array (vectorized)."""
+        if len(durations) == 0:
+            return
+        self.count += len(durations)
+        self._min = min(self._min, durations.min())
+        self._max = max(self._max, durations.max())
+        positive = durations[durations > 0]
+        self._zero_count += len(durations) - len(positive)
+        keys, counts = numpy.unique(numpy.ceil(numpy.log(positive) / self._log_gamma).astype(numpy.int64),
+                                    return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self._buckets[key] = self._buckets.get(key, 0) + count
+
+    def quantile(self, q):
+        """Returns the approximate q-quantile (0 <= q <= 1) of the added durations (nan when empty)."""
+
+        if self.count == 0:
+            return math.nan
+
+        rank = q * (self.count - 1)
+        cumulative = self._zero_count
+        if rank < cumulative:
+            return min(max(0.0, self._min), self._max)
+        key = max(self._buckets)
+        for bucket_key in sorted(self._buckets):
+            cumulative += self._buckets[bucket_key]
+            if rank < cumulative:
+                key = bucket_key
+                break
+        # The midpoint of the bucket can be outside the observed range
+        return min(max(2 * self._gamma ** key / (self._gamma + 1), self._min), self._max)
+
+
+class RunningStatistics:
+    """Running statistics of the durations of the markers of one value.
+
+    Attributes:
+        occurrence:
+            number of markers that started (including a marker that is still running)
+        n_ended:
+            number of markers that ended
+        mean:
+            mean duration (ms) of the ended markers
+        min, max, total:
+            minimum, maximum and total duration (ms) of the ended markers
+        sketch:
+            DurationSketch of the durations
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.occurrence = 0
+        self.n_ended = 0
+        self.mean = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.total = 0.0
+        self.sketch = DurationSketch(relative_accuracy)
+        self._m2 = 0.0
+
+    def add(self, duration):
+        """Adds the duration (ms) of an ended marker (Welford's algorithm)."""
+        self.n_ended += 1
+        delta = duration - self.mean
+        self.mean += delta / self.n_ended
+        self._m2 += delta * (duration - self.mean)
+        self.min = min(self.min, duration)
+        self.max = max(self.max, duration)
+        self.total += duration
+        self.sketch.add(duration)
+
+    def add_array(self, durations):
+        """Adds the durations (ms) of ended markers from a numpy array (vectorized, Chan's parallel algorithm)."""
+        n = len(durations)
+        if n == 0:
+            return
+        mean = durations.mean()
+        m2 = ((durations - mean) ** 2).sum()
+        if self.n_ended == 0:
+            self.mean, self._m2 = mean, m2
+        else:
+            n_ended = self.n_ended + n
+            delta = mean - self.mean
+            self.mean += delta * n / n_ended
+            self._m2 += m2 + delta ** 2 * self.n_ended * n / n_ended
+        self.n_ended += n
+        self.min = min(self.min, durations.min())
+        self.max = max(self.max, durations.max())
+        self.total += durations.sum()
+        self.sketch.add_array(durations)
+
+    @property
+    def variance(self):
+        """Sample variance of the durations (nan for less than two ended markers)."""
+        return self._m2 / (self.n_ended - 1) if self.n_ended > 1 else math.nan
+
+    def row(self, value):
+        """Returns the row of the statistics table."""
+        if self.n_ended == 0:
+            return [value, self.occurrence, 0] + [math.nan] * (len(STATISTICS_COLUMNS) - 3)
+        return [value, self.occurrence, self.n_ended, self.mean, math.sqrt(self.variance), self.min, self.max,
+                self.total] + [self.sketch.quantile(percentile / 100) for percentile in PERCENTILES]
+
+
+class MarkerStatistics:
+    """Running per-value statistics of the marker durations, updated with every logged marker value.
+
+    Markers start and end as in MarkerManager.gen_marker_table: a marker starts when the value changes to
+    non-zero and ends at the next value change.
+
+    Attributes:
+        value_statistics:
+            dict with marker value as key and RunningStatistics as value
+        relative_accuracy:
+            relative accuracy of the percentiles
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        """Initializes MarkerStatistics
+
+        Args:
+            relative_accuracy: see Attributes
+        """
+
+        self.relative_accuracy = relative_accuracy
+        self.value_statistics = {}
+        self._last_value = None
+        self._running_marker = None
+
+    @classmethod
+    def from_marker_table(cls, values, durations_ms, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        """Returns the statistics of the markers of a marker table (vectorized).
+
+        Args:
+            values: numpy array with the values of the markers
+            durations_ms: numpy array with the durations of the markers (inf for a marker that did not end, which
+                only counts in occurrence)
+            relative_accuracy: see Attributes
+        """
+
+        marker_statistics = cls(relative_accuracy)
+        for value in numpy.unique(values).tolist():
+            value_durations = durations_ms[values == value]
+            statistics = marker_statistics.value_statistics[value] = RunningStatistics(relative_accuracy)
+            statistics.occurrence = len(value_durations)
+            statistics.add_array(value_durations[numpy.isfinite(value_durations)])
+        return marker_statistics
+
+    @property
+    def running_marker(self):
+        """Returns the running marker as (value, occurrence, start time in ms), None if no marker is running."""
+        return self._running_marker
+
+    def update(self, value, time_ms):
+        """Updates the statistics with a logged marker value.
+
+        Returns: the marker that ended as (value, occurrence, start time, end time), None if no marker ended
+        """
+
+        if value == self._last_value:
+            return None
+        self._last_value = value
+
+        ended_marker = None
+        if self._running_marker is not None:
+            running_value, occurrence, start_time_ms = self._running_marker
+            self.value_statistics[running_value].add(time_ms - start_time_ms)
+            ended_marker = (running_value, occurrence, start_time_ms, time_ms)
+            self._running_marker = None
+
+        if value != 0:
+            statistics = self.value_statistics.get(value)
+            if statistics is None:
+                statistics = self.value_statistics[value] = RunningStatistics(self.relative_accuracy)
+            statistics.occurrence += 1
+            self._running_marker = (value, statistics.occurrence, time_ms)
+
+        return ended_marker
+
+    def summary(self):
+        """Returns the statistics table (DataFrame, one row per value, sorted by value).
+
+        The durations are those of the markers that ended, a running marker only counts in occurrence.
+        """
+        rows = [self.value_statistics[value].row(value) for value in sorted(self.value_statistics)]
+        return pandas.DataFrame(rows, columns=STATISTICS_COLUMNS)
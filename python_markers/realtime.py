@@ -0,0 +1,178 @@
+"""Low-Jitter Real-Time Profile for the Marker Thread
+
+On a busy stimulus PC, marker writes and timing.delay spins can be preempted by the renderer or background
+daemons. This module contains an opt-in profile for the thread that writes markers (e.g. the thread that
+calls MarkerManager.set_value or ChannelScheduler.run) on Linux:
+    - CPU pinning (os.sched_setaffinity)
+    - SCHED_FIFO real-time scheduling, when permitted (needs root or CAP_SYS_NICE / an rtprio limit)
+    - locked memory (mlockall), so the thread is not delayed by page faults. This locks the memory of the
+      whole process, not only of the calling thread, and it is not undone by restore (other threads and
+      profiles can depend on it)
+
+Each step falls back cleanly when it is not permitted, and the profile reports which guarantees were
+actually obtained, together with the timing jitter measured before and after applying it.
+
+Example:
+    with RealtimeProfile(cpus={3}) as report:
+        print(report)
+        scheduler.run()
+
+"""
+
+import ctypes
+import ctypes.util
+import os
+import sys
+
+import numpy
+
+import python_markers.GS_timing as timing
+from python_markers.timing_profiler import summarize_samples
+
+# mlockall flags (see <sys/mman.h> on Linux)
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+
+def measure_jitter(n_samples=1000, delay_us=1000):
+    """Measures the timing jitter of the calling thread.
+
+    Runs n_samples busy-wait delays (GS_timing.delayMicroseconds) and measures how much each one
+    overshoots the requested delay. Preemption of the thread shows up as large overshoots.
+
+    Returns: summary statistics of the overshoot in microseconds (see summarize_samples)
+    """
+    overshoot_us = numpy.empty(n_samples)
+    for i in range(n_samples):
+        start_us = timing.micros()
+        timing.delayMicroseconds(delay_us)
+        overshoot_us[i] = timing.micros() - start_us - delay_us
+    return summarize_samples(overshoot_us)
+
+
+class RealtimeProfile:
+    """Opt-in real-time profile for the calling thread (Linux).
+
+    Attributes:
+        cpus:
+            set of CPU indexes to pin the thread to (None: do not pin)
+        fifo_priority:
+            SCHED_FIFO priority (1 - 99, None: do not change the scheduling policy)
+        lock_memory:
+            bool indicating whether all current and future memory of the process should be locked (process-wide,
+            and kept after restore)
+        jitter_samples:
+            number of delays used to measure the jitter before and after applying the profile (0: do not measure)
+        jitter_delay_us:
+            duration of each delay used for measuring the jitter
+        report:
+            dict with the outcome of the last apply (None before apply)
+    """
+
+    def __init__(self, cpus=None, fifo_priority=50, lock_memory=True, jitter_samples=500, jitter_delay_us=1000):
+        """Initializes RealtimeProfile
+
+        Args:
+            cpus: see Attributes
+            fifo_priority: see Attributes
+            lock_memory: see Attributes
+            jitter_samples: see Attributes
+            jitter_delay_us: see Attributes
+        """
+
+        if fifo_priority is not None and (not isinstance(fifo_priority, int) or not 1 <= fifo_priority <= 99):
+            raise ValueError(f"fifo_priority should be None or an int between 1 and 99, got {fifo_priority}")
+
+        self.cpus = set(cpus) if cpus is not None else None
+        self.fifo_priority = fifo_priority
+        self.lock_memory = lock_memory
+        self.jitter_samples = jitter_samples
+        self.jitter_delay_us = jitter_delay_us
+        self.report = None
+
+        # Original state, restored by restore()
+        self._original_affinity = None
+        self._original_scheduler = None
+
+    def apply(self):
+        """Applies the profile to the calling thread (the memory lock applies to the whole process).
+
+        Returns: report dict with, for each guarantee ('cpu_affinity', 'sched_fifo', 'memory_locked'), whether it
+            was requested and obtained (and the reason when it was not), and the jitter before and after.
+        """
+
+        report = {'platform': sys.platform}
+
+        if self.jitter_samples:
+            report['jitter_before_us'] = measure_jitter(self.jitter_samples, self.jitter_delay_us)
+
+        report['cpu_affinity'] = self._apply_affinity()
+        report['sched_fifo'] = self._apply_sched_fifo()
+        report['memory_locked'] = self._apply_memory_lock()
+
+        if self.jitter_samples:
+            report['jitter_after_us'] = measure_jitter(self.jitter_samples, self.jitter_delay_us)
+
+        self.report = report
+        return report
+
+    def _apply_affinity(self):
+        if self.cpus is None:
+            return {'requested': False, 'obtained': False}
+        if not hasattr(os, 'sched_setaffinity'):
+            return {'requested': True, 'obtained': False, 'reason': 'CPU affinity is only supported on Linux'}
+        try:
+            self._original_affinity = os.sched_getaffinity(0)
+            # On Linux, pid 0 is the calling thread
+            os.sched_setaffinity(0, self.cpus)
+        except OSError as e:
+            return {'requested': True, 'obtained': False, 'reason': str(e)}
+        return {'requested': True, 'obtained': True, 'cpus': sorted(os.sched_getaffinity(0))}
+
+    def _apply_sched_fifo(self):
+        if self.fifo_priority is None:
+            return {'requested': False, 'obtained': False}
+        if not hasattr(os, 'sched_setscheduler'):
+            return {'requested': True, 'obtained': False, 'reason': 'SCHED_FIFO is only supported on Linux'}
+        try:
+            self._original_scheduler = (os.sched_getscheduler(0), os.sched_getparam(0))
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.fifo_priority))
+        except OSError as e:
+            # Fall back to the normal scheduler (e.g. no permission)
+            self._original_scheduler = None
+            return {'requested': True, 'obtained': False, 'reason': str(e)}
+        return {'requested': True, 'obtained': True, 'priority': self.fifo_priority}
+
+    def _apply_memory_lock(self):
+        if not self.lock_memory:
+            return {'requested': False, 'obtained': False}
+        if not sys.platform.startswith('linux'):
+            return {'requested': True, 'obtained': False, 'reason': 'mlockall is only supported on Linux'}
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+            errno = ctypes.get_errno()
+            return {'requested': True, 'obtained': False, 'reason': os.strerror(errno)}
+        return {'requested': True, 'obtained': True}
+
+    def restore(self):
+        """Restores the original affinity and scheduling policy of the calling thread.
+
+        The memory lock is process-wide and is not undone: unlocking would also unlock the memory of other threads
+        that rely on it (call munlockall explicitly when nothing in the process needs it anymore).
+        """
+
+        if self._original_affinity is not None:
+            os.sched_setaffinity(0, self._original_affinity)
+            self._original_affinity = None
+
+        if self._original_scheduler is not None:
+            policy, param = self._original_scheduler
+            os.sched_setscheduler(0, policy, param)
+            self._original_scheduler = None
+
+
+    def __enter__(self):
+        return self.apply()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.restore()
@@ -0,0 +1,213 @@
+"""Replay of Marker Sessions
+
+To validate a recording setup, a real session can be replayed on any marker device: the markers of a
+saved marker table (or a raw set_value_list) are sent again with their original relative timing. The
+achieved onsets and durations (as logged by the MarkerManager) are compared with the intended ones, and
+the timing errors are reported per marker value.
+
+Example:
+    marker_manager = MarkerManager('UsbParMarker', 'COM3', crash_on_marker_errors=False)
+    comparison_df, report_df = replay_session(marker_manager, 'session.tsv')
+    print(report_df)
+
+"""
+
+import time
+
+import numpy
+import pandas
+
+import python_markers.marker_io as marker_io
+from python_markers.marker_stats import MarkerStatistics
+
+# Time (ms) before an event at which waiting switches from sleeping to busy-waiting
+DEFAULT_SPIN_MS = 2
+
+
+def schedule_from_marker_df(marker_df):
+    """Returns the set_value events (time_ms relative to the first marker, value) that reproduce a marker table.
+
+    Every marker starts with its value, and ends with 0 unless the next marker starts at its end time. Markers
+    that have not ended (infinite end time) are left on.
+    """
+
+    start_ms = marker_df['start_time_s'].to_numpy(dtype=numpy.float64) * 1000
+    end_ms = marker_df['end_time_s'].to_numpy(dtype=numpy.float64) * 1000
+    values = marker_df['value'].to_numpy(dtype=numpy.int64)
+    if len(values) == 0:
+        return []
+
+    events = []
+    for i in range(len(values)):
+        events.append((start_ms[i], int(values[i])))
+        next_start = start_ms[i + 1] if i + 1 < len(values) else None
+        if numpy.isfinite(end_ms[i]) and end_ms[i] != next_start:
+            events.append((end_ms[i], 0))
+
+    origin = start_ms[0]
+    return [(time_ms - origin, value) for time_ms, value in events]
+
+
+def schedule_from_set_value_list(set_value_list):
+    """Returns the set_value events (time_ms relative to the first event, value) of a raw set_value_list.
+
+    The initial zero (sent at MarkerManager init) is skipped, all other calls are replayed as they were made
+    (including repeated values).
+    """
+
+    entries = list(set_value_list)
+    if entries and entries[0]['value'] == 0:
+        entries = entries[1:]
+    if not entries:
+        return []
+
+    origin = entries[0]['time_ms']
+    return [(entry['time_ms'] - origin, int(entry['value'])) for entry in entries]
+
+
+def load_schedule(source):
+    """Returns the set_value events of a source: a marker dataframe, a set_value_list or a saved TSV file."""
+    if isinstance(source, pandas.DataFrame):
+        return schedule_from_marker_df(source)
+    if isinstance(source, str):
+        marker_df, _, _, _ = marker_io.read_marker_tsv(source)
+        return schedule_from_marker_df(marker_df)
+    return schedule_from_set_value_list(source)
+
+
+def _markers_from_events(times_ms, values):
+    """Returns the markers (value, start_ms, end_ms) defined by a sequence of set_value events.
+
+    Uses the same definition as MarkerManager.gen_marker_table (see marker_stats.MarkerStatistics.update): a
+    marker starts when the value changes to non-zero and ends at the next value change.
+    """
+
+    statistics = MarkerStatistics()
+    markers = []
+    for time_ms, value in zip(times_ms, values):
+        ended_marker = statistics.update(value, time_ms)
+        if ended_marker is not None:
+            markers.append((ended_marker[0], ended_marker[2], ended_marker[3]))
+    if statistics.running_marker is not None:
+        value, _, start_time_ms = statistics.running_marker
+        markers.append((value, start_time_ms, numpy.inf))
+    return markers
+
+
+def replay(marker_manager, schedule, lead_ms=100, spin_ms=DEFAULT_SPIN_MS):
+    """Replays set_value events on a MarkerManager with their relative timing.
+
+    Waiting sleeps until spin_ms before each event and busy-waits (on the time function of the MarkerManager)
+    for the rest. The achieved time of each event is the onset of its device write (the time of its post_write
+    tracepoint), so in deferral mode it is the time at which the deferred marker was sent.
+
+    Args:
+        marker_manager: MarkerManager to send the markers with
+        schedule: list of (time_ms, value) events, times relative to the start of the replay
+        lead_ms: time between the call and the first event
+        spin_ms: see DEFAULT_SPIN_MS
+
+    Returns: list of the achieved times (ms, relative to the start of the replay), nan for events that were not
+        written (e.g. a zero that was collapsed in deferral mode, or a marker that could not be sent)
+    """
+
+    time_function_ms = marker_manager._time_function_ms
+    writes = []
+
+    def record_write(name, timestamp_ns, value, time_ms, info):
+        writes.append((value, time_ms))
+
+    marker_manager.add_tracepoint('post_write', record_write)
+    try:
+        origin_ms = time_function_ms() + lead_ms
+        for event_ms, value in schedule:
+            target_ms = origin_ms + event_ms
+
+            remaining_ms = target_ms - time_function_ms()
+            if remaining_ms > spin_ms:
+                time.sleep((remaining_ms - spin_ms) / 1000)
+            while time_function_ms() < target_ms:
+                pass
+
+            marker_manager.set_value(value)
+
+        if marker_manager.defer_concurrent_markers:
+            marker_manager.flush_deferred_markers()
+    finally:
+        marker_manager.remove_tracepoint('post_write', record_write)
+
+    # The writes are in the order of the events, events that were not written are skipped:
+    achieved_ms = []
+    write_index = 0
+    for _, value in schedule:
+        if write_index < len(writes) and writes[write_index][0] == value:
+            achieved_ms.append(writes[write_index][1] - origin_ms)
+            write_index += 1
+        else:
+            achieved_ms.append(numpy.nan)
+    return achieved_ms
+
+
+def compare_markers(schedule, achieved_ms):
+    """Compares the intended and achieved markers of a replay.
+
+    Returns: dataframe with, per intended marker, the value, the intended and achieved onset and duration (ms)
+        and the onset and duration errors (achieved - intended, ms).
+    """
+
+    intended_times = [event_ms for event_ms, _ in schedule]
+    values = [value for _, value in schedule]
+    intended = _markers_from_events(intended_times, values)
+    achieved = _markers_from_events(achieved_ms, values)
+
+    comparison_df = pandas.DataFrame({
+        'value': [marker[0] for marker in intended],
+        'intended_onset_ms': [marker[1] for marker in intended],
+        'achieved_onset_ms': [marker[1] for marker in achieved],
+        'intended_duration_ms': [marker[2] - marker[1] for marker in intended],
+        'achieved_duration_ms': [marker[2] - marker[1] for marker in achieved]})
+    comparison_df['onset_error_ms'] = comparison_df['achieved_onset_ms'] - comparison_df['intended_onset_ms']
+    # Markers that have not ended have no duration error
+    with numpy.errstate(invalid='ignore'):
+        comparison_df['duration_error_ms'] = (comparison_df['achieved_duration_ms']
+                                              - comparison_df['intended_duration_ms'])
+    comparison_df.loc[~numpy.isfinite(comparison_df['intended_duration_ms']), 'duration_error_ms'] = numpy.nan
+    return comparison_df
+
+
+def timing_report(comparison_df):
+    """Returns the timing error statistics per marker value (count, mean, std, min, max, 95th percentile of the
+    absolute error) of the onsets and durations."""
+
+    rows = []
+    for value, group in comparison_df.groupby('value', sort=True):
+        row = {'value': value, 'count': len(group)}
+        for name in ('onset', 'duration'):
+            errors = group[f'{name}_error_ms'].dropna().to_numpy(dtype=numpy.float64)
+            if len(errors) == 0:
+                errors = numpy.array([numpy.nan])
+            row[f'{name}_error_mean_ms'] = float(numpy.mean(errors))
+            row[f'{name}_error_std_ms'] = float(numpy.std(errors))
+            row[f'{name}_error_min_ms'] = float(numpy.min(errors))
+            row[f'{name}_error_max_ms'] = float(numpy.max(errors))
+            row[f'{name}_abs_error_p95_ms'] = float(numpy.percentile(numpy.abs(errors), 95))
+        rows.append(row)
+    return pandas.DataFrame(rows)
+
+
+def replay_session(marker_manager, source, lead_ms=100, spin_ms=DEFAULT_SPIN_MS):
+    """Replays a session and reports its timing fidelity.
+
+    Args:
+        marker_manager: MarkerManager to send the markers with
+        source: marker dataframe (see gen_marker_table), set_value_list or saved marker table TSV file
+        lead_ms: time between the call and the first marker
+        spin_ms: see DEFAULT_SPIN_MS
+
+    Returns: the comparison dataframe (see compare_markers) and the report dataframe (see timing_report)
+    """
+
+    schedule = load_schedule(source)
+    achieved_ms = replay(marker_manager, schedule, lead_ms, spin_ms)
+    comparison_df = compare_markers(schedule, achieved_ms)
+    return comparison_df, timing_report(comparison_df)
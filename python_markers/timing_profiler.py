@@ -0,0 +1,316 @@
+"""Host Timing Profiler
+
+Command-line tool for qualifying lab PCs before a study. It measures:
+    - the accuracy of GS_timing.delay and GS_timing.delayMicroseconds (actual minus requested duration)
+    - the call overhead of GS_timing.millis and GS_timing.micros
+    - the end-to-end cost of MarkerManager.set_value (fake device by default, or a real device)
+    - the throughput of a thread-safe MarkerManager (thread_safe=True) with 1 to 8 producer threads
+
+The measurements can run under a configurable background load (busy CPU or memory-thrashing processes).
+The percentiles are printed and the full report (host information, configuration, percentiles and
+histograms) can be saved as JSON, to archive with the qualification of each lab PC.
+
+Usage:
+    python -m python_markers.timing_profiler [options]
+
+    e.g.: python -m python_markers.timing_profiler --load 4 --output lab3_pc2.json
+
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import sys
+import threading
+import time
+
+import numpy
+
+import python_markers.GS_timing as timing
+import python_markers.marker_management as marker_management
+
+# Number of histogram bins in the report
+HISTOGRAM_BINS = 50
+
+# Load types for the background load processes
+LOAD_TYPES = ('cpu', 'memory')
+
+
+def summarize_samples(samples):
+    """Returns summary statistics (count, mean, std, min, percentiles and max) of a list of samples."""
+    samples = numpy.asarray(samples, dtype=numpy.float64)
+    if len(samples) == 0:
+        return {'n': 0}
+    percentiles = numpy.percentile(samples, [50, 90, 99, 99.9])
+    return {'n': int(len(samples)),
+            'mean': float(samples.mean()),
+            'std': float(samples.std()),
+            'min': float(samples.min()),
+            'p50': float(percentiles[0]),
+            'p90': float(percentiles[1]),
+            'p99': float(percentiles[2]),
+            'p99.9': float(percentiles[3]),
+            'max': float(samples.max())}
+
+
+def histogram(samples, bins=HISTOGRAM_BINS):
+    """Returns a histogram of the samples as a dict with bin edges and counts (JSON serializable)."""
+    counts, edges = numpy.histogram(numpy.asarray(samples, dtype=numpy.float64), bins=bins)
+    return {'edges': edges.tolist(), 'counts': counts.tolist()}
+
+
+def measure_delay(delay_ms, repetitions):
+    """Returns the errors (actual - requested, in us) of GS_timing.delay(delay_ms)."""
+    errors_us = numpy.empty(repetitions)
+    for i in range(repetitions):
+        start_us = timing.micros()
+        timing.delay(delay_ms)
+        errors_us[i] = timing.micros() - start_us - delay_ms * 1000
+    return errors_us
+
+
+def measure_delay_microseconds(delay_us, repetitions):
+    """Returns the errors (actual - requested, in us) of GS_timing.delayMicroseconds(delay_us)."""
+    errors_us = numpy.empty(repetitions)
+    for i in range(repetitions):
+        start_us = timing.micros()
+        timing.delayMicroseconds(delay_us)
+        errors_us[i] = timing.micros() - start_us - delay_us
+    return errors_us
+
+
+def measure_call_overhead(function, repetitions, batch=100):
+    """Returns the call overhead (in us) of function, measured per batch of calls."""
+    overhead_us = numpy.empty(repetitions)
+    calls = range(batch)
+    for i in range(repetitions):
+        start_ns = time.perf_counter_ns()
+        for _ in calls:
+            function()
+        overhead_us[i] = (time.perf_counter_ns() - start_ns) / batch / 1000
+    return overhead_us
+
+
+def measure_set_value(marker_manager, repetitions):
+    """Returns the duration (in us) of MarkerManager.set_value calls, alternating between value 1 and 0.
+
+    The concurrent marker threshold is disabled during the measurement, so the normal (error-free) path is measured.
+    """
+    threshold = marker_manager.concurrent_marker_threshold_ms
+    marker_manager.concurrent_marker_threshold_ms = 0
+    durations_us = numpy.empty(repetitions)
+    try:
+        for i in range(repetitions):
+            value = (i + 1) % 2
+            start_ns = time.perf_counter_ns()
+            marker_manager.set_value(value)
+            durations_us[i] = (time.perf_counter_ns() - start_ns) / 1000
+    finally:
+        marker_manager.concurrent_marker_threshold_ms = threshold
+        marker_manager.set_value(0)
+    return durations_us
+
+
+def _load_worker(load_type, stop_event):
+    """Generates background load until stop_event is set (runs in a separate process)."""
+    if load_type == 'memory':
+        # Touch a buffer larger than the caches
+        buffer = numpy.zeros(64 * 1024 * 1024 // 8)
+        while not stop_event.is_set():
+            buffer += 1.0
+    else:
+        x = 0
+        while not stop_event.is_set():
+            for _ in range(10000):
+                x += 1
+
+
+class BackgroundLoad:
+    """Context manager that runs n_processes load processes (see LOAD_TYPES)."""
+
+    def __init__(self, n_processes=0, load_type='cpu'):
+        if load_type not in LOAD_TYPES:
+            raise ValueError(f"load_type can only be {LOAD_TYPES}, got {load_type}")
+        self.n_processes = n_processes
+        self.load_type = load_type
+        self._processes = []
+        self._stop_event = None
+
+    def __enter__(self):
+        if self.n_processes:
+            self._stop_event = multiprocessing.Event()
+            self._processes = [multiprocessing.Process(target=_load_worker, args=(self.load_type, self._stop_event),
+                                                       daemon=True) for _ in range(self.n_processes)]
+            for process in self._processes:
+                process.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._stop_event is not None:
+            self._stop_event.set()
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+
+
+def measure_thread_throughput(n_threads, markers_per_thread, device_type=marker_management.FAKE_DEVICE,
+                              device_address=marker_management.FAKE_ADDRESS):
+    """Returns the throughput (markers per second) of a thread-safe MarkerManager with n_threads producer threads.
+
+    Every thread alternates between its own value and 0, so the markers are error-free in any interleaving (the
+    concurrent marker threshold is disabled).
+    """
+
+    marker_manager = marker_management.MarkerManager(device_type, device_address, crash_on_marker_errors=False,
+                                                     thread_safe=True)
+    marker_manager.concurrent_marker_threshold_ms = 0
+    start_barrier = threading.Barrier(n_threads + 1)
+
+    def producer(value):
+        start_barrier.wait()
+        for i in range(markers_per_thread):
+            marker_manager.set_value(value if i % 2 == 0 else 0)
+
+    threads = [threading.Thread(target=producer, args=(thread_index + 1,)) for thread_index in range(n_threads)]
+    try:
+        for thread in threads:
+            thread.start()
+        start_barrier.wait()
+        start_ns = time.perf_counter_ns()
+        for thread in threads:
+            thread.join()
+        duration_s = (time.perf_counter_ns() - start_ns) / 1e9
+    finally:
+        marker_manager.close()
+        marker_management.MarkerManager.marker_manager_instances.remove(marker_manager)
+
+    return n_threads * markers_per_thread / duration_s
+
+
+def host_info():
+    """Returns information about the host, to identify the lab PC in the report."""
+    return {'hostname': socket.gethostname(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python_version': platform.python_version(),
+            'library_version': marker_management.LIB_VERSION,
+            'date': datetime.datetime.now().isoformat(timespec='seconds')}
+
+
+def run_profile(repetitions=1000, delays_ms=(1, 5, 10), delays_us=(50, 100, 500), load_processes=0,
+                load_type='cpu', device_type=marker_management.FAKE_DEVICE, device_address=marker_management.FAKE_ADDRESS,
+                thread_counts=(1, 2, 4, 8)):
+    """Runs all measurements and returns the report.
+
+    Args:
+        repetitions: number of measurements per test (delay tests with delays of 10 ms or more use a tenth)
+        delays_ms: delays tested with GS_timing.delay
+        delays_us: delays tested with GS_timing.delayMicroseconds
+        load_processes: number of background load processes
+        load_type: type of background load (see LOAD_TYPES)
+        device_type, device_address: marker device used for the set_value measurement
+        thread_counts: numbers of producer threads for the thread-safe throughput measurement (fake device)
+
+    Returns: report dict with host information, the configuration, per test, the unit, the summary statistics
+        (see summarize_samples) and a histogram, and the thread-safe throughput (markers/s) per number of threads.
+    """
+
+    report = {'host': host_info(),
+              'config': {'repetitions': repetitions, 'delays_ms': list(delays_ms), 'delays_us': list(delays_us),
+                         'load_processes': load_processes, 'load_type': load_type, 'device_type': device_type,
+                         'thread_counts': list(thread_counts)},
+              'results': {},
+              'thread_throughput': {}}
+
+    def add_result(name, samples, description):
+        report['results'][name] = {'description': description, 'unit': 'us',
+                                   'summary': summarize_samples(samples), 'histogram': histogram(samples)}
+
+    marker_manager = marker_management.MarkerManager(device_type, device_address, crash_on_marker_errors=False)
+
+    try:
+        with BackgroundLoad(load_processes, load_type):
+            add_result('millis_overhead', measure_call_overhead(timing.millis, repetitions),
+                       'call overhead of GS_timing.millis')
+            add_result('micros_overhead', measure_call_overhead(timing.micros, repetitions),
+                       'call overhead of GS_timing.micros')
+            for delay_ms in delays_ms:
+                n = repetitions if delay_ms < 10 else max(repetitions // 10, 1)
+                add_result(f'delay_{delay_ms}ms', measure_delay(delay_ms, n),
+                           f'error (actual - requested) of GS_timing.delay({delay_ms})')
+            for delay_us in delays_us:
+                add_result(f'delayMicroseconds_{delay_us}us', measure_delay_microseconds(delay_us, repetitions),
+                           f'error (actual - requested) of GS_timing.delayMicroseconds({delay_us})')
+            add_result('set_value', measure_set_value(marker_manager, repetitions),
+                       f'duration of MarkerManager.set_value ({device_type})')
+            for n_threads in thread_counts:
+                report['thread_throughput'][str(n_threads)] = measure_thread_throughput(
+                    n_threads, max(repetitions // n_threads, 1))
+    finally:
+        marker_manager.close()
+        marker_management.MarkerManager.marker_manager_instances.remove(marker_manager)
+
+    return report
+
+
+def print_report(report):
+    """Prints the percentiles of the report as a table."""
+    from prettytable import PrettyTable
+
+    table = PrettyTable()
+    table.title = f"Timing profile of {report['host']['hostname']} (us)"
+    columns = ['n', 'mean', 'p50', 'p90', 'p99', 'p99.9', 'max']
+    table.field_names = ['test'] + columns
+    for name, result in report['results'].items():
+        table.add_row([name] + [round(result['summary'][column], 3) if column != 'n' else result['summary'][column]
+                                for column in columns])
+    print(table)
+
+    if report.get('thread_throughput'):
+        table = PrettyTable()
+        table.title = "Thread-safe set_value throughput"
+        table.field_names = ['threads', 'markers/s']
+        for n_threads, markers_per_s in report['thread_throughput'].items():
+            table.add_row([n_threads, round(markers_per_s)])
+        print(table)
+
+
+def main(argv=None):
+    """Command-line entry point (see module docstring)."""
+
+    parser = argparse.ArgumentParser(description="Measures the timing accuracy of this PC for sending markers.")
+    parser.add_argument('--repetitions', type=int, default=1000, help="measurements per test")
+    parser.add_argument('--delays-ms', type=int, nargs='+', default=[1, 5, 10], help="delays for GS_timing.delay")
+    parser.add_argument('--delays-us', type=int, nargs='+', default=[50, 100, 500],
+                        help="delays for GS_timing.delayMicroseconds")
+    parser.add_argument('--load', type=int, default=0, help="number of background load processes")
+    parser.add_argument('--load-type', choices=LOAD_TYPES, default='cpu', help="type of background load")
+    parser.add_argument('--device-type', default=marker_management.FAKE_DEVICE,
+                        help="marker device for the set_value test (default: fake device)")
+    parser.add_argument('--device-address', default=marker_management.FAKE_ADDRESS,
+                        help="address of the marker device (e.g. COM3)")
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="numbers of producer threads for the thread-safe throughput test")
+    parser.add_argument('--output', default='', help="file to save the JSON report in")
+    args = parser.parse_args(argv)
+
+    report = run_profile(args.repetitions, args.delays_ms, args.delays_us, args.load, args.load_type,
+                         args.device_type, args.device_address, args.threads)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as file_out:
+            json.dump(report, file_out, indent=2)
+        print(f"Report saved in {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""Tracepoints in the Marker Path
+
+Named tracepoints in MarkerManager.set_value and SerialDevice.send_command, to correlate marker timing with
+other profiling. Callbacks are registered per tracepoint (see MarkerManager.add_tracepoint). When no
+callback is registered the MarkerManager has no registry, and a tracepoint costs a single attribute check
+(`if self._tracepoints is not None`).
+
+Tracepoints:
+    pre_validate:   set_value is called, before the value is checked
+    pre_write:      the value is valid, just before it is written to the device
+    post_write:     the value was written to the device
+    error:          an error was recorded (info: (Eid, message), the message is None in a critical section)
+    command_start:  send_command is called (info: the command)
+    command_end:    send_command returns (info: the reply)
+
+A callback is called as callback(name, timestamp_ns, value, time_ms, info), with timestamp_ns from
+time.perf_counter_ns, and the marker value and marker time (None for commands). Callbacks run in the marker
+path, so they should be short; the built-in adapters write to a trace file (TraceFileWriter) or count
+(TraceCounters).
+
+Example:
+    counters = TraceCounters()
+    marker_manager.add_tracepoint('post_write', counters)
+    marker_manager.add_tracepoint('error', counters)
+    ...
+    print(counters.counts)
+
+"""
+
+import time
+
+# Names of the tracepoints
+TRACEPOINTS = ('pre_validate', 'pre_write', 'post_write', 'error', 'command_start', 'command_end')
+
+
+class TracepointError(Exception):
+    """Exception raised for errors in registering tracepoint callbacks.
+
+    Attributes:
+        message:
+            explanation of the error
+        id:
+            error ID
+    """
+
+    def __init__(self, message, Eid):
+        self.message = message
+        self.id = Eid
+        super().__init__(self.message)
+
+
+class TracepointRegistry:
+    """Callbacks per tracepoint.
+
+    Attributes:
+        callbacks:
+            dict with tracepoint name as key and list of callbacks as value
+    """
+
+    def __init__(self):
+        self.callbacks = {name: [] for name in TRACEPOINTS}
+
+    def register(self, name, callback):
+        """Registers a callback for a tracepoint.
+
+        Raises:
+            TracepointError:
+                - UnknownTracepoint: name is not in TRACEPOINTS
+                - CallbackCallable: callback is not callable
+        """
+
+        if name not in self.callbacks:
+            err_msg = f"tracepoint can only be {TRACEPOINTS}, got {name}"
+            Eid = "UnknownTracepoint"
+            raise TracepointError(err_msg, Eid)
+
+        if not callable(callback):
+            err_msg = "callback should be callable."
+            Eid = "CallbackCallable"
+            raise TracepointError(err_msg, Eid)
+
+        self.callbacks[name].append(callback)
+
+    def unregister(self, name, callback):
+        """Removes a callback from a tracepoint (when it is registered)."""
+        if callback in self.callbacks.get(name, ()):
+            self.callbacks[name].remove(callback)
+
+    def is_empty(self):
+        """Returns whether no callbacks are registered."""
+        return not any(self.callbacks.values())
+
+    def fire(self, name, value=None, time_ms=None, info=None):
+        """Calls the callbacks of a tracepoint."""
+        callbacks = self.callbacks[name]
+        if callbacks:
+            timestamp_ns = time.perf_counter_ns()
+            for callback in callbacks:
+                callback(name, timestamp_ns, value, time_ms, info)
+
+
+class TraceFileWriter:
+    """Tracepoint callback that writes every event as a tab-separated line to a trace file.
+
+    The columns are timestamp_ns, tracepoint, value, time_ms and info (empty when None).
+
+    Attributes:
+        file_name:
+            path of the trace file
+    """
+
+    def __init__(self, file_name):
+        """Opens the trace file (it is overwritten) and writes the column names."""
+        self.file_name = file_name
+        self._file = open(file_name, 'w')
+        self._file.write('timestamp_ns\ttracepoint\tvalue\ttime_ms\tinfo\n')
+
+    def __call__(self, name, timestamp_ns, value, time_ms, info):
+        fields = (value, time_ms, info)
+        self._file.write(f'{timestamp_ns}\t{name}\t' + '\t'.join('' if field is None else str(field)
+                                                                 for field in fields) + '\n')
+
+    def close(self):
+        """Closes the trace file."""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class TraceCounters:
+    """Tracepoint callback that counts the events per tracepoint (and errors per error id).
+
+    Attributes:
+        counts:
+            dict with tracepoint name (or 'error.<Eid>') as key and number of events as value
+        last_timestamp_ns:
+            dict with tracepoint name as key and timestamp of its last event as value
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.last_timestamp_ns = {}
+
+    def __call__(self, name, timestamp_ns, value, time_ms, info):
+        self.counts[name] = self.counts.get(name, 0) + 1
+        self.last_timestamp_ns[name] = timestamp_ns
+        if name == 'error':
+            key = f'error.{info[0]}'
+            self.counts[key] = self.counts.get(key, 0) + 1
@@ -0,0 +1,217 @@
+"""Virtual Acquisition Recorder for the Fake Device
+
+A fake device (FAKE_DEVICE) drops the marker values. A VirtualRecorder attached to a fake device receives
+them instead, and reconstructs the marker channel that an acquisition system (e.g. Biopac or BioSemi)
+would have recorded: a continuous channel sampled at sample_rate_hz, in which every value appears after a
+latency (the transmission and acquisition delay) plus jitter. The channel is a numpy array, so whole
+pipelines (sending, recording, marker detection and epoching) can be verified and benchmarked offline.
+
+The latency model: a value written at time t arrives at t + latency_ms + jitter, where the jitter is drawn
+from a uniform distribution on [0, jitter_ms] or a normal distribution with standard deviation jitter_ms
+(truncated at -latency_ms). The values arrive in the order in which they were written, like on a serial
+line, and the channel takes the new value at the first sample at or after its arrival.
+
+Example:
+    marker_manager = MarkerManager(FAKE_DEVICE)
+    recorder = VirtualRecorder(sample_rate_hz=2000, latency_ms=1.5, jitter_ms=0.5).attach(marker_manager)
+    ...
+    channel = recorder.channel()
+    recorded_df = detect_markers(channel, recorder.sample_rate_hz, recorder.start_time_ms / 1000)
+
+"""
+
+import numpy
+import pandas
+
+import python_markers.marker_management as marker_management
+
+# Jitter distributions
+JITTER_DISTRIBUTIONS = ('uniform', 'normal')
+
+
+class VirtualRecorderError(Exception):
+    """Exception raised for errors in the virtual recorder.
+
+    Attributes:
+        message:
+            explanation of the error
+        id:
+            error ID
+    """
+
+    def __init__(self, message, Eid):
+        self.message = message
+        self.id = Eid
+        super().__init__(self.message)
+
+
+class VirtualRecorder:
+    """Reconstructs the marker channel of an acquisition system from the values written to a fake device.
+
+    Attributes:
+        sample_rate_hz:
+            sample rate of the reconstructed channel
+        latency_ms:
+            fixed delay between writing a value and its arrival in the recording
+        jitter_ms:
+            size of the random part of the delay (see module docstring)
+        jitter_distribution:
+            'uniform' or 'normal'
+        start_time_ms:
+            time of the first sample of the channel (the time of attaching, in the clock of the MarkerManager)
+        write_times_ms, arrival_times_ms, values:
+            lists with the write time, arrival time and value of every recorded write
+    """
+
+    def __init__(self, sample_rate_hz=2000, latency_ms=0.0, jitter_ms=0.0, jitter_distribution='uniform', seed=None):
+        """Initializes VirtualRecorder
+
+        Args:
+            sample_rate_hz: see Attributes
+            latency_ms: see Attributes
+            jitter_ms: see Attributes
+            jitter_distribution: see Attributes
+            seed: seed of the jitter random generator (None: random)
+
+        Raises:
+            VirtualRecorderError:
+                - SampleRate: sample_rate_hz is not positive
+                - JitterDistribution: unknown jitter distribution
+        """
+
+        if not sample_rate_hz > 0:
+            err_msg = f"sample_rate_hz should be positive, got {sample_rate_hz}"
+            Eid = "SampleRate"
+            raise VirtualRecorderError(err_msg, Eid)
+
+        if jitter_distribution not in JITTER_DISTRIBUTIONS:
+            err_msg = f"jitter_distribution can only be {JITTER_DISTRIBUTIONS}, got {jitter_distribution}"
+            Eid = "JitterDistribution"
+            raise VirtualRecorderError(err_msg, Eid)
+
+        self.sample_rate_hz = sample_rate_hz
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.jitter_distribution = jitter_distribution
+        self.start_time_ms = None
+        self.write_times_ms = []
+        self.arrival_times_ms = []
+        self.values = []
+
+        self._rng = numpy.random.default_rng(seed)
+        self._time_function_ms = None
+        self._device_interface = None
+
+    def attach(self, marker_manager):
+        """Starts recording the values written by a MarkerManager with a fake device, returns the recorder.
+
+        The channel starts at the current time with the current value of the MarkerManager.
+
+        Raises:
+            VirtualRecorderError:
+                - NotFakeDevice: the device of the MarkerManager is not a fake device
+                - RecorderAttached: the device already has a recorder
+        """
+
+        device_interface = marker_manager.device_interface
+        if not isinstance(device_interface, marker_management.SerialDevice) or not device_interface.is_fake:
+            err_msg = "A virtual recorder can only be attached to a fake device."
+            Eid = "NotFakeDevice"
+            raise VirtualRecorderError(err_msg, Eid)
+
+        if device_interface.recorder is not None:
+            err_msg = "The device already has a virtual recorder."
+            Eid = "RecorderAttached"
+            raise VirtualRecorderError(err_msg, Eid)
+
+        self._time_function_ms = marker_manager._time_function_ms
+        self.start_time_ms = self._time_function_ms()
+        self.write_times_ms.append(self.start_time_ms)
+        self.arrival_times_ms.append(self.start_time_ms)
+        self.values.append(marker_manager._current_value)
+
+        self._device_interface = device_interface
+        device_interface.recorder = self
+        return self
+
+    def detach(self):
+        """Stops recording."""
+        if self._device_interface is not None:
+            self._device_interface.recorder = None
+            self._device_interface = None
+
+    def record(self, value):
+        """Records a value written to the device (called by the fake device)."""
+
+        write_time_ms = self._time_function_ms()
+        if self.jitter_distribution == 'uniform':
+            jitter_ms = self._rng.uniform(0, self.jitter_ms) if self.jitter_ms > 0 else 0.0
+        else:
+            jitter_ms = max(self._rng.normal(0, self.jitter_ms), -self.latency_ms) if self.jitter_ms > 0 else 0.0
+
+        # Values arrive in order (a later write never overtakes an earlier one):
+        arrival_time_ms = max(write_time_ms + self.latency_ms + jitter_ms, self.arrival_times_ms[-1])
+
+        self.write_times_ms.append(write_time_ms)
+        self.arrival_times_ms.append(arrival_time_ms)
+        self.values.append(value)
+
+    def n_samples(self, end_time_ms=None):
+        """Returns the number of samples from the start up to end_time_ms (None: now)."""
+        if end_time_ms is None:
+            end_time_ms = self._time_function_ms()
+        return int((end_time_ms - self.start_time_ms) * self.sample_rate_hz / 1000) + 1
+
+    def sample_times_ms(self, n_samples=None):
+        """Returns the times (ms, MarkerManager clock) of the samples of the channel (n_samples None: up to now)."""
+        if n_samples is None:
+            n_samples = self.n_samples()
+        return self.start_time_ms + numpy.arange(n_samples) * (1000 / self.sample_rate_hz)
+
+    def channel(self, end_time_ms=None):
+        """Returns the recorded marker channel (uint8 numpy array) from the start up to end_time_ms (None: now).
+
+        Every sample has the last value that arrived at or before the sample time.
+        """
+
+        sample_times_ms = self.sample_times_ms(self.n_samples(end_time_ms))
+        arrival_times_ms = numpy.asarray(self.arrival_times_ms, dtype=numpy.float64)
+        positions = numpy.searchsorted(arrival_times_ms, sample_times_ms, side='right') - 1
+        return numpy.asarray(self.values, dtype=numpy.uint8)[positions]
+
+
+def detect_markers(channel, sample_rate_hz, start_time_s=0.0):
+    """Detects the markers in a recorded marker channel and returns them as a marker table.
+
+    A marker starts at a sample where the value changes to non-zero, and ends at the next value change (as in
+    MarkerManager.gen_marker_table).
+
+    Args:
+        channel: numpy array with the marker channel
+        sample_rate_hz: sample rate of the channel
+        start_time_s: time of the first sample
+
+    Returns: DataFrame with value, duration_ms, occurrence, start_time_s and end_time_s columns
+    """
+
+    channel = numpy.asarray(channel)
+    changes = numpy.flatnonzero(channel[1:] != channel[:-1]) + 1
+    change_times_s = start_time_s + changes / sample_rate_hz
+    starts = numpy.flatnonzero(channel[changes] != 0)
+    if len(channel) > 0 and channel[0] != 0:
+        # A marker that was on at the start of the channel starts at the first sample
+        changes = numpy.insert(changes, 0, 0)
+        change_times_s = numpy.insert(change_times_s, 0, start_time_s)
+        starts = numpy.insert(starts + 1, 0, 0)
+
+    values = channel[changes[starts]].astype(numpy.uint8)
+    start_times_s = change_times_s[starts]
+    end_times_s = numpy.append(change_times_s, numpy.inf)[starts + 1]
+
+    marker_df = pandas.DataFrame({'value': values,
+                                  'duration_ms': (end_times_s - start_times_s) * 1000,
+                                  'occurrence': numpy.zeros(len(values), dtype=numpy.int32),
+                                  'start_time_s': start_times_s,
+                                  'end_time_s': end_times_s})
+    marker_df['occurrence'] = (marker_df.groupby('value').cumcount() + 1).astype(numpy.int32)
+    return marker_df
@@ -13,5 +13,16 @@ setup(
         "pyserial",
         "pandas",
         "prettytable"
-    ]
+    ],
+    extras_require={
+        "parquet": ["pyarrow"]
+    },
+    entry_points={
+        "console_scripts": [
+            "marker-aggregate=python_markers.batch_aggregate:main",
+            "marker-timing-profile=python_markers.timing_profiler:main",
+            "marker-live-monitor=python_markers.live_feed:main",
+            "marker-server=python_markers.marker_server:main"
+        ]
+    }
 )
@@ -0,0 +1,8 @@
+def fake_clock(step_ms=100):
+    """Returns a time function that advances step_ms on every call."""
+    state = {"time_ms": 0}
+
+    def time_function_ms():
+        state["time_ms"] += step_ms
+        return state["time_ms"]
+    return time_function_ms
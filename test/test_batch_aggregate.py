@@ -0,0 +1,93 @@
+import unittest
+import os
+import tempfile
+import pandas
+import python_markers.batch_aggregate as batch_aggregate
+
+SESSION_TEMPLATE = """Date: 2026-01-0{day} 10:00:00\r
+Library version: 0.1.2\r
+Device: FAKE DEVICE\r
+Device serialno: 0000000\r
+Device version: 0000000\r
+\r
+#Summary#\r
+value\toccurrence\tmean_duration_ms\tmin_duration_ms\tmax_duration_ms\ttotal_duration_ms\r
+\r
+#Markers#\r
+value\tduration_ms\toccurrence\tstart_time_s\tend_time_s\r
+{markers}\r
+#Errors#\r
+error\ttime_s\r
+{errors}"""
+
+
+def write_session(location, name, day, markers, errors):
+    """Writes a session TSV file with markers [(value, duration_ms)] and a number of errors."""
+    marker_rows = ''
+    for i, (value, duration_ms) in enumerate(markers):
+        start_time_s = i * 10.0
+        marker_rows += f'{value}\t{duration_ms}\t1\t{start_time_s}\t{start_time_s + duration_ms / 1000}\r\n'
+    error_rows = ''.join(f'Marker error {i}\t{i}.5\r\n' for i in range(errors))
+    file_name = os.path.join(location, name)
+    with open(file_name, 'w', newline='') as file_out:
+        file_out.write(SESSION_TEMPLATE.format(day=day, markers=marker_rows, errors=error_rows))
+    return file_name
+
+
+class TestBatchAggregate(unittest.TestCase):
+    """
+    Testclass for testing batch_aggregate
+
+    """
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(lambda: [os.remove(os.path.join(self.location, fn)) for fn in os.listdir(self.location)])
+        write_session(self.location, 'a.tsv', 1, [(10, 100.0), (20, 50.0), (10, 300.0)], errors=1)
+        write_session(self.location, 'b.tsv', 2, [(10, 200.0), (30, float('inf'))], errors=0)
+        with open(os.path.join(self.location, 'broken.tsv'), 'w') as file_out:
+            file_out.write("#Markers#\nvalue\tduration_ms\tstart_time_s\nnot a number\t1\t1\n")
+
+    def test_aggregate(self):
+        """
+        Tests if the pooled statistics are identical with and without a process pool.
+
+        """
+        session_files = batch_aggregate.find_sessions([self.location])
+        self.assertEqual(len(session_files), 3)
+
+        for workers in [1, 2]:
+            aggregate = batch_aggregate.aggregate_sessions(session_files, workers=workers)
+            summary_df = aggregate.summary_df().set_index('value')
+
+            self.assertEqual(summary_df.at[10, 'n_sessions'], 2)
+            self.assertEqual(summary_df.at[10, 'count'], 3)
+            self.assertAlmostEqual(summary_df.at[10, 'mean_duration_ms'], 200.0)
+            self.assertAlmostEqual(summary_df.at[10, 'std_duration_ms'], 100.0)
+            self.assertEqual(summary_df.at[10, 'min_duration_ms'], 100.0)
+            self.assertEqual(summary_df.at[10, 'max_duration_ms'], 300.0)
+            self.assertAlmostEqual(summary_df.at[10, 'p50_duration_ms'], 200.0, delta=200.0 * 0.06)
+            # A marker that has not ended is counted, but has no duration
+            self.assertEqual(summary_df.at[30, 'count'], 1)
+            self.assertTrue(pandas.isna(summary_df.at[30, 'mean_duration_ms']))
+
+            index_df = aggregate.index_df().set_index('file')
+            self.assertEqual(index_df.at[os.path.join(self.location, 'a.tsv'), 'n_errors'], 1)
+            self.assertAlmostEqual(index_df.at[os.path.join(self.location, 'a.tsv'), 'error_rate'], 1 / 3)
+            self.assertTrue(index_df.at[os.path.join(self.location, 'broken.tsv'), 'status'].startswith('failed'))
+
+    def test_main(self):
+        summary_fn = os.path.join(self.location, 'summary.out')
+        index_fn = os.path.join(self.location, 'index.out')
+        exit_code = batch_aggregate.main([self.location, '--workers', '1', '--summary', summary_fn,
+                                          '--index', index_fn])
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(len(pandas.read_csv(summary_fn, sep='\t')), 3)
+        self.assertEqual(len(pandas.read_csv(index_fn, sep='\t')), 3)
+
+    def test_no_sessions(self):
+        self.assertEqual(batch_aggregate.main([os.path.join(self.location, 'nonexistent_dir_*')]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import unittest
+from unittest.mock import MagicMock
+import python_markers.marker_management as marker_management
+from python_markers.bit_channels import ChannelScheduler
+
+
+class ManualClock:
+    """Time function that only advances when told to."""
+
+    def __init__(self):
+        self.time_ms = 0.0
+
+    def __call__(self):
+        return self.time_ms
+
+
+class TestChannelScheduler(unittest.TestCase):
+    """
+    Testclass for testing ChannelScheduler
+
+    """
+
+    device_type = marker_management.FAKE_DEVICE
+
+    def setUp(self):
+        self.clock = ManualClock()
+        self.device = marker_management.MarkerManager(TestChannelScheduler.device_type, time_function_ms=self.clock)
+        self.scheduler = ChannelScheduler(self.device)
+        self.scheduler.add_channel('camera', 7)
+        self.scheduler.add_channel('stimulus', 6)
+        self.scheduler.add_channel('response', 0)
+        # Start well after the initial zero of the MarkerManager
+        self.clock.time_ms = 1000
+
+    def advance(self, time_ms):
+        self.clock.time_ms = 1000 + time_ms
+        return self.scheduler.poll()
+
+    def test_channel_checks(self):
+        """
+        Tests if the correct errors are raised for duplicate channels, bad bits and unknown channels.
+
+        """
+        with self.assertRaises(marker_management.MarkerError) as e:
+            self.scheduler.add_channel('camera', 3)
+        self.assertEqual(str(e.exception.id), "ChannelExists")
+
+        with self.assertRaises(marker_management.MarkerError) as e:
+            self.scheduler.add_channel('other', 7)
+        self.assertEqual(str(e.exception.id), "ChannelBitInUse")
+
+        with self.assertRaises(marker_management.MarkerError) as e:
+            self.scheduler.add_channel('other', 8)
+        self.assertEqual(str(e.exception.id), "BitTypeRange")
+
+        with self.assertRaises(marker_management.MarkerError) as e:
+            self.scheduler.pulse('nonexistent', 10)
+        self.assertEqual(str(e.exception.id), "UnknownChannel")
+
+    def test_independent_pulses(self):
+        """
+        Tests if overlapping pulses on different channels keep the other bits intact.
+
+        """
+        self.scheduler.pulse('camera', 50)
+        self.scheduler.pulse('stimulus', 100, delay_ms=20)
+
+        self.assertEqual(self.advance(0), 1)
+        self.assertEqual(self.device._current_value, 1)
+        self.assertEqual(self.advance(10), 0)
+        self.assertEqual(self.advance(20), 1)
+        self.assertEqual(self.device._current_value, 3)
+        self.assertEqual(self.advance(50), 1)
+        self.assertEqual(self.device._current_value, 2)
+        self.assertEqual(self.advance(120), 1)
+        self.assertEqual(self.device._current_value, 0)
+        self.assertEqual(self.scheduler.pending, 0)
+
+        edges = [(edge['channel'], edge['state'], edge['time_ms']) for edge in self.scheduler.edge_list]
+        self.assertEqual(edges, [('camera', 'on', 1000), ('stimulus', 'on', 1020), ('camera', 'off', 1050),
+                                 ('stimulus', 'off', 1120)])
+
+    def test_concurrent_changes_merged(self):
+        """
+        Tests if bit changes that are due at the same time result in a single write.
+
+        """
+        self.scheduler.pulse('camera', 30)
+        self.scheduler.pulse('response', 30)
+        self.scheduler.toggle('stimulus')
+
+        self.assertEqual(self.advance(0), 1)
+        self.assertEqual(self.device._current_value, 0b10000011)
+        self.assertEqual(self.advance(30), 1)
+        self.assertEqual(self.device._current_value, 0b00000010)
+
+        # Initial zero + two merged writes
+        self.assertEqual(len(self.device.set_value_list), 3)
+        self.assertEqual(len(self.scheduler.edge_list), 5)
+
+    def test_merge_window(self):
+        """
+        Tests if changes within the merge window are written together.
+
+        """
+        self.scheduler.merge_window_ms = 5
+        self.scheduler.pulse('camera', 20)
+        self.scheduler.pulse('stimulus', 20, delay_ms=3)
+
+        self.assertEqual(self.advance(0), 1)
+        self.assertEqual(self.device._current_value, 3)
+        self.assertEqual(self.advance(20), 1)
+        self.assertEqual(self.device._current_value, 0)
+
+    def test_late_poll(self):
+        """
+        Tests if both edges of a pulse are written when the poll is late, separated by the concurrent threshold.
+
+        """
+        self.scheduler.pulse('camera', 20)
+
+        self.assertEqual(self.advance(50), 1)
+        self.assertEqual(self.device._current_value, 1)
+        self.assertEqual(self.scheduler.pending, 1)
+        self.assertEqual(self.advance(55), 0)
+        self.assertEqual(self.advance(60), 1)
+        self.assertEqual(self.device._current_value, 0)
+
+        edges = [(edge['state'], edge['scheduled_time_ms'], edge['time_ms']) for edge in self.scheduler.edge_list]
+        self.assertEqual(edges, [('on', 1000, 1050), ('off', 1020, 1060)])
+        self.assertEqual(self.device.error_list, [])
+
+    def test_run_with_realtime_profile(self):
+        """
+        Tests if run applies the real-time profile and saves its report.
+
+        """
+        profile = MagicMock()
+        profile.__enter__.return_value = {'sched_fifo': {'requested': True, 'obtained': False}}
+        self.scheduler.set_state('camera', 'on')
+        self.assertEqual(self.scheduler.run(realtime_profile=profile), 1)
+        self.assertEqual(self.scheduler.realtime_report['sched_fifo']['obtained'], False)
+        profile.__exit__.assert_called_once()
+
+    def test_set_bit_bitwise(self):
+        """
+        Tests if set_bit keeps the other bits intact.
+
+        """
+        self.device.set_bit(0, 'on')
+        self.clock.time_ms = 1100
+        self.device.set_bit(7, 'on')
+        self.assertEqual(self.device._current_value, 129)
+        self.clock.time_ms = 1200
+        self.device.set_bit(0, 'off')
+        self.assertEqual(self.device._current_value, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+import numpy
+import pandas
+import python_markers.marker_management as marker_management
+from python_markers.clock_alignment import ClockAlignment
+
+
+class DriftingClocks:
+    """Monotonic clock (ms) and a wall clock (ns) that drifts relative to it."""
+
+    def __init__(self, epoch_ns=1_700_000_000_123_456_789, drift_ppm=50.0, read_ms=0.001):
+        self.time_ms = 1000.0
+        self.epoch_ns = epoch_ns
+        self.drift_ppm = drift_ppm
+        self.read_ms = read_ms
+
+    def monotonic_ms(self):
+        # Every read takes a little time
+        self.time_ms += self.read_ms
+        return self.time_ms
+
+    def wall_ns(self):
+        return self.epoch_ns + int(round(self.time_ms * (1 + self.drift_ppm * 1e-6) * 1e6))
+
+
+class TestClockAlignment(unittest.TestCase):
+    """
+    Testclass for testing ClockAlignment
+
+    """
+
+    def test_fit_drift(self):
+        """
+        Tests if the offset and drift are recovered with sub-microsecond accuracy.
+
+        """
+        clocks = DriftingClocks()
+        alignment = ClockAlignment(clocks.monotonic_ms, clocks.wall_ns)
+        for _ in range(10):
+            alignment.sample()
+            clocks.time_ms += 60_000
+
+        fit = alignment.fit()
+        self.assertAlmostEqual(fit['drift_ppm'], 50.0, places=2)
+        self.assertEqual(fit['n_samples'], 10)
+        self.assertLess(fit['rms_residual_ms'], 0.001)
+
+        query_ms = numpy.array([2000.0, 300_000.5])
+        expected_ns = clocks.epoch_ns + numpy.round(query_ms * (1 + 50e-6) * 1e6).astype(numpy.int64)
+        self.assertTrue(numpy.all(numpy.abs(alignment.to_wall_time_ns(query_ms) - expected_ns) < 1000))
+
+    def test_infinite_time(self):
+        """
+        Tests if infinite times (markers that have not ended) are converted to NaT.
+
+        """
+        clocks = DriftingClocks()
+        alignment = ClockAlignment(clocks.monotonic_ms, clocks.wall_ns)
+        timestamps = alignment.to_datetime([1000.0, float('inf')])
+        self.assertFalse(pandas.isna(timestamps[0]))
+        self.assertTrue(pandas.isna(timestamps[1]))
+        self.assertEqual(str(timestamps.tz), 'UTC')
+
+    def test_header_info(self):
+        clocks = DriftingClocks()
+        alignment = ClockAlignment(clocks.monotonic_ms, clocks.wall_ns)
+        alignment.sample()
+        header = alignment.header_info()
+        self.assertIn('Clock drift (ppm)', header)
+        self.assertIn('Clock fit rms residual (ms)', header)
+
+
+class TestMarkerManagerWallClock(unittest.TestCase):
+    """
+    Testclass for testing the wall-clock export of MarkerManager.gen_marker_table()
+
+    """
+
+    device_type = marker_management.FAKE_DEVICE
+
+    def test_time_reference_type(self):
+        device = marker_management.MarkerManager(TestMarkerManagerWallClock.device_type)
+        with self.assertRaises(marker_management.MarkerManagerError) as e:
+            device.gen_marker_table(time_reference='local')
+        self.assertEqual(str(e.exception.id), "TimeReference")
+
+    def test_periodic_sampling(self):
+        """
+        Tests if the clock is sampled after a marker when the sample interval has passed.
+
+        """
+        clocks = DriftingClocks()
+        device = marker_management.MarkerManager(TestMarkerManagerWallClock.device_type,
+                                                 time_function_ms=clocks.monotonic_ms, clock_sample_interval_s=1)
+        self.assertEqual(len(device.clock_alignment.sample_list), 1)
+        clocks.time_ms += 500
+        device.set_value(1)
+        self.assertEqual(len(device.clock_alignment.sample_list), 1)
+        clocks.time_ms += 1000
+        device.set_value(0)
+        self.assertEqual(len(device.clock_alignment.sample_list), 2)
+
+    def test_utc_columns(self):
+        device = marker_management.MarkerManager(TestMarkerManagerWallClock.device_type, crash_on_marker_errors=False)
+        device.set_value(10)
+        device.set_value(0)
+        device.set_value(20)
+        marker_df, _, error_df = device.gen_marker_table(time_reference='utc')
+
+        self.assertIn('start_time', marker_df.columns)
+        self.assertEqual(str(marker_df['start_time'].dt.tz), 'UTC')
+        self.assertTrue(pandas.isna(marker_df['end_time'].iloc[-1]))
+        delta_s = (marker_df['start_time'].iloc[1] - marker_df['start_time'].iloc[0]).total_seconds()
+        self.assertAlmostEqual(delta_s, marker_df['start_time_s'].iloc[1] - marker_df['start_time_s'].iloc[0],
+                               places=5)
+        self.assertIn('time', error_df.columns)
+
+
+if __name__ == '__main__':
+    unittest.main()
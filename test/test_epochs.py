@@ -0,0 +1,62 @@
+import unittest
+import math
+import numpy
+import pandas
+from python_markers.epochs import epoch_signal, marker_samples, EpochError
+
+
+class TestEpochSignal(unittest.TestCase):
+    """
+    Testclass for testing the epoching of signals
+
+    """
+
+    sample_rate_hz = 100
+
+    def setUp(self):
+        self.marker_df = pandas.DataFrame({'value': [1, 2, 1, 1],
+                                           'start_time_s': [1.1, 2.1, 3.1, 10.05],
+                                           'end_time_s': [1.2, 2.2, 3.2, math.inf],
+                                           'occurrence': [1, 1, 2, 3]})
+        # The signal is the sample index, it starts 0.1 s after the marker clock
+        self.signal = numpy.arange(1000, dtype=numpy.float64)
+
+    def test_marker_samples(self):
+        samples = marker_samples(self.marker_df, self.sample_rate_hz, signal_start_s=0.1)
+        self.assertEqual(samples.tolist(), [100, 200, 300, 995])
+
+    def test_epochs(self):
+        """
+        Tests if the epochs are cut around the selected markers, and epochs past the edge are rejected.
+
+        """
+        epochs = epoch_signal(self.signal, self.sample_rate_hz, self.marker_df, values=[1], tmin_s=-0.1,
+                              tmax_s=0.2, signal_start_s=0.1)
+        self.assertEqual(epochs.data.shape, (2, 31))
+        self.assertEqual(epochs.data[0, 0], 90)
+        self.assertEqual(epochs.data[1, 10], 300)
+        self.assertEqual(epochs.events['occurrence'].tolist(), [1, 2])
+        self.assertEqual(epochs.rejected['occurrence'].tolist(), [3])
+        self.assertAlmostEqual(epochs.times_s[10], 0)
+
+    def test_channels_and_baseline(self):
+        signal = numpy.stack([self.signal, 2 * self.signal], axis=1)
+        epochs = epoch_signal(signal, self.sample_rate_hz, self.marker_df, tmin_s=-0.1, tmax_s=0.1,
+                              signal_start_s=0.1, baseline=(None, 0))
+        self.assertEqual(epochs.data.shape, (3, 2, 21))
+        # The mean of samples -10 to 0 (-5 relative to the marker) is subtracted
+        numpy.testing.assert_allclose(epochs.data[:, 0, 10], 5)
+        numpy.testing.assert_allclose(epochs.data[:, 1, 10], 10)
+
+    def test_errors(self):
+        with self.assertRaises(EpochError) as e:
+            epoch_signal(self.signal, self.sample_rate_hz, self.marker_df, tmin_s=0.5, tmax_s=0.1)
+        self.assertEqual(str(e.exception.id), "EpochWindow")
+
+        with self.assertRaises(EpochError) as e:
+            epoch_signal(self.signal, self.sample_rate_hz, self.marker_df, baseline=(-1, 0))
+        self.assertEqual(str(e.exception.id), "BaselineWindow")
+
+
+if __name__ == '__main__':
+    unittest.main()
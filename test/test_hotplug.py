@@ -0,0 +1,133 @@
+import unittest
+import python_markers.marker_management as marker_management
+from python_markers.hotplug import DeviceWatcher
+from python_markers.tracepoints import TraceCounters
+from test.helpers import fake_clock
+
+
+class FlakyDevice(marker_management.DeviceInterface):
+    """Device interface of which the connection can be broken."""
+
+    def __init__(self, device_address):
+        self._device_address = device_address
+        self.connected = True
+        self.written = []
+
+    @property
+    def device_address(self):
+        return self._device_address
+
+    @property
+    def device_properties(self):
+        return {"Version": "1", "Serialno": "S01234", "Device": "UsbParMarker"}
+
+    def _set_value(self, value):
+        if not self.connected:
+            raise OSError("device disconnected")
+        self.written.append(value)
+
+    def _close(self):
+        pass
+
+
+class TestDeviceWatcher(unittest.TestCase):
+    """
+    Testclass for testing the hot-plug watcher
+
+    """
+
+    def setUp(self):
+        self.device = marker_management.MarkerManager(marker_management.FAKE_DEVICE, time_function_ms=fake_clock())
+        self.device.device_interface = FlakyDevice('COM7')
+        self.ports = ['COM7']
+        self.reopened = None
+
+        def open_device(device_type, serial_no):
+            if self.reopened is None:
+                raise OSError("device not found")
+            return self.reopened
+
+        # The background thread is idle, the tests call poll
+        self.watcher = DeviceWatcher(self.device, poll_interval_s=3600, list_ports=lambda: self.ports,
+                                     open_device=open_device).start()
+        self.addCleanup(self.watcher.stop)
+
+    def test_reconnect_after_write_failure(self):
+        """
+        Tests if markers are buffered during an outage and the device is reopened on its new port.
+
+        """
+        original = self.device.device_interface._device
+        self.device.set_value(1)
+        original.connected = False
+        self.ports = []
+
+        # No errors are raised during the outage
+        self.device.set_value(0)
+        self.device.set_value(2)
+        self.assertTrue(self.watcher.in_outage)
+        self.assertFalse(self.watcher.poll())
+
+        self.reopened = FlakyDevice('COM9')
+        self.ports = ['COM9']
+        self.assertTrue(self.watcher.poll())
+
+        self.assertFalse(self.watcher.in_outage)
+        self.assertEqual(self.device.device_address, 'COM9')
+        # The device is set to the current value
+        self.assertEqual(self.reopened.written, [2])
+        outage = self.watcher.outage_list[0]
+        self.assertEqual([marker['value'] for marker in outage['buffered']], [0, 2])
+        self.assertEqual(outage['port'], 'COM7')
+        # The markers are logged with their original times
+        self.assertEqual([entry['value'] for entry in self.device.set_value_list], [0, 1, 0, 2])
+
+        self.device.set_value(3)
+        self.assertEqual(self.reopened.written, [2, 3])
+
+    def test_port_removed(self):
+        """
+        Tests if the removal of the port starts an outage before a marker is sent, and if a full buffer fails.
+
+        """
+        self.watcher.max_buffer = 1
+        self.assertTrue(self.watcher.poll())
+        self.ports = []
+        self.assertFalse(self.watcher.poll())
+        self.assertEqual(self.watcher.outage_list[0]['reason'], 'port removed')
+
+        self.device.set_value(5)
+        with self.assertRaises(marker_management.MarkerError) as e:
+            self.device.set_value(6)
+        self.assertEqual(str(e.exception.id), "CouldNotSendMarker")
+
+    def test_reopened_device_fails(self):
+        """
+        Tests if the outage continues when the reopened device fails, and the next poll reconnects.
+
+        """
+        counters = TraceCounters()
+        self.device.add_tracepoint('error', counters)
+        self.ports = []
+        self.assertFalse(self.watcher.poll())
+
+        self.reopened = FlakyDevice('COM9')
+        self.reopened.connected = False
+        self.assertFalse(self.watcher.poll())
+        self.assertTrue(self.watcher.in_outage)
+        self.assertEqual(self.device.device_address, 'COM7')
+
+        self.reopened.connected = True
+        self.assertTrue(self.watcher.poll())
+        self.assertEqual(self.device.device_address, 'COM9')
+        self.assertEqual(counters.counts['error.DeviceOutage'], 1)
+        self.assertEqual(counters.counts['error.DeviceReconnected'], 1)
+        self.assertEqual(len(self.device.error_list), 2)
+
+    def test_stop_restores_interface(self):
+        self.watcher.stop()
+        self.assertIsInstance(self.device.device_interface, FlakyDevice)
+
+
+if __name__ == '__main__':
+    unittest.main()
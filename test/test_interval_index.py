@@ -0,0 +1,57 @@
+import unittest
+import math
+import numpy
+import pandas
+from python_markers.interval_index import MarkerIntervalIndex
+
+
+class TestMarkerIntervalIndex(unittest.TestCase):
+    """
+    Testclass for testing the marker interval index
+
+    """
+
+    def setUp(self):
+        self.marker_df = pandas.DataFrame({'value': [1, 2, 1, 3, 1],
+                                           'start_time_s': [1.0, 2.0, 2.5, 5.0, 7.0],
+                                           'end_time_s': [1.5, 2.5, 3.0, 6.0, math.inf],
+                                           'duration_ms': [500, 500, 500, 1000, math.inf],
+                                           'occurrence': [1, 1, 2, 1, 3]})
+        self.index = MarkerIntervalIndex(self.marker_df)
+
+    def test_active_at(self):
+        self.assertEqual(self.index.active_at(1.2)['value'], 1)
+        # Adjacent markers: the second starts at the end of the first
+        self.assertEqual(self.index.active_at(2.5)['occurrence'], 2)
+        self.assertIsNone(self.index.active_at(0.5))
+        self.assertIsNone(self.index.active_at(4.0))
+        self.assertEqual(self.index.active_at(100)['occurrence'], 3)
+
+    def test_batch_lookup(self):
+        """
+        Tests if the vectorized lookup gives the same result as boolean filtering of the marker table.
+
+        """
+        times = numpy.linspace(0, 8, 161)
+        expected = []
+        for time_s in times:
+            rows = self.marker_df[(self.marker_df['start_time_s'] <= time_s) & (self.marker_df['end_time_s'] > time_s)]
+            expected.append(rows['value'].iloc[0] if len(rows) else 0)
+        self.assertEqual(self.index.values_at(times).tolist(), expected)
+
+    def test_in_window(self):
+        self.assertEqual(self.index.in_window(1.2, 2.6)['value'].tolist(), [1, 2, 1])
+        self.assertEqual(self.index.in_window(1.2, 2.6, value=1)['occurrence'].tolist(), [1, 2])
+        self.assertEqual(self.index.count_in_window(3.5, 4.5), 0)
+        self.assertEqual(self.index.count_in_window(0, 10, value=4), 0)
+        self.assertEqual(self.index.in_window(6.5, 8)['value'].tolist(), [1])
+
+    def test_nth_occurrence(self):
+        self.assertEqual(self.index.nth_occurrence(1, 3)['start_time_s'], 7.0)
+        self.assertIsNone(self.index.nth_occurrence(1, 4))
+        self.assertIsNone(self.index.nth_occurrence(9, 1))
+        self.assertEqual(self.index.occurrence_times(1).tolist(), [1.0, 2.5, 7.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
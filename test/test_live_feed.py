@@ -0,0 +1,156 @@
+import unittest
+import multiprocessing
+import sys
+import threading
+import python_markers.marker_management as marker_management
+from python_markers.live_feed import LiveFeed, LiveFeedReader, LiveFeedError
+from test.helpers import fake_clock
+
+
+def read_values(name, queue):
+    """Reads the marker values of a feed in another process."""
+    reader = LiveFeedReader(name, from_start=True)
+    queue.put([record['value'] for record in reader.read() if record['kind'] == 'marker'])
+    reader.close()
+
+
+def publish_records(feed, value, n_records, barrier):
+    """Publishes markers and errors with the same value (and increasing times) from a thread."""
+    barrier.wait()
+    for i in range(n_records):
+        if i % 2:
+            feed.publish_error(float(i), "MarkerSentTwice", value)
+        else:
+            feed.publish_marker(value, float(i))
+
+
+class TestLiveFeed(unittest.TestCase):
+    """
+    Testclass for testing the shared-memory live feed
+
+    """
+
+    def test_read_records(self):
+        """
+        Tests if a reader gets the published markers and errors in order, and only new records on the next read.
+
+        """
+        feed = LiveFeed(capacity=8)
+        try:
+            reader = LiveFeedReader(feed.name)
+            feed.publish_marker(5, 100.0)
+            feed.publish_error(105.0, "MarkerSentTwice", 5, "Marker with value 5 is sent twice in a row.")
+            feed.publish_marker(0, 200.0)
+
+            records = reader.read()
+            self.assertEqual([record['seq'] for record in records], [1, 2, 3])
+            self.assertEqual(records[0]['value'], 5)
+            self.assertEqual(records[1]['kind'], 'error')
+            self.assertEqual(records[1]['Eid'], "MarkerSentTwice")
+            self.assertEqual(records[1]['error'], "Marker with value 5 is sent twice in a row.")
+            self.assertEqual(reader.current_value, 0)
+            self.assertEqual(reader.read(), [])
+            reader.close()
+        finally:
+            feed.close()
+
+    def test_slow_reader_misses(self):
+        """
+        Tests if a reader that falls behind more than the capacity skips the overwritten records.
+
+        """
+        feed = LiveFeed(capacity=4)
+        try:
+            reader = LiveFeedReader(feed.name)
+            for i in range(10):
+                feed.publish_marker(i, i * 10.0)
+
+            records = reader.read()
+            self.assertEqual([record['value'] for record in records], [6, 7, 8, 9])
+            self.assertEqual(reader.missed_count, 6)
+            reader.close()
+        finally:
+            feed.close()
+
+    def test_concurrent_publishers(self):
+        """
+        Tests if records published from several threads at the same time each get their own slot.
+
+        """
+        n_threads, n_records = 4, 5000
+        feed = LiveFeed(capacity=n_threads * n_records)
+        switch_interval = sys.getswitchinterval()
+        # Switch threads as often as possible, so the publishers interleave:
+        sys.setswitchinterval(1e-6)
+        try:
+            reader = LiveFeedReader(feed.name)
+            barrier = threading.Barrier(n_threads)
+            threads = [threading.Thread(target=publish_records, args=(feed, thread_index, n_records, barrier))
+                       for thread_index in range(n_threads)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            records = reader.read()
+            self.assertEqual(feed.write_count, n_threads * n_records)
+            self.assertEqual(reader.missed_count, 0)
+            self.assertEqual([record['seq'] for record in records], list(range(1, n_threads * n_records + 1)))
+            for thread_index in range(n_threads):
+                self.assertEqual([record['time_ms'] for record in records if record['value'] == thread_index],
+                                 [float(i) for i in range(n_records)])
+            reader.close()
+        finally:
+            sys.setswitchinterval(switch_interval)
+            feed.close()
+
+    def test_feed_not_found(self):
+        with self.assertRaises(LiveFeedError) as e:
+            LiveFeedReader("python_markers_no_such_feed")
+        self.assertEqual(str(e.exception.id), "FeedNotFound")
+
+
+class TestMarkerManagerLiveFeed(unittest.TestCase):
+    """
+    Testclass for testing the live feed of the MarkerManager
+
+    """
+
+    device_type = marker_management.FAKE_DEVICE
+
+    def test_publish_from_manager(self):
+        """
+        Tests if the markers and errors of the manager are published and can be read in another process.
+
+        """
+        device = marker_management.MarkerManager(TestMarkerManagerLiveFeed.device_type, crash_on_marker_errors=False,
+                                                 time_function_ms=fake_clock())
+        feed = device.start_live_feed()
+        try:
+            device.set_value(3)
+            device.set_value(3)
+            device.set_value(0)
+
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=read_values, args=(feed.name, queue))
+            process.start()
+            values = queue.get(timeout=10)
+            process.join(timeout=10)
+            self.assertEqual(values, [3, 3, 0])
+
+            reader = LiveFeedReader(feed.name, from_start=True)
+            errors = [record for record in reader.read() if record['kind'] == 'error']
+            self.assertEqual([record['Eid'] for record in errors], ["MarkerSentTwice"])
+            reader.close()
+
+            with self.assertRaises(marker_management.MarkerManagerError) as e:
+                device.start_live_feed()
+            self.assertEqual(str(e.exception.id), "LiveFeedStarted")
+        finally:
+            device.close()
+
+        self.assertIsNone(device._live_feed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import io
+import python_markers.marker_management as marker_management
+from python_markers.live_view import LiveTableView
+from test.helpers import fake_clock
+
+
+class TestLiveTableView(unittest.TestCase):
+    """
+    Testclass for testing the live incremental console view
+
+    """
+
+    device_type = marker_management.FAKE_DEVICE
+
+    def test_incremental_refresh(self):
+        """
+        Tests if each refresh only prints the new markers and errors, and if the statistics match gen_marker_table.
+
+        """
+        device = marker_management.MarkerManager(TestLiveTableView.device_type, crash_on_marker_errors=False,
+                                                 time_function_ms=fake_clock())
+        output = io.StringIO()
+        view = LiveTableView(device, min_interval_s=0, file=output)
+
+        device.set_value(1)
+        device.set_value(0)
+        device.set_value(2)
+        self.assertEqual(view.refresh(), 4)
+        first = output.getvalue()
+        self.assertIn("Running: value 2", first)
+
+        device.set_value(2)
+        device.set_value(1)
+        device.set_value(0)
+        # Three log entries and one error
+        self.assertEqual(view.refresh(), 4)
+        second = output.getvalue()[len(first):]
+        # Only the new markers are printed
+        self.assertNotIn("value 2 (occurrence 1)", second)
+        self.assertIn("sent twice", second)
+        self.assertEqual(view.refresh(), 0)
+
+        marker_df, summary_df, error_df = device.gen_marker_table()
+        for row in summary_df.itertuples():
+            statistics = view.statistics.value_statistics[row.value]
+            self.assertEqual(statistics.occurrence, row.occurrence)
+            self.assertAlmostEqual(statistics.total, row.total_duration_ms)
+            self.assertAlmostEqual(statistics.min, row.min_duration_ms)
+            self.assertAlmostEqual(statistics.max, row.max_duration_ms)
+
+    def test_throttle(self):
+        device = marker_management.MarkerManager(TestLiveTableView.device_type, time_function_ms=fake_clock())
+        view = LiveTableView(device, min_interval_s=60, file=io.StringIO())
+        self.assertEqual(view.refresh(), 1)
+        device.set_value(5)
+        self.assertIsNone(view.refresh())
+        self.assertEqual(view.refresh(force=True), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,10 @@
 import unittest
+import sys
 import time
+import threading
 import python_markers.marker_management as marker_management
+from python_markers.tracepoints import TraceCounters
+from python_markers.virtual_recorder import VirtualRecorder, detect_markers
 import pandas
 from unittest.mock import patch, Mock, MagicMock
 
@@ -91,6 +95,16 @@ class TestMarkerManagerInitialisation(unittest.TestCase):
         device = marker_management.MarkerManager(TestMarkerManagerInitialisation.device_type)
         self.assertIsInstance(device, marker_management.MarkerManager)
 
+    def test_fast_start(self):
+        with patch("python_markers.marker_management.timing.delay") as mock_delay:
+            device = marker_management.MarkerManager(TestMarkerManagerInitialisation.device_type, fast_start=True)
+        mock_delay.assert_not_called()
+        self.assertEqual(device.set_value_list[0]['value'], 0)
+
+        with self.assertRaises(marker_management.MarkerManagerError) as e:
+            marker_management.MarkerManager(TestMarkerManagerInitialisation.device_type, fast_start="yes")
+        self.assertEqual(str(e.exception.id), "FastStartBoolean")
+
 class TestSetValue(unittest.TestCase):
     """
     Testclass for testing MarkerManager.set_value()
@@ -182,6 +196,278 @@ class TestSetValue(unittest.TestCase):
             device.set_value(0)
             time.sleep(1)
 
+
+class TestDeferral(unittest.TestCase):
+    """
+    Testclass for testing the deferral mode of MarkerManager.set_value()
+
+    """
+    device_type = marker_management.FAKE_DEVICE
+
+    def setUp(self):
+        self.device = marker_management.MarkerManager(TestDeferral.device_type, defer_concurrent_markers=True)
+
+    def tearDown(self):
+        self.device.close()
+
+    def test_concurrent_markers_deferred(self):
+        """
+        Tests if markers within the concurrent marker threshold are sent later instead of raising an error.
+
+        """
+        time.sleep(0.05)
+        self.device.set_value(100)
+        self.device.set_value(0)
+        self.device.set_value(150)
+        self.device.flush_deferred_markers()
+
+        entries = list(self.device.set_value_list)[1:]
+        self.assertEqual([entry['value'] for entry in entries], [100, 0, 150])
+        self.assertEqual(entries[0]['deferral_ms'], 0)
+        self.assertGreater(entries[1]['deferral_ms'], 0)
+        self.assertEqual(len(self.device.error_list), 0)
+        for previous, entry in zip(entries, entries[1:]):
+            self.assertGreaterEqual(entry['time_ms'] - previous['time_ms'],
+                                    self.device.concurrent_marker_threshold_ms)
+
+        marker_df, _, _ = self.device.gen_marker_table()
+        self.assertEqual(marker_df['value'].tolist(), [100, 150])
+        self.assertGreater(marker_df.at[1, 'deferral_ms'], 0)
+
+    def test_zero_resets_collapsed(self):
+        self.device.set_value(100)
+        self.device.set_value(0)
+        self.device.set_value(0)
+        self.device.set_value(0)
+        self.device.flush_deferred_markers()
+        self.assertEqual([entry['value'] for entry in self.device.set_value_list], [0, 100, 0])
+        self.assertEqual(self.device.deferral_collapsed_count, 2)
+
+    def test_backpressure(self):
+        """
+        Tests if set_value blocks when the queue is full, without losing markers.
+
+        """
+        self.device.max_deferred_markers = 2
+        values = [10, 20, 30, 40, 50, 60]
+        for value in values:
+            self.device.set_value(value)
+            self.assertLessEqual(len(self.device._deferred_markers), 2)
+        self.device.flush_deferred_markers()
+        self.assertEqual([entry['value'] for entry in self.device.set_value_list][1:], values)
+
+    def test_invalid_value(self):
+        with self.assertRaises(marker_management.MarkerError) as e:
+            self.device.set_value(256)
+        self.assertEqual(str(e.exception.id), "ValueOutOfRange")
+
+    def test_critical_section(self):
+        with self.assertRaises(marker_management.MarkerManagerError) as e:
+            with self.device.critical_section():
+                pass
+        self.assertEqual(str(e.exception.id), "CriticalSectionDeferral")
+
+
+class TestThreadSafe(unittest.TestCase):
+    """
+    Testclass for testing the thread-safe mode of MarkerManager.set_value()
+
+    """
+    device_type = marker_management.FAKE_DEVICE
+
+    def test_producer_threads(self):
+        """
+        Tests if markers of several threads are all logged in order of time, without sequence errors.
+
+        """
+        device = marker_management.MarkerManager(TestThreadSafe.device_type, thread_safe=True,
+                                                 crash_on_marker_errors=False)
+        device.concurrent_marker_threshold_ms = 0
+
+        def producer(value):
+            for i in range(200):
+                device.set_value(value if i % 2 == 0 else 0)
+
+        threads = [threading.Thread(target=producer, args=(value,)) for value in (1, 2, 3, 4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        marker_df, _, _ = device.gen_marker_table()
+        times = [entry['time_ms'] for entry in device.set_value_list]
+        self.assertEqual(len(times), 1 + 4 * 200)
+        self.assertEqual(times, sorted(times))
+        self.assertEqual(len(device.error_list), 0)
+        self.assertEqual(device.set_value_list[-1]['value'], device._current_value)
+
+    def test_send_order(self):
+        """
+        Tests if markers with the same time are logged in the order in which they were sent.
+
+        """
+        device = marker_management.MarkerManager(TestThreadSafe.device_type, thread_safe=True,
+                                                 time_function_ms=lambda: 1000, crash_on_marker_errors=False)
+        device.concurrent_marker_threshold_ms = 0
+        worker = threading.Thread(target=device.set_value, args=(5,))
+        worker.start()
+        worker.join()
+        device.set_value(0)
+        device.set_value(7)
+
+        self.assertEqual([entry['value'] for entry in device.set_value_list], [0, 5, 0, 7])
+        marker_df, _, _ = device.gen_marker_table()
+        self.assertEqual(marker_df['value'].tolist(), [5, 7])
+
+    def test_set_bit_threads(self):
+        """
+        Tests if set_bit calls of several threads keep each other's bits.
+
+        """
+        device = marker_management.MarkerManager(TestThreadSafe.device_type, thread_safe=True,
+                                                 crash_on_marker_errors=False)
+        device.concurrent_marker_threshold_ms = 0
+
+        def toggle(bit):
+            for i in range(200):
+                device.set_bit(bit, 'off' if i % 2 else 'on')
+            device.set_bit(bit, 'on')
+
+        switch_interval = sys.getswitchinterval()
+        # Switch threads as often as possible, so the read-modify-writes interleave:
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=toggle, args=(bit,)) for bit in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+        self.assertEqual(device._current_value, 255)
+        self.assertEqual(device.set_value_list[-1]['value'], 255)
+
+    def test_thread_safe_type(self):
+        with self.assertRaises(marker_management.MarkerManagerError) as e:
+            marker_management.MarkerManager(TestThreadSafe.device_type, thread_safe=1)
+        self.assertEqual(str(e.exception.id), "ThreadSafeBoolean")
+
+
+class TestPrecisionPulse(unittest.TestCase):
+    """
+    Testclass for testing the precision pulse mode
+
+    """
+
+    def setUp(self):
+        self.device = marker_management.MarkerManager(marker_management.FAKE_DEVICE, crash_on_marker_errors=False)
+
+    def test_pulse(self):
+        """
+        Tests if a pulse is logged as a marker of the achieved width, without concurrent marker errors.
+
+        """
+        width_us = self.device.send_precision_pulse(5, 300)
+        self.assertIsNotNone(self.device.write_overhead_us)
+        self.assertGreaterEqual(width_us, 300 - self.device.write_overhead_us)
+        self.assertLess(width_us, 2000)
+        self.assertEqual(self.device.error_list, [])
+        self.assertEqual(self.device._current_value, 0)
+
+        marker_df, _, _ = self.device.gen_marker_table()
+        self.assertEqual(marker_df['value'].tolist(), [5])
+        self.assertAlmostEqual(marker_df['duration_ms'][0], width_us / 1000)
+
+    def test_report(self):
+        """
+        Tests the pulse width report, compared with a 16 kHz virtual recording.
+
+        """
+        recorder = VirtualRecorder(sample_rate_hz=16000).attach(self.device)
+        for duration_us in (400, 800, 400, 800):
+            self.device.send_precision_pulse(3, duration_us)
+            time.sleep(0.02)
+        recorded_df = detect_markers(recorder.channel(), recorder.sample_rate_hz, recorder.start_time_ms / 1000)
+
+        report_df = self.device.pulse_width_report(recorded_df)
+        self.assertEqual(report_df['requested_us'].tolist(), [400, 800])
+        self.assertEqual(report_df['count'].tolist(), [2, 2])
+        self.assertIn('p99_us', report_df.columns)
+        # The recording quantizes the width to samples of 62.5 us
+        self.assertTrue((abs(report_df['recorded_mean_us'] - report_df['mean_us']) <= 62.5).all())
+
+        with self.assertRaises(marker_management.MarkerManagerError) as e:
+            self.device.pulse_width_report(recorded_df.head(3))
+        self.assertEqual(str(e.exception.id), "PulseRecording")
+
+    def test_calibration_is_not_recorded(self):
+        """
+        Tests if calibration writes do not reach a virtual recorder, and if both edges of a pulse fire tracepoints.
+
+        """
+        recorder = VirtualRecorder().attach(self.device)
+        self.device.calibrate_write_overhead(50)
+        self.assertEqual(recorder.values, [0])
+
+        counters = TraceCounters()
+        self.device.add_tracepoint('pre_write', counters)
+        self.device.add_tracepoint('post_write', counters)
+        self.device.send_precision_pulse(5, 300)
+        self.assertEqual(counters.counts, {'pre_write': 2, 'post_write': 2})
+        self.assertEqual(recorder.values, [0, 5, 0])
+
+    def test_release_error(self):
+        """
+        Tests if a release that could not be sent is logged as an error, and raised when marker errors crash.
+
+        """
+        device_interface = self.device.device_interface
+        write = device_interface._set_value
+
+        def write_onset_only(value):
+            if value == 0:
+                raise OSError("device disconnected")
+            write(value)
+
+        counters = TraceCounters()
+        self.device.add_tracepoint('error', counters)
+        with patch.object(device_interface, '_set_value', side_effect=write_onset_only):
+            self.assertIsNone(self.device.send_precision_pulse(5, 300))
+        self.assertEqual(counters.counts, {'error': 1, 'error.CouldNotSendMarker': 1})
+        self.assertEqual(len(self.device.error_list), 1)
+        self.assertEqual(self.device.pulse_list, [])
+        self.assertEqual([entry['value'] for entry in self.device.set_value_list], [0, 5, 0])
+
+        device = marker_management.MarkerManager(marker_management.FAKE_DEVICE)
+        with patch.object(device.device_interface, '_set_value', side_effect=write_onset_only):
+            with self.assertRaises(marker_management.MarkerError) as e:
+                device.send_precision_pulse(5, 300)
+        self.assertEqual(str(e.exception.id), "CouldNotSendMarker")
+        self.assertIn("device disconnected", device.error_list[0]['error'])
+        self.assertEqual(device._current_value, 5)
+        device.close()
+
+    def test_calibration_device(self):
+        self.device.device_interface = Mock(spec=marker_management.DeviceInterface)
+        with self.assertRaises(marker_management.MarkerManagerError) as e:
+            self.device.calibrate_write_overhead()
+        self.assertEqual(str(e.exception.id), "CalibrationDevice")
+        self.device.device_interface._set_value.assert_not_called()
+
+    def test_pulse_errors(self):
+        for value, duration_us, Eid in ((0, 500, "PulseValue"), (5, 0, "PulseDuration"), (5, '500', "PulseDuration")):
+            with self.assertRaises(marker_management.MarkerManagerError) as e:
+                self.device.send_precision_pulse(value, duration_us)
+            self.assertEqual(str(e.exception.id), Eid)
+
+        device = marker_management.MarkerManager(marker_management.FAKE_DEVICE, defer_concurrent_markers=True)
+        with self.assertRaises(marker_management.MarkerManagerError) as e:
+            device.send_precision_pulse(5, 500)
+        self.assertEqual(str(e.exception.id), "PulseDeferral")
+        device.close()
+
+
 class TestSetBits(unittest.TestCase):
     """
     Testclass for testing MarkerManager.set_bits()
@@ -340,6 +626,39 @@ class TestGenMarkerTable(unittest.TestCase):
         self.assertEqual(error_df.error[1], "Marker with value 200 was sent within 10 ms after previous marker with value 0")
         self.assertEqual(error_df.error[2], "Marker with value 200 is sent twice in a row.")
 
+    def test_column_types(self):
+        device = marker_management.MarkerManager(TestGenMarkerTable.device_type, crash_on_marker_errors=False)
+        device.set_value(100)
+        device.set_value(0)
+        marker_df, summary_df, _ = device.gen_marker_table()
+
+        self.assertEqual(marker_df['value'].dtype, 'uint8')
+        self.assertEqual(marker_df['occurrence'].dtype, 'int32')
+        self.assertEqual(marker_df['duration_ms'].dtype, 'float64')
+        self.assertEqual(marker_df['start_time_s'].dtype, 'float64')
+        self.assertEqual(summary_df['value'].dtype, 'uint8')
+        self.assertEqual(summary_df['occurrence'].dtype, 'int32')
+        self.assertEqual(summary_df['total_duration_ms'].dtype, 'float64')
+
+    def test_marker_arrays(self):
+        """
+        Tests if the structured arrays have the same typed columns and values as the marker tables.
+
+        """
+        device = marker_management.MarkerManager(TestGenMarkerTable.device_type, crash_on_marker_errors=False)
+        for value in [100, 0, 222, 100, 100]:
+            device.set_value(value)
+        marker_df, summary_df, error_df = device.gen_marker_table()
+        marker_array, summary_array, error_array = device.gen_marker_arrays()
+
+        self.assertEqual(marker_array.dtype.names, tuple(marker_df.columns))
+        self.assertEqual(marker_array['value'].dtype, 'uint8')
+        self.assertEqual(marker_array['value'].tolist(), marker_df['value'].tolist())
+        self.assertEqual(marker_array['end_time_s'].tolist(), marker_df['end_time_s'].tolist())
+        self.assertEqual(summary_array['occurrence'].tolist(), summary_df['occurrence'].tolist())
+        self.assertEqual(error_array['error'].tolist(), error_df['error'].tolist())
+
+
 class TestFindDevice(unittest.TestCase):
 
     def test_unsupported_device(self):
@@ -430,6 +749,58 @@ class TestSerialDevice(unittest.TestCase):
             device = marker_management.SerialDevice("104")
         self.assertEqual(str(e.exception.id), "NoSerialDeviceMade")
 
+    def test_fast_start(self):
+        """
+        Tests if a fast-start device fetches its properties on the first read instead of at construction.
+
+        """
+        with patch("python_markers.marker_management.SerialDevice.open_serial_device"):
+            with patch("python_markers.marker_management.SerialDevice.get_info") as mock_get_info:
+                mock_get_info.return_value = {"Version": "HW1:SW1.2", "Serialno": "S01234", "Device": "UsbParMarker"}
+                with patch("python_markers.marker_management.timing.delay") as mock_delay:
+                    device = marker_management.UsbParMarker("104", fast_start=True)
+                    mock_get_info.assert_not_called()
+                    mock_delay.assert_not_called()
+                self.assertEqual(device.device_properties["Serialno"], "S01234")
+                self.assertEqual(device.get_sw_version(), "1.2")
+                mock_get_info.assert_called_once()
+
+    def test_fetch_blocks_markers(self):
+        """
+        Tests if a marker that is sent during the command exchange of a deferred property fetch waits for it.
+
+        """
+        events = []
+        command_started = threading.Event()
+
+        def send_command(command):
+            events.append('command_start')
+            command_started.set()
+            time.sleep(0.05)
+            events.append('command_end')
+            return {"Version": "HW1:SW1.2", "Serialno": "S01234", "Device": "UsbParMarker"}
+
+        with patch("python_markers.marker_management.SerialDevice.open_serial_device"):
+            device = marker_management.SerialDevice("104", fast_start=True)
+        device.serial_device = MagicMock()
+        device.serial_device.write.side_effect = lambda data: events.append('write')
+        with patch("python_markers.marker_management.SerialDevice._send_command", side_effect=send_command):
+            fetch = threading.Thread(target=device.fetch_device_properties)
+            fetch.start()
+            command_started.wait()
+            device._set_value(5)
+            fetch.join()
+        self.assertEqual(events, ['command_start', 'command_end', 'write'])
+
+    def test_fast_start_serialno_missing(self):
+        with patch("python_markers.marker_management.SerialDevice.open_serial_device"):
+            with patch("python_markers.marker_management.SerialDevice.get_info") as mock_get_info:
+                mock_get_info.return_value = "not the correct format"
+                device = marker_management.SerialDevice("104", fast_start=True)
+                with self.assertRaises(marker_management.SerialError) as e:
+                    device.device_properties
+        self.assertEqual(str(e.exception.id), "NoSerialNo")
+
     def test_wrong_baudrate(self):
         with self.assertRaises(marker_management.SerialError) as e:
             mock_serial_device = MagicMock()
@@ -0,0 +1,238 @@
+import unittest
+import importlib.util
+import math
+import os
+import shutil
+import tempfile
+import pandas
+import python_markers.marker_management as marker_management
+import python_markers.marker_io as marker_io
+from test.helpers import fake_clock
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+def gen_session(**kwargs):
+    """Returns a MarkerManager (fake device) with a few markers and errors."""
+    device = marker_management.MarkerManager(marker_management.FAKE_DEVICE, crash_on_marker_errors=False,
+                                             time_function_ms=fake_clock(), **kwargs)
+    for value in [100, 0, 200, 0, 100, 100, 0, 3]:
+        device.set_value(value)
+    return device
+
+
+@unittest.skipUnless(HAS_PYARROW, "pyarrow is not installed")
+class TestParquet(unittest.TestCase):
+    """
+    Testclass for testing the Parquet export (MarkerManager.save_marker_table(file_format='parquet'))
+
+    """
+
+    def test_round_trip(self):
+        """
+        Tests if the tables and header are read back identical to the generated tables.
+
+        """
+        device = gen_session()
+        marker_df, summary_df, error_df = device.gen_marker_table()
+
+        with tempfile.TemporaryDirectory() as location:
+            device.save_marker_table('session', location=location, more_info={'participant': 12},
+                                     file_format='parquet')
+            for file_name in marker_io.parquet_file_names(os.path.join(location, 'session')).values():
+                self.assertTrue(os.path.exists(file_name))
+
+            read_marker_df, read_summary_df, read_error_df, header = marker_io.read_marker_parquet(
+                os.path.join(location, 'session'))
+
+        self.assertEqual(list(read_marker_df['value']), list(marker_df['value']))
+        self.assertEqual(list(read_marker_df['duration_ms']), list(marker_df['duration_ms']))
+        self.assertEqual(read_marker_df['value'].dtype, 'uint8')
+        self.assertEqual(read_marker_df['occurrence'].dtype, 'int32')
+        self.assertEqual(list(read_summary_df.index), list(summary_df.index))
+        self.assertEqual(list(read_error_df['error']), list(error_df['error']))
+        self.assertEqual(header['Device'], marker_management.FAKE_DEVICE)
+        self.assertEqual(header['participant'], '12')
+        self.assertIn('Clock drift (ppm)', header)
+
+    def test_projection(self):
+        """
+        Tests if only the requested tables and columns are read.
+
+        """
+        device = gen_session()
+        with tempfile.TemporaryDirectory() as location:
+            device.save_marker_table('session', location=location, file_format='parquet')
+            marker_df, summary_df, error_df, header = marker_io.read_marker_parquet(
+                os.path.join(location, 'session'), tables=('markers',),
+                columns={'markers': ['value', 'start_time_s']})
+
+        self.assertEqual(list(marker_df.columns), ['value', 'start_time_s'])
+        self.assertIsNone(summary_df)
+        self.assertIsNone(error_df)
+        self.assertEqual(header['Device'], marker_management.FAKE_DEVICE)
+
+    def test_unknown_table(self):
+        with self.assertRaises(marker_io.MarkerFileError) as e:
+            marker_io.read_marker_parquet('nonexistent', tables=('markers', 'other'))
+        self.assertEqual(str(e.exception.id), "UnknownTable")
+
+
+class TestReadMarkerTsv(unittest.TestCase):
+    """
+    Testclass for testing marker_io.read_marker_tsv()
+
+    """
+
+    def save_tsv(self, device, **kwargs):
+        """Saves the marker table of device as TSV and returns the file name."""
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        return device.save_marker_table('session', location=location, **kwargs)
+
+    def test_read_tables(self):
+        """
+        Tests if the tables and header are read with the correct values and types.
+
+        """
+        device = gen_session()
+        marker_df, summary_df, error_df = device.gen_marker_table()
+        file_name = self.save_tsv(device, more_info={'participant': 12})
+
+        read_marker_df, read_summary_df, read_error_df, header = marker_io.read_marker_tsv(file_name)
+
+        self.assertEqual(list(read_marker_df.columns), list(marker_df.columns))
+        self.assertEqual(list(read_marker_df['value']), list(marker_df['value']))
+        self.assertEqual(list(read_marker_df['end_time_s']), list(marker_df['end_time_s']))
+        self.assertEqual(read_marker_df['end_time_s'].iloc[-1], float('inf'))
+        self.assertEqual(read_marker_df['value'].dtype, 'uint8')
+        self.assertEqual(read_marker_df['occurrence'].dtype, 'int32')
+        # The same types as the generated tables (and the Parquet files)
+        for df, read_df in [(marker_df, read_marker_df), (summary_df, read_summary_df)]:
+            self.assertEqual(read_df.dtypes.to_dict(), df.dtypes.to_dict())
+        self.assertEqual(list(read_summary_df['value']), list(summary_df['value']))
+        self.assertEqual(list(read_summary_df['total_duration_ms']), list(summary_df['total_duration_ms']))
+        self.assertEqual(list(read_error_df['error']), list(error_df['error']))
+        self.assertEqual(header['Device'], marker_management.FAKE_DEVICE)
+        self.assertEqual(header['participant'], '12')
+
+    def test_read_arrays(self):
+        device = gen_session()
+        file_name = self.save_tsv(device, time_reference='utc')
+
+        marker_arrays, _, error_arrays, _ = marker_io.read_marker_tsv(file_name, as_arrays=True)
+        self.assertEqual(marker_arrays['value'].dtype, 'uint8')
+        self.assertEqual(marker_arrays['start_time'].dtype.kind, 'M')
+        self.assertEqual(error_arrays['time_s'].dtype, 'float64')
+
+    def test_read_without_errors(self):
+        """
+        Tests if a file with an empty error section is read.
+
+        """
+        device = marker_management.MarkerManager(marker_management.FAKE_DEVICE, time_function_ms=fake_clock())
+        device.set_value(5)
+        device.set_value(0)
+        file_name = self.save_tsv(device)
+
+        marker_df, summary_df, error_df, _ = marker_io.read_marker_tsv(file_name)
+        self.assertEqual(len(marker_df), 1)
+        self.assertEqual(len(summary_df), 1)
+        self.assertEqual(len(error_df), 0)
+
+    def test_statistics_section(self):
+        """
+        Tests if the running statistics are saved in the statistics section and read back.
+
+        """
+        device = gen_session()
+        file_name = self.save_tsv(device)
+        # Markers after the save are not in the saved statistics
+        device.set_value(0)
+
+        marker_df, _, _, statistics_df, header = marker_io.read_marker_tsv(file_name, statistics=True)
+        self.assertEqual(statistics_df['value'].tolist(), [3, 100, 200])
+        self.assertEqual(statistics_df['occurrence'].dtype.kind, 'i')
+        self.assertEqual(statistics_df['n_ended'].dtype.kind, 'i')
+        self.assertEqual(header['Device'], marker_management.FAKE_DEVICE)
+        self.assertEqual(len(marker_df), 4)
+
+        _, summary_df, _ = device.gen_marker_table()
+        self.assertEqual(list(statistics_df['mean_duration_ms'][1:]),
+                         list(summary_df.sort_values('value')['mean_duration_ms'][1:]))
+        # The running marker has no durations yet
+        self.assertTrue(math.isnan(statistics_df['mean_duration_ms'][0]))
+        self.assertEqual(statistics_df['n_ended'].tolist(), [0, 2, 1])
+
+    def test_statistics_round_trip(self):
+        """
+        Tests if the saved statistics are read back identical to the running statistics at the time of the save.
+
+        """
+        device = gen_session()
+        device.set_value(0)
+        statistics_df = device.live_summary()
+        file_name = self.save_tsv(device)
+
+        *_, read_statistics_df, _ = marker_io.read_marker_tsv(file_name, statistics=True)
+        pandas.testing.assert_frame_equal(read_statistics_df, statistics_df, check_dtype=False)
+        _, _, _, statistics_arrays, _ = marker_io.read_marker_tsv(file_name, as_arrays=True, statistics=True)
+        self.assertEqual(list(statistics_arrays), list(statistics_df.columns))
+
+
+class TestSaveMarkerTableFormat(unittest.TestCase):
+
+    def test_file_format(self):
+        device = gen_session()
+        with self.assertRaises(marker_management.MarkerManagerError) as e:
+            device.save_marker_table('session', location=tempfile.gettempdir(), file_format='xlsx')
+        self.assertEqual(str(e.exception.id), "FileFormat")
+
+
+class TestSaveMarkerTableAsync(unittest.TestCase):
+    """
+    Testclass for testing MarkerManager.save_marker_table_async()
+
+    """
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location)
+
+    def test_async_equal_to_sync(self):
+        """
+        Tests if the asynchronous save writes the same tables as the synchronous save, from the log at the time of
+        the call, without leaving temporary files.
+
+        """
+        device = gen_session()
+        sync_file_name = device.save_marker_table('sync', location=self.location)
+        future = device.save_marker_table_async('async', location=self.location)
+        # Markers sent after the call are not in the file
+        device.set_value(0)
+        device.set_value(7)
+        async_file_name = future.result(timeout=30)
+
+        self.assertEqual(async_file_name, os.path.join(self.location, 'async.tsv'))
+        self.assertEqual(sorted(os.listdir(self.location)), ['async.tsv', 'sync.tsv'])
+        for sync_df, async_df in zip(marker_io.read_marker_tsv(sync_file_name)[:3],
+                                     marker_io.read_marker_tsv(async_file_name)[:3]):
+            self.assertTrue(sync_df.equals(async_df))
+        device.close()
+
+    def test_input_errors(self):
+        """
+        Tests if the input is checked on the calling thread, with the correct error ids.
+
+        """
+        device = gen_session()
+        for kwargs, Eid in [({'filename': 3}, "FilenameString"), ({'more_info': 'info'}, "MoreInfoDict"),
+                            ({'time_reference': 'local'}, "TimeReference"),
+                            ({'location': os.path.join(self.location, 'missing')}, "LocationWritePermission")]:
+            with self.assertRaises(marker_management.MarkerManagerError) as e:
+                device.save_marker_table_async(**dict({'location': self.location}, **kwargs))
+            self.assertEqual(str(e.exception.id), Eid)
+
+
+if __name__ == '__main__':
+    unittest.main()
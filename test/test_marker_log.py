@@ -0,0 +1,255 @@
+import unittest
+import gc
+import os
+import tempfile
+import threading
+import tracemalloc
+import python_markers.marker_management as marker_management
+import python_markers.marker_log as marker_log
+from python_markers.marker_log import SpillLog, PreallocatedLog
+from test.helpers import fake_clock
+
+
+class TestSpillLog(unittest.TestCase):
+    """
+    Testclass for testing SpillLog
+
+    """
+
+    def test_spill_to_segments(self):
+        """
+        Tests if the oldest entries are spilled to disk and the in-memory part stays bounded.
+
+        """
+        with tempfile.TemporaryDirectory() as location:
+            log = SpillLog(4, location, name='test')
+            for i in range(11):
+                log.append({'value': i, 'time_ms': i * 10.0})
+
+            log.flush()
+
+            self.assertEqual(len(log), 11)
+            self.assertEqual(len(log.segment_files), 2)
+            self.assertLessEqual(len(log._tail), 4)
+            self.assertTrue(all(os.path.exists(fn) for fn in log.segment_files))
+
+    def test_spill_in_background(self):
+        """
+        Tests if append does not wait for the segment writes, and if unwritten segments are read from memory.
+
+        """
+        entries = [{'value': i, 'time_ms': i * 10.0} for i in range(11)]
+        with tempfile.TemporaryDirectory() as location:
+            log = SpillLog(4, location, name='test')
+
+            # Block the writer thread while the segments are spilled:
+            release_writer = threading.Event()
+            marker_log._segment_writer().submit(release_writer.wait, 10)
+            try:
+                for entry in entries:
+                    log.append(entry)
+                self.assertEqual(len(log.segment_files), 2)
+                self.assertFalse(any(os.path.exists(fn) for fn in log.segment_files))
+                snapshot = log.snapshot()
+                self.assertEqual(list(log), entries)
+                self.assertEqual(log[1], entries[1])
+            finally:
+                release_writer.set()
+
+            log.flush()
+            self.assertTrue(all(os.path.exists(fn) for fn in log.segment_files))
+            self.assertEqual(log._unwritten, {})
+            self.assertEqual(list(snapshot), entries)
+            self.assertEqual(log[5], entries[5])
+
+    def test_shared_location(self):
+        """
+        Tests if two logs with the same location and name do not overwrite each other's segments.
+
+        """
+        with tempfile.TemporaryDirectory() as location:
+            logs = [SpillLog(2, location, name='set_value') for _ in range(2)]
+            for i in range(5):
+                for log_index, log in enumerate(logs):
+                    log.append({'value': log_index, 'time_ms': i * 10.0})
+
+            self.assertNotEqual(logs[0].location, logs[1].location)
+            for log_index, log in enumerate(logs):
+                self.assertEqual([entry['value'] for entry in log], [log_index] * 5)
+
+    def test_stitching(self):
+        """
+        Tests if iteration and indexing stitch the spilled segments and the in-memory tail together.
+
+        """
+        entries = [{'value': i, 'time_ms': i * 10.0} for i in range(11)]
+        log = SpillLog(3)
+        for entry in entries:
+            log.append(entry)
+
+        self.assertEqual(list(log), entries)
+        self.assertEqual(log[0], entries[0])
+        self.assertEqual(log[4], entries[4])
+        self.assertEqual(log[-1], entries[-1])
+        self.assertEqual(log[2:6], entries[2:6])
+        with self.assertRaises(IndexError):
+            log[11]
+
+    def test_capacity_type(self):
+        for capacity in [0, -1, 1.5, "3"]:
+            with self.assertRaises(ValueError):
+                SpillLog(capacity)
+
+    def test_snapshot(self):
+        """
+        Tests if a snapshot keeps the entries at the time it was taken while the log grows and spills.
+
+        """
+        entries = [{'value': i, 'time_ms': i * 10.0} for i in range(20)]
+        log = SpillLog(3)
+        for entry in entries[:7]:
+            log.append(entry)
+        snapshot = log.snapshot()
+        for entry in entries[7:]:
+            log.append(entry)
+
+        self.assertEqual(len(snapshot), 7)
+        self.assertEqual(list(snapshot), entries[:7])
+
+
+class TestBoundedMarkerManager(unittest.TestCase):
+    """
+    Testclass for testing MarkerManager with max_log_length
+
+    """
+
+    device_type = marker_management.FAKE_DEVICE
+
+    def test_max_log_length_type(self):
+        """
+        Tests if the correct error is raised when max_log_length is not None or a positive int.
+
+        """
+        for max_log_length in [0, 2.0, "100"]:
+            with self.assertRaises(marker_management.MarkerManagerError) as e:
+                device = marker_management.MarkerManager(TestBoundedMarkerManager.device_type,
+                                                         max_log_length=max_log_length)
+            self.assertEqual(str(e.exception.id), "MaxLogLength")
+
+    def test_marker_table_equal_to_unbounded(self):
+        """
+        Tests if the marker tables of a bounded manager are identical to those of an unbounded manager.
+
+        """
+        bounded = marker_management.MarkerManager(TestBoundedMarkerManager.device_type, crash_on_marker_errors=False,
+                                                  time_function_ms=fake_clock(), max_log_length=5)
+        unbounded = marker_management.MarkerManager(TestBoundedMarkerManager.device_type,
+                                                    crash_on_marker_errors=False, time_function_ms=fake_clock())
+
+        for device in [bounded, unbounded]:
+            for i in range(1, 30):
+                device.set_value(i % 7)
+                device.set_value(0)
+            # Value sent twice is logged in the error list
+            for i in range(8):
+                device.set_value(3)
+
+        self.assertGreater(len(bounded.set_value_list.segment_files), 0)
+        self.assertGreater(len(bounded.error_list.segment_files), 0)
+        self.assertEqual(list(bounded.set_value_list), unbounded.set_value_list)
+
+        for bounded_df, unbounded_df in zip(bounded.gen_marker_table(), unbounded.gen_marker_table()):
+            self.assertTrue(bounded_df.equals(unbounded_df))
+
+
+class TestCriticalSection(unittest.TestCase):
+    """
+    Testclass for testing MarkerManager.critical_section
+
+    """
+
+    device_type = marker_management.FAKE_DEVICE
+
+    def test_preallocated_log(self):
+        """
+        Tests if the preallocated log stores markers and errors until it is full.
+
+        """
+        log = PreallocatedLog(2)
+        self.assertTrue(log.add_marker(3, 10.0))
+        self.assertTrue(log.add_marker(0, 20.0))
+        self.assertFalse(log.add_marker(4, 30.0))
+        self.assertTrue(log.add_error('MarkerSentTwice', 3, 3, 15.0))
+        self.assertEqual(log.markers(), [{'value': 3, 'time_ms': 10.0}, {'value': 0, 'time_ms': 20.0}])
+        self.assertEqual(log.errors(), [(15.0, 'MarkerSentTwice', 3, 3)])
+        log.clear()
+        self.assertEqual(len(log), 0)
+
+    def test_logs_equal_to_normal_mode(self):
+        """
+        Tests if markers and errors logged in a critical section (including a flush of a full log) are identical
+        to those logged outside of it.
+
+        """
+        critical = marker_management.MarkerManager(TestCriticalSection.device_type, crash_on_marker_errors=False,
+                                                   time_function_ms=fake_clock(step_ms=4))
+        normal = marker_management.MarkerManager(TestCriticalSection.device_type, crash_on_marker_errors=False,
+                                                 time_function_ms=fake_clock(step_ms=4))
+
+        def send(device):
+            for i in range(1, 20):
+                device.set_value(i)
+                device.set_value(i)
+                device.set_value(0)
+
+        with critical.critical_section(capacity=8):
+            send(critical)
+        send(normal)
+
+        self.assertGreater(len(normal.error_list), 0)
+        self.assertEqual(critical.set_value_list, normal.set_value_list)
+        self.assertEqual(critical.error_list, normal.error_list)
+
+    def test_gc_restored(self):
+        """
+        Tests if the garbage collector is disabled in the critical section and restored on exit.
+
+        """
+        device = marker_management.MarkerManager(TestCriticalSection.device_type)
+        self.assertTrue(gc.isenabled())
+        with device.critical_section():
+            self.assertFalse(gc.isenabled())
+            self.assertGreater(gc.get_freeze_count(), 0)
+            self.assertEqual(len(device.set_value_list), 1)
+        self.assertTrue(gc.isenabled())
+        self.assertEqual(gc.get_freeze_count(), 0)
+
+        with self.assertRaises(marker_management.MarkerManagerError) as e:
+            with device.critical_section():
+                with device.critical_section():
+                    pass
+        self.assertEqual(str(e.exception.id), "NestedCriticalSection")
+        self.assertTrue(gc.isenabled())
+
+    def test_no_allocation(self):
+        """
+        Tests if set_value does not accumulate memory in a critical section.
+
+        """
+        device = marker_management.MarkerManager(TestCriticalSection.device_type, time_function_ms=fake_clock())
+        n = 2000
+
+        with device.critical_section(capacity=n + 10):
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            for i in range(n):
+                device.set_value(i % 2)
+            growth = tracemalloc.get_traced_memory()[0] - before
+            tracemalloc.stop()
+
+        self.assertLess(growth, 1024)
+        self.assertEqual(len(device.set_value_list), n + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
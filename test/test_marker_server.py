@@ -0,0 +1,163 @@
+import unittest
+import math
+import multiprocessing
+import sys
+import threading
+import python_markers.marker_management as marker_management
+from python_markers.marker_server import AttributedMarkerManager, MarkerServer, MarkerClient, LOCAL_CLIENT
+from test.helpers import fake_clock
+
+
+def send_markers(address, name, values):
+    """Sends markers from another process."""
+    with MarkerClient(address, name=name) as client:
+        for value in values:
+            client.set_value(value)
+            marker_management.timing.delay(15)
+
+
+class TestMarkerServer(unittest.TestCase):
+    """
+    Testclass for testing the marker server and clients
+
+    """
+
+    device_type = marker_management.FAKE_DEVICE
+
+    def test_client_processes(self):
+        """
+        Tests if the markers of several client processes are merged into one log with client attribution.
+
+        """
+        with MarkerServer(TestMarkerServer.device_type, crash_on_marker_errors=False) as server:
+            processes = [multiprocessing.Process(target=send_markers, args=(server.address, name, values))
+                         for name, values in [('eyetracker', [1, 0]), ('audio', [2, 0])]]
+            for process in processes:
+                process.start()
+                process.join(timeout=30)
+            server.set_value(3)
+
+            marker_df, summary_df, error_df = server.marker_manager.gen_marker_table()
+
+        self.assertEqual(marker_df['value'].tolist(), [1, 2, 3])
+        self.assertEqual(marker_df['client'].tolist(), ['eyetracker', 'audio', LOCAL_CLIENT])
+        self.assertEqual(sorted(server.client_names), ['audio', 'eyetracker'])
+        # The client time is taken before the marker is logged by the server
+        self.assertTrue((marker_df['latency_ms'] >= 0).all())
+        self.assertFalse(marker_df['client_time_s'].isna().any())
+
+    def test_client_errors(self):
+        """
+        Tests if fatal errors are raised in the client and non-fatal errors are attributed to the client.
+
+        """
+        with MarkerServer(TestMarkerServer.device_type, crash_on_marker_errors=False) as server:
+            with MarkerClient(server.address, name='stimulus') as client:
+                with self.assertRaises(marker_management.MarkerError) as e:
+                    client.set_value(256)
+                self.assertEqual(str(e.exception.id), "ValueOutOfRange")
+
+                marker_management.timing.delay(15)
+                client.set_value(4)
+                client.set_value(4)
+                # Fire-and-forget request
+                self.assertIsNone(client.set_value(0, wait=False))
+                client.set_value(5)
+
+            marker_df, summary_df, error_df = server.marker_manager.gen_marker_table()
+
+        self.assertEqual(marker_df['value'].tolist(), [4, 5])
+        self.assertEqual(error_df['client'].tolist(), ['stimulus'] * len(error_df))
+        self.assertTrue(math.isinf(marker_df['duration_ms'].iloc[-1]))
+
+    def test_attribution_in_log(self):
+        """
+        Tests if markers with the same time, and deferred markers, are attributed to the client that sent them.
+
+        """
+        device = AttributedMarkerManager(TestMarkerServer.device_type, time_function_ms=lambda: 1000,
+                                         crash_on_marker_errors=False)
+        device.concurrent_marker_threshold_ms = 0
+        device.set_value(1, 'eyetracker', 990)
+        device.set_value(2, 'audio', 995)
+        marker_df, _, _ = device.gen_marker_table()
+        self.assertEqual(marker_df['client'].tolist(), ['eyetracker', 'audio'])
+        self.assertEqual(marker_df['client_time_s'].tolist(), [0.99, 0.995])
+        device.close()
+
+        device = AttributedMarkerManager(TestMarkerServer.device_type, defer_concurrent_markers=True)
+        for value, client in [(1, 'eyetracker'), (2, 'audio'), (0, 'audio'), (3, 'stimulus')]:
+            device.set_value(value, client)
+        device.flush_deferred_markers()
+        marker_df, _, _ = device.gen_marker_table()
+        self.assertEqual(marker_df['value'].tolist(), [1, 2, 3])
+        self.assertEqual(marker_df['client'].tolist(), ['eyetracker', 'audio', 'stimulus'])
+        self.assertTrue((marker_df['deferral_ms'].iloc[1:] > 0).all())
+        device.close()
+
+        # A queued marker has no log time yet (not the time of the previous marker):
+        device = AttributedMarkerManager(TestMarkerServer.device_type, defer_concurrent_markers=True,
+                                         time_function_ms=fake_clock(step_ms=20))
+        self.assertEqual(device.set_value(1, 'eyetracker'), device.set_value_list[-1]['time_ms'])
+        device.concurrent_marker_threshold_ms = 1000
+        self.assertIsNone(device.set_value(2, 'audio'))
+        device.close()
+
+    def test_device_properties_at_start(self):
+        """
+        Tests if device properties that were not fetched yet (fast_start) are fetched at start, not when a client
+        connects.
+
+        """
+        server = MarkerServer(TestMarkerServer.device_type)
+        device_interface = server.marker_manager.device_interface
+        device_interface._device_properties = None
+        fetch_threads = []
+
+        def fetch_device_properties():
+            fetch_threads.append(threading.current_thread())
+            device_interface._device_properties = {"Version": "HW1:SW1.2", "Serialno": "S01234",
+                                                   "Device": "UsbParMarker"}
+
+        device_interface.fetch_device_properties = fetch_device_properties
+        with server:
+            self.assertEqual(fetch_threads, [threading.current_thread()])
+            with MarkerClient(server.address, name='audio') as client:
+                self.assertEqual(client.device_properties['Serialno'], "S01234")
+                client.set_value(1)
+        self.assertEqual(len(fetch_threads), 1)
+
+    def test_reply_log_time(self):
+        """
+        Tests if every client gets the log time of its own marker when several clients send at the same time.
+
+        """
+        n_clients, n_markers = 4, 50
+        switch_interval = sys.getswitchinterval()
+        # Switch threads as often as possible, so the clients interleave:
+        sys.setswitchinterval(1e-6)
+        try:
+            with MarkerServer(TestMarkerServer.device_type, time_function_ms=fake_clock(step_ms=20),
+                              crash_on_marker_errors=False) as server:
+                reply_times = {}
+
+                def send(name, value):
+                    with MarkerClient(server.address, name=name) as client:
+                        reply_times[name] = [client.set_value(value if i % 2 else 0) for i in range(n_markers)]
+
+                threads = [threading.Thread(target=send, args=(f'client{i}', i + 1)) for i in range(n_clients)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+                for name, times in reply_times.items():
+                    log_times = [entry['time_ms'] for entry in server.marker_manager.set_value_list
+                                 if entry.get('client') == name]
+                    self.assertEqual(times, log_times)
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+
+if __name__ == '__main__':
+    unittest.main()
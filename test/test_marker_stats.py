@@ -0,0 +1,96 @@
+import unittest
+import math
+import random
+import numpy
+import pandas
+import python_markers.marker_management as marker_management
+from python_markers.marker_stats import DurationSketch, MarkerStatistics
+from test.helpers import fake_clock
+
+
+class TestMarkerStatistics(unittest.TestCase):
+    """
+    Testclass for testing the streaming marker statistics
+
+    """
+
+    def test_sketch_accuracy(self):
+        """
+        Tests if the sketch quantiles are within the relative accuracy of the exact quantiles.
+
+        """
+        random.seed(3)
+        durations = [random.lognormvariate(4, 1) for _ in range(5000)]
+        sketch = DurationSketch(relative_accuracy=0.01)
+        for duration in durations:
+            sketch.add(duration)
+        for q in (0.1, 0.5, 0.9, 0.99):
+            exact = numpy.quantile(durations, q, method='lower')
+            self.assertLess(abs(sketch.quantile(q) - exact) / exact, 0.011)
+        self.assertTrue(math.isnan(DurationSketch().quantile(0.5)))
+
+    def test_quantile_in_range(self):
+        """
+        Tests if the quantiles are clamped to the range of the durations, and if adding an array is the same.
+
+        """
+        sketch = DurationSketch()
+        for duration in (20.29, 20.29, 20.3):
+            sketch.add(duration)
+        for q in (0, 0.5, 1):
+            self.assertTrue(20.29 <= sketch.quantile(q) <= 20.3)
+
+        array_sketch = DurationSketch()
+        array_sketch.add_array(numpy.array([20.29, 20.29, 20.3]))
+        self.assertEqual(array_sketch.quantile(0.5), sketch.quantile(0.5))
+
+    def test_from_marker_table(self):
+        """
+        Tests if the statistics of a marker table match the running statistics of the same markers.
+
+        """
+        updates = [(0, 0), (5, 10), (0, 20), (5, 40), (0, 70), (7, 80), (5, 90), (0, 110), (7, 120)]
+        statistics = MarkerStatistics()
+        for value, time_ms in updates:
+            statistics.update(value, time_ms)
+        table_statistics = MarkerStatistics.from_marker_table(numpy.array([5, 5, 7, 5, 7]),
+                                                              numpy.array([10, 30, 10, 20, numpy.inf]))
+        pandas.testing.assert_frame_equal(table_statistics.summary(), statistics.summary(), check_dtype=False)
+        self.assertEqual(statistics.running_marker, (7, 2, 120))
+
+    def test_running_statistics(self):
+        statistics = MarkerStatistics()
+        # value 5 lasts 10, 30 and 20 ms, value 7 is still running
+        for value, time_ms in [(0, 0), (5, 10), (0, 20), (5, 40), (5, 50), (0, 70), (5, 80), (7, 100)]:
+            statistics.update(value, time_ms)
+        summary = statistics.summary()
+        self.assertEqual(summary['value'].tolist(), [5, 7])
+        self.assertEqual(summary['occurrence'].tolist(), [3, 1])
+        self.assertEqual(summary['n_ended'].tolist(), [3, 0])
+        self.assertAlmostEqual(summary.at[0, 'mean_duration_ms'], 20)
+        self.assertAlmostEqual(summary.at[0, 'std_duration_ms'], numpy.std([10, 30, 20], ddof=1))
+        self.assertEqual(summary.at[0, 'total_duration_ms'], 60)
+        self.assertTrue(math.isnan(summary.at[1, 'mean_duration_ms']))
+
+    def test_live_summary(self):
+        """
+        Tests if live_summary matches the summary table of gen_marker_table, also with a critical section.
+
+        """
+        device = marker_management.MarkerManager(marker_management.FAKE_DEVICE, time_function_ms=fake_clock())
+        device.set_value(100)
+        device.set_value(0)
+        with device.critical_section(freeze_gc=False):
+            device.set_value(200)
+            device.set_value(100)
+        device.set_value(0)
+
+        _, summary_df, _ = device.gen_marker_table()
+        live_summary = device.live_summary()
+        self.assertEqual(live_summary['value'].tolist(), sorted(summary_df['value'].tolist()))
+        for value, total in zip(summary_df['value'], summary_df['total_duration_ms']):
+            self.assertEqual(live_summary.loc[live_summary['value'] == value, 'total_duration_ms'].iloc[0], total)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import os
+import sys
+from unittest.mock import patch, MagicMock
+import python_markers.realtime as realtime
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "real-time profile is only supported on Linux")
+class TestRealtimeProfile(unittest.TestCase):
+    """
+    Testclass for testing RealtimeProfile (Linux)
+
+    """
+
+    def test_affinity_applied_and_restored(self):
+        """
+        Tests if the thread is pinned to the requested CPU and unpinned afterwards.
+
+        """
+        original_cpus = os.sched_getaffinity(0)
+        cpu = min(original_cpus)
+        profile = realtime.RealtimeProfile(cpus={cpu}, fifo_priority=None, lock_memory=False, jitter_samples=0)
+
+        with profile as report:
+            self.assertTrue(report['cpu_affinity']['obtained'])
+            self.assertEqual(os.sched_getaffinity(0), {cpu})
+            self.assertFalse(report['sched_fifo']['requested'])
+        self.assertEqual(os.sched_getaffinity(0), original_cpus)
+
+    def test_sched_fifo_fallback(self):
+        """
+        Tests if SCHED_FIFO falls back cleanly when it is not permitted.
+
+        """
+        profile = realtime.RealtimeProfile(fifo_priority=10, lock_memory=False, jitter_samples=0)
+        with patch("python_markers.realtime.os.sched_setscheduler", side_effect=PermissionError("not permitted")):
+            report = profile.apply()
+        self.assertTrue(report['sched_fifo']['requested'])
+        self.assertFalse(report['sched_fifo']['obtained'])
+        self.assertIn('not permitted', report['sched_fifo']['reason'])
+        # Nothing to restore
+        profile.restore()
+
+    def test_memory_lock_fallback(self):
+        mock_libc = MagicMock()
+        mock_libc.mlockall.return_value = -1
+        with patch("python_markers.realtime.ctypes.CDLL", return_value=mock_libc):
+            report = realtime.RealtimeProfile(fifo_priority=None, jitter_samples=0).apply()
+        self.assertFalse(report['memory_locked']['obtained'])
+
+    def test_jitter_report(self):
+        profile = realtime.RealtimeProfile(fifo_priority=None, lock_memory=False, jitter_samples=20,
+                                           jitter_delay_us=100)
+        report = profile.apply()
+        profile.restore()
+        for key in ['jitter_before_us', 'jitter_after_us']:
+            self.assertEqual(report[key]['n'], 20)
+            self.assertGreaterEqual(report[key]['min'], 0)
+            self.assertLessEqual(report[key]['p50'], report[key]['max'])
+
+
+class TestRealtimeProfileArguments(unittest.TestCase):
+
+    def test_priority_range(self):
+        with self.assertRaises(ValueError):
+            realtime.RealtimeProfile(fifo_priority=100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import math
+import numpy
+import pandas
+import python_markers.marker_management as marker_management
+from python_markers import replay
+
+
+class TestReplay(unittest.TestCase):
+    """
+    Testclass for testing the marker replay engine
+
+    """
+
+    device_type = marker_management.FAKE_DEVICE
+
+    def test_schedule_from_marker_df(self):
+        """
+        Tests if the schedule of a marker table starts and ends every marker (without a zero between adjacent markers).
+
+        """
+        marker_df = pandas.DataFrame({'value': [1, 2, 3],
+                                      'start_time_s': [10.0, 10.1, 10.5],
+                                      'end_time_s': [10.1, 10.2, math.inf]})
+        schedule = replay.schedule_from_marker_df(marker_df)
+        self.assertEqual([value for _, value in schedule], [1, 2, 0, 3])
+        self.assertEqual([round(time_ms, 6) for time_ms, _ in schedule], [0, 100, 200, 500])
+
+    def test_schedule_from_set_value_list(self):
+        set_value_list = [{'value': 0, 'time_ms': 5.0}, {'value': 4, 'time_ms': 105.0},
+                          {'value': 4, 'time_ms': 125.0}, {'value': 0, 'time_ms': 205.0}]
+        self.assertEqual(replay.schedule_from_set_value_list(set_value_list), [(0, 4), (20, 4), (100, 0)])
+
+    def test_replay_session(self):
+        """
+        Tests if a recorded session is replayed with the markers and timing of the original.
+
+        """
+        original = marker_management.MarkerManager(TestReplay.device_type)
+        for value in [1, 2, 1]:
+            original.set_value(value)
+            marker_management.timing.delay(20)
+            original.set_value(0)
+            marker_management.timing.delay(30)
+
+        # A late marker (e.g. under load) should not stop the replay
+        target = marker_management.MarkerManager(TestReplay.device_type, crash_on_marker_errors=False)
+        comparison_df, report_df = replay.replay_session(target, original.set_value_list, lead_ms=20)
+
+        self.assertEqual(comparison_df['value'].tolist(), [1, 2, 1])
+        self.assertEqual(report_df['value'].tolist(), [1, 2])
+        self.assertEqual(report_df['count'].tolist(), [2, 1])
+        # The timing depends on the load of the machine, only the order of the markers is checked: every marker
+        # is replayed, after the previous one ended
+        achieved_onsets_ms = comparison_df['achieved_onset_ms'].to_numpy()
+        achieved_ends_ms = achieved_onsets_ms + comparison_df['achieved_duration_ms'].to_numpy()
+        self.assertTrue(numpy.isfinite(achieved_onsets_ms).all())
+        self.assertTrue((comparison_df['achieved_duration_ms'] > 0).all())
+        self.assertTrue((achieved_onsets_ms[1:] >= achieved_ends_ms[:-1]).all())
+
+        target_df, _, _ = target.gen_marker_table()
+        original_df, _, _ = original.gen_marker_table()
+        self.assertEqual(target_df['value'].tolist(), original_df['value'].tolist())
+
+    def test_replay_deferral_mode(self):
+        """
+        Tests if the achieved times in deferral mode are the times at which the deferred markers were sent.
+
+        """
+        target = marker_management.MarkerManager(TestReplay.device_type, defer_concurrent_markers=True)
+        # 2 is due 2 ms after 1, and is deferred until the concurrent marker threshold (10 ms) allows it
+        schedule = [(0, 1), (2, 2), (30, 0)]
+        achieved_ms = replay.replay(target, schedule, lead_ms=20)
+        target.close()
+
+        self.assertLess(abs(achieved_ms[0]), 5)
+        self.assertGreaterEqual(achieved_ms[1] - achieved_ms[0], target.concurrent_marker_threshold_ms)
+        self.assertEqual(target.set_value_list[2]['time_ms'] - target.set_value_list[1]['time_ms'],
+                         achieved_ms[1] - achieved_ms[0])
+        self.assertIsNone(target._tracepoints)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import json
+import os
+import tempfile
+import python_markers.timing_profiler as timing_profiler
+
+
+class TestTimingProfiler(unittest.TestCase):
+    """
+    Testclass for testing timing_profiler
+
+    """
+
+    def test_summarize_samples(self):
+        summary = timing_profiler.summarize_samples(range(1, 101))
+        self.assertEqual(summary['n'], 100)
+        self.assertEqual(summary['min'], 1)
+        self.assertEqual(summary['max'], 100)
+        self.assertAlmostEqual(summary['p50'], 50.5)
+        self.assertEqual(timing_profiler.summarize_samples([]), {'n': 0})
+
+    def test_delay_accuracy(self):
+        """
+        Tests if the delays are never shorter than requested.
+
+        """
+        errors_us = timing_profiler.measure_delay(1, 5)
+        self.assertTrue((errors_us >= 0).all())
+        errors_us = timing_profiler.measure_delay_microseconds(100, 20)
+        self.assertTrue((errors_us >= 0).all())
+
+    def test_run_profile_under_load(self):
+        report = timing_profiler.run_profile(repetitions=20, delays_ms=(1,), delays_us=(50,), load_processes=1)
+
+        self.assertEqual(set(report['results']), {'millis_overhead', 'micros_overhead', 'delay_1ms',
+                                                  'delayMicroseconds_50us', 'set_value'})
+        result = report['results']['set_value']
+        self.assertEqual(result['summary']['n'], 20)
+        self.assertEqual(sum(result['histogram']['counts']), 20)
+        self.assertEqual(report['config']['load_processes'], 1)
+
+    def test_main_saves_report(self):
+        with tempfile.TemporaryDirectory() as location:
+            output = os.path.join(location, 'report.json')
+            exit_code = timing_profiler.main(['--repetitions', '10', '--delays-ms', '1', '--delays-us', '50',
+                                              '--output', output])
+            self.assertEqual(exit_code, 0)
+            with open(output) as file_in:
+                report = json.load(file_in)
+        self.assertIn('hostname', report['host'])
+        self.assertIn('p99', report['results']['millis_overhead']['summary'])
+
+    def test_thread_throughput(self):
+        self.assertGreater(timing_profiler.measure_thread_throughput(4, 50), 0)
+        report = timing_profiler.run_profile(repetitions=10, delays_ms=(1,), delays_us=(50,), thread_counts=(1, 2))
+        self.assertEqual(set(report['thread_throughput']), {'1', '2'})
+
+    def test_load_type(self):
+        with self.assertRaises(ValueError):
+            timing_profiler.BackgroundLoad(1, 'disk')
+
+
+if __name__ == '__main__':
+    unittest.main()
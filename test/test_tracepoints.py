@@ -0,0 +1,83 @@
+import unittest
+import os
+import tempfile
+from unittest.mock import patch
+import python_markers.marker_management as marker_management
+from python_markers.tracepoints import TraceCounters, TraceFileWriter, TracepointError
+
+
+class TestTracepoints(unittest.TestCase):
+    """
+    Testclass for testing the tracepoints in the marker path
+
+    """
+
+    device_type = marker_management.FAKE_DEVICE
+
+    def setUp(self):
+        self.device = marker_management.MarkerManager(TestTracepoints.device_type, crash_on_marker_errors=False)
+
+    def test_marker_path(self):
+        """
+        Tests if the tracepoints fire in order, with timestamps, and if errors are counted per error id.
+
+        """
+        events = []
+        for name in ('pre_validate', 'pre_write', 'post_write', 'error'):
+            self.device.add_tracepoint(name, lambda *event: events.append(event))
+
+        self.device.set_value(5)
+        self.assertEqual([event[0] for event in events], ['pre_validate', 'pre_write', 'post_write'])
+        self.assertEqual({event[2] for event in events}, {5})
+        self.assertEqual(events[0][3], self.device.set_value_list[-1]['time_ms'])
+        self.assertLessEqual(events[0][1], events[2][1])
+
+        counters = TraceCounters()
+        self.device.add_tracepoint('error', counters)
+        self.device.set_value(5)
+        self.assertEqual(counters.counts, {'error': 1, 'error.MarkerSentTwice': 1})
+        self.assertEqual(events[-1][4][0], "MarkerSentTwice")
+
+    def test_remove_tracepoint(self):
+        counters = TraceCounters()
+        self.device.add_tracepoint('post_write', counters)
+        self.device.remove_tracepoint('post_write', counters)
+        self.assertIsNone(self.device._tracepoints)
+        self.device.set_value(5)
+        self.assertEqual(counters.counts, {})
+
+    def test_trace_file(self):
+        with tempfile.TemporaryDirectory() as location:
+            file_name = os.path.join(location, 'trace.tsv')
+            with TraceFileWriter(file_name) as writer:
+                self.device.add_tracepoint('post_write', writer)
+                self.device.set_value(7)
+            with open(file_name) as file_in:
+                lines = file_in.read().splitlines()
+        self.assertEqual(lines[0].split('\t'), ['timestamp_ns', 'tracepoint', 'value', 'time_ms', 'info'])
+        self.assertEqual(lines[1].split('\t')[1:3], ['post_write', '7'])
+
+    def test_command_tracepoints(self):
+        """
+        Tests if send_command fires the command tracepoints of a serial device.
+
+        """
+        counters = TraceCounters()
+        with patch("python_markers.marker_management.SerialDevice.open_serial_device"):
+            device = marker_management.SerialDevice("104", fast_start=True)
+        self.device.device_interface = device
+        self.device.add_tracepoint('command_start', counters)
+        self.device.add_tracepoint('command_end', counters)
+        with patch("python_markers.marker_management.SerialDevice._send_command", return_value='pong'):
+            self.assertEqual(device.ping(), 'pong')
+        self.assertEqual(counters.counts['command_start'], 1)
+        self.assertEqual(counters.counts['command_end'], 1)
+
+    def test_unknown_tracepoint(self):
+        with self.assertRaises(TracepointError) as e:
+            self.device.add_tracepoint('post_send', print)
+        self.assertEqual(str(e.exception.id), "UnknownTracepoint")
+
+
+if __name__ == '__main__':
+    unittest.main()
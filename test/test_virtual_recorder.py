@@ -0,0 +1,80 @@
+import unittest
+import numpy
+import python_markers.marker_management as marker_management
+from python_markers.virtual_recorder import VirtualRecorder, VirtualRecorderError, detect_markers
+from test.helpers import fake_clock
+
+
+class TestVirtualRecorder(unittest.TestCase):
+    """
+    Testclass for testing the virtual acquisition recorder
+
+    """
+
+    def setUp(self):
+        self.device = marker_management.MarkerManager(marker_management.FAKE_DEVICE, time_function_ms=fake_clock(),
+                                                      clock_sample_interval_s=3600)
+
+    def send(self, values):
+        for value in values:
+            self.device.set_value(value)
+
+    def test_channel(self):
+        """
+        Tests if the channel has the values at the right samples, delayed by the latency.
+
+        """
+        recorder = VirtualRecorder(sample_rate_hz=1000, latency_ms=2).attach(self.device)
+        self.send([5, 0, 7])
+        channel = recorder.channel()
+
+        self.assertEqual(channel.dtype, numpy.uint8)
+        # set_value and the recorder each read the fake clock once per marker
+        start_time_ms = recorder.start_time_ms
+        self.assertEqual([time_ms - start_time_ms for time_ms in recorder.write_times_ms], [0, 200, 400, 600])
+        self.assertEqual(len(channel), 701)
+        self.assertEqual(channel[201], 0)
+        self.assertEqual(channel[202], 5)
+        self.assertEqual(channel[401], 5)
+        self.assertEqual(channel[402], 0)
+        self.assertEqual(channel[-1], 7)
+
+    def test_detected_markers(self):
+        """
+        Tests if the markers detected in the channel match the marker table, within latency, jitter and sampling.
+
+        """
+        recorder = VirtualRecorder(sample_rate_hz=2000, latency_ms=1.5, jitter_ms=0.5, seed=1).attach(self.device)
+        self.send([5, 0, 7, 3, 0, 5, 0])
+        recorded_df = detect_markers(recorder.channel(), recorder.sample_rate_hz, recorder.start_time_ms / 1000)
+        marker_df, _, _ = self.device.gen_marker_table()
+
+        self.assertEqual(recorded_df['value'].tolist(), marker_df['value'].tolist())
+        self.assertEqual(recorded_df['occurrence'].tolist(), marker_df['occurrence'].tolist())
+        # The recorder reads the clock 100 ms after set_value (fake clock), plus the latency model
+        delays_ms = (recorded_df['start_time_s'] - marker_df['start_time_s']).to_numpy() * 1000 - 100
+        self.assertTrue(((delays_ms >= 1.5) & (delays_ms <= 2.5)).all())
+
+    def test_normal_jitter_keeps_order(self):
+        recorder = VirtualRecorder(latency_ms=1, jitter_ms=50, jitter_distribution='normal', seed=2)
+        recorder.attach(self.device)
+        self.send([1, 2, 3, 4, 5, 6])
+        self.assertEqual(recorder.arrival_times_ms, sorted(recorder.arrival_times_ms))
+
+    def test_attach_errors(self):
+        recorder = VirtualRecorder().attach(self.device)
+        with self.assertRaises(VirtualRecorderError) as e:
+            VirtualRecorder().attach(self.device)
+        self.assertEqual(str(e.exception.id), "RecorderAttached")
+
+        recorder.detach()
+        self.send([9])
+        self.assertEqual(recorder.values, [0])
+
+        with self.assertRaises(VirtualRecorderError) as e:
+            VirtualRecorder(jitter_distribution='pareto')
+        self.assertEqual(str(e.exception.id), "JitterDistribution")
+
+
+if __name__ == '__main__':
+    unittest.main()